@@ -0,0 +1,194 @@
+"""Access/refresh token issuing and revocation.
+
+Access tokens are short-lived and carry the user's entitlement claims
+(subscription tier, status, expiry and messaging flag), so permission checks
+can be evaluated from the token without loading the user document. Refresh
+tokens are long-lived, single-use and rotated on every refresh.
+
+Revoked token ids are persisted in the ``revoked_tokens`` collection (expired
+entries are removed by a TTL index) and mirrored in memory; each worker
+reloads the list periodically so checks on the request path stay in memory.
+"""
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import jwt
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+ACCESS_TOKEN_TYPE = "access"
+REFRESH_TOKEN_TYPE = "refresh"
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[int]:
+    return int((value - datetime(1970, 1, 1)).total_seconds()) if value else None
+
+
+class TokenRevocationList:
+    """Revoked token ids, persisted in MongoDB and cached per process"""
+
+    def __init__(self, collection, sync_interval_seconds: int):
+        self._collection = collection
+        self._sync_interval = sync_interval_seconds
+        self._revoked: Dict[str, datetime] = {}
+
+    async def revoke(self, jti: str, expires_at: datetime, user_id: Optional[str] = None):
+        self._revoked[jti] = expires_at
+        await self._collection.update_one(
+            {"jti": jti},
+            {"$setOnInsert": {
+                "jti": jti,
+                "user_id": user_id,
+                "expires_at": expires_at,
+                "revoked_at": datetime.utcnow()
+            }},
+            upsert=True
+        )
+
+    async def claim(self, jti: str, expires_at: datetime, user_id: Optional[str] = None) -> bool:
+        """Revoke a token id only if nobody did before; False if it was already revoked.
+
+        The insert races against the unique ``jti`` index, so of several
+        concurrent claims across workers exactly one succeeds.
+        """
+        if jti in self._revoked:
+            return False
+        try:
+            await self._collection.insert_one({
+                "jti": jti,
+                "user_id": user_id,
+                "expires_at": expires_at,
+                "revoked_at": datetime.utcnow()
+            })
+        except DuplicateKeyError:
+            self._revoked[jti] = expires_at
+            return False
+        self._revoked[jti] = expires_at
+        return True
+
+    def is_revoked(self, jti: str) -> bool:
+        """In-memory check used on every authenticated request"""
+        return jti in self._revoked
+
+    async def load(self):
+        now = datetime.utcnow()
+        revoked = {}
+        async for entry in self._collection.find({"expires_at": {"$gt": now}}, {"_id": 0, "jti": 1, "expires_at": 1}):
+            revoked[entry["jti"]] = entry["expires_at"]
+        self._revoked = revoked
+
+    async def run_sync(self):
+        """Background loop picking up revocations made by other workers"""
+        while True:
+            await asyncio.sleep(self._sync_interval)
+            try:
+                await self.load()
+            except Exception as e:
+                print(f"❌ Failed to reload revoked tokens: {e}")
+
+    def __len__(self):
+        return len(self._revoked)
+
+
+class TokenService:
+    """Issues and verifies access and refresh tokens"""
+
+    def __init__(self, secret: str, access_ttl: timedelta, refresh_ttl: timedelta, revocations: TokenRevocationList):
+        self._secret = secret
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.revocations = revocations
+
+    def _encode(self, payload: dict) -> str:
+        return jwt.encode(payload, self._secret, algorithm='HS256')
+
+    def create_access_token(self, user: dict) -> str:
+        now = datetime.utcnow()
+        return self._encode({
+            "user_id": user["id"],
+            "typ": ACCESS_TOKEN_TYPE,
+            "jti": uuid.uuid4().hex,
+            "iat": now,
+            "exp": now + self.access_ttl,
+            "tier": user.get("subscription_tier", "free"),
+            "sub_status": user.get("subscription_status", "inactive"),
+            "sub_expires": _timestamp(user.get("subscription_expires")),
+            "can_message": bool(user.get("can_message", False))
+        })
+
+    def create_refresh_token(self, user_id: str) -> str:
+        now = datetime.utcnow()
+        return self._encode({
+            "user_id": user_id,
+            "typ": REFRESH_TOKEN_TYPE,
+            "jti": uuid.uuid4().hex,
+            "iat": now,
+            "exp": now + self.refresh_ttl
+        })
+
+    def issue_tokens(self, user: dict) -> dict:
+        """Token fields returned by login, registration and refresh"""
+        return {
+            "token": self.create_access_token(user),
+            "refresh_token": self.create_refresh_token(user["id"]),
+            "token_type": "bearer",
+            "expires_in": int(self.access_ttl.total_seconds())
+        }
+
+    def decode(self, token: str, token_type: str = ACCESS_TOKEN_TYPE) -> dict:
+        """Verify a token and return its claims; raises 401 if it is invalid"""
+        try:
+            payload = jwt.decode(token, self._secret, algorithms=['HS256'])
+        except jwt.exceptions.ExpiredSignatureError:
+            raise HTTPException(status_code=401, detail="Token expired")
+        except jwt.exceptions.InvalidTokenError:
+            raise HTTPException(status_code=401, detail="Invalid token")
+
+        if payload.get('user_id') is None:
+            raise HTTPException(status_code=401, detail="Invalid token")
+        # Tokens issued before typed tokens carry no "typ" and count as access tokens
+        if payload.get("typ", ACCESS_TOKEN_TYPE) != token_type:
+            raise HTTPException(status_code=401, detail="Invalid token type")
+        if payload.get("jti") and self.revocations.is_revoked(payload["jti"]):
+            raise HTTPException(status_code=401, detail="Token revoked")
+        return payload
+
+    def seconds_left(self, claims: dict) -> float:
+        return (datetime.utcfromtimestamp(claims["exp"]) - datetime.utcnow()).total_seconds()
+
+    def ensure_active(self, claims: dict):
+        """Re-check decoded claims of a long-lived session; raises 401 once they expired or were revoked"""
+        if self.seconds_left(claims) <= 0:
+            raise HTTPException(status_code=401, detail="Token expired")
+        if claims.get("jti") and self.revocations.is_revoked(claims["jti"]):
+            raise HTTPException(status_code=401, detail="Token revoked")
+
+    async def revoke(self, claims: dict):
+        if claims.get("jti"):
+            expires_at = datetime.utcfromtimestamp(claims["exp"])
+            await self.revocations.revoke(claims["jti"], expires_at, claims.get("user_id"))
+
+    async def consume(self, claims: dict) -> bool:
+        """Revoke a single-use token; False if it was already used or revoked"""
+        if not claims.get("jti"):
+            return False
+        expires_at = datetime.utcfromtimestamp(claims["exp"])
+        return await self.revocations.claim(claims["jti"], expires_at, claims.get("user_id"))
+
+
+def has_entitlement_claims(claims: dict) -> bool:
+    return "tier" in claims
+
+
+def entitlements_from_claims(claims: dict) -> dict:
+    """Entitlement fields from token claims, shaped like the user document"""
+    sub_expires = claims.get("sub_expires")
+    return {
+        "id": claims["user_id"],
+        "subscription_tier": claims.get("tier", "free"),
+        "subscription_status": claims.get("sub_status", "inactive"),
+        "subscription_expires": datetime.utcfromtimestamp(sub_expires) if sub_expires else None,
+        "can_message": claims.get("can_message", False)
+    }
@@ -0,0 +1,223 @@
+"""In-process candidate index for profile browsing.
+
+Completed profiles are kept in NumPy column arrays (coordinates, age, Malawian
+flag, city and looking_for) so the browse predicates and haversine distances
+are evaluated for every candidate in one vectorized pass instead of a Python
+loop per profile. Rows are updated incrementally when a profile changes and
+the whole index is reloaded periodically so separate workers converge. A
+reload builds fresh arrays in a worker thread and swaps them in at once;
+changes made while it runs are replayed on top of the new arrays.
+"""
+import asyncio
+import math
+from typing import Callable, Iterable, List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    print("⚠️ NumPy not installed - in-memory candidate index disabled")
+    np = None
+
+NUMPY_AVAILABLE = np is not None
+EARTH_RADIUS_KM = 6371
+USER_ID_DTYPE = '<U64'
+LOAD_BATCH_SIZE = 1000
+COLUMNS = ("ids", "lat", "lon", "age", "malawian", "complete", "city", "looking_for")
+
+# Fields needed to build an index row
+CANDIDATE_FIELDS = {
+    "_id": 0,
+    "id": 1,
+    "age": 1,
+    "location": 1,
+    "geo": 1,
+    "phone_country": 1,
+    "looking_for": 1,
+    "profile_complete": 1
+}
+
+
+def _city_key(location: Optional[str]) -> str:
+    return location.split(',')[0].strip().lower() if location else ""
+
+
+class CandidateIndex:
+    """Columnar store of browsable profiles with vectorized candidate search"""
+
+    def __init__(self, is_malawian: Callable[[Optional[str], Optional[str]], bool], capacity: int = 1024):
+        self._is_malawian = is_malawian
+        self._rows = {}
+        self._size = 0
+        # Changes made while a reload is in progress: user id -> document, or None if removed
+        self._reload_changes: Optional[dict] = None
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        self.ids = np.empty(capacity, dtype=USER_ID_DTYPE)
+        self.lat = np.full(capacity, np.nan)
+        self.lon = np.full(capacity, np.nan)
+        self.age = np.full(capacity, -1, dtype=np.int16)
+        self.malawian = np.zeros(capacity, dtype=bool)
+        self.complete = np.zeros(capacity, dtype=bool)
+        self.city = np.empty(capacity, dtype=object)
+        self.looking_for = np.empty(capacity, dtype=object)
+
+    def _grow(self):
+        old = {name: getattr(self, name) for name in COLUMNS}
+        self._allocate(len(self.ids) * 2)
+        for name, values in old.items():
+            getattr(self, name)[:self._size] = values[:self._size]
+
+    def __len__(self):
+        return int(self.complete[:self._size].sum())
+
+    def upsert(self, user: dict):
+        """Insert or refresh the row for one user document"""
+        user_id = user.get("id")
+        if not user_id:
+            return
+        if self._reload_changes is not None:
+            self._reload_changes[user_id] = user
+
+        row = self._rows.get(user_id)
+        if row is None:
+            if self._size == len(self.ids):
+                self._grow()
+            row = self._size
+            self._rows[user_id] = row
+            self._size += 1
+            self.ids[row] = user_id
+
+        coordinates = (user.get("geo") or {}).get("coordinates")
+        if coordinates:
+            self.lon[row], self.lat[row] = coordinates[0], coordinates[1]
+        else:
+            self.lon[row] = self.lat[row] = np.nan
+
+        age = user.get("age")
+        self.age[row] = age if isinstance(age, int) else -1
+        self.malawian[row] = self._is_malawian(user.get("location"), user.get("phone_country", ""))
+        self.complete[row] = bool(user.get("profile_complete"))
+        self.city[row] = _city_key(user.get("location"))
+        self.looking_for[row] = (user.get("looking_for") or "").strip().lower()
+
+    def remove(self, user_id: str):
+        """Hide a user from all future searches"""
+        if self._reload_changes is not None:
+            self._reload_changes[user_id] = None
+        row = self._rows.get(user_id)
+        if row is not None:
+            self.complete[row] = False
+
+    def _build(self, users: List[dict]) -> "CandidateIndex":
+        """Index the given users into a separate instance; safe to run in a worker thread"""
+        fresh = CandidateIndex(self._is_malawian, capacity=max(len(users), 1024))
+        for user in users:
+            fresh.upsert(user)
+        return fresh
+
+    def _adopt(self, fresh: "CandidateIndex"):
+        # Plain attribute assignments with no await in between, so searches see old or new arrays, never a mix
+        for name in COLUMNS:
+            setattr(self, name, getattr(fresh, name))
+        self._rows = fresh._rows
+        self._size = fresh._size
+
+    def replace_all(self, users: Iterable[dict]):
+        """Rebuild the index from scratch"""
+        self._adopt(self._build(list(users)))
+
+    async def load(self, users_collection):
+        """Rebuild the index from every completed profile in MongoDB without blocking the event loop"""
+        if self._reload_changes is not None:
+            return
+        self._reload_changes = {}
+        try:
+            cursor = users_collection.find({"profile_complete": True}, CANDIDATE_FIELDS, batch_size=LOAD_BATCH_SIZE)
+            users = [user async for user in cursor]
+            fresh = await asyncio.get_running_loop().run_in_executor(None, self._build, users)
+            changes, self._reload_changes = self._reload_changes, None
+            self._adopt(fresh)
+            for user_id, user in changes.items():
+                if user is None:
+                    self.remove(user_id)
+                else:
+                    self.upsert(user)
+        finally:
+            self._reload_changes = None
+        print(f"✅ Candidate index loaded with {len(self)} profiles")
+
+    def _distances_km(self, lat: float, lon: float) -> "np.ndarray":
+        lat1, lon1 = math.radians(lat), math.radians(lon)
+        lat2 = np.radians(self.lat[:self._size])
+        lon2 = np.radians(self.lon[:self._size])
+        a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+    def search(
+        self,
+        viewer: dict,
+        exclude_ids: List[str],
+        radius_km: Optional[float],
+        limit: int,
+        after: Optional[dict] = None,
+        min_age: Optional[int] = None,
+        max_age: Optional[int] = None,
+        looking_for: Optional[str] = None
+    ) -> Tuple[List[str], List[Optional[float]], bool]:
+        """Return up to ``limit`` candidate ids with distances for a viewer.
+
+        ``radius_km`` of None selects VIP matching (Malawians worldwide, ordered
+        by id); otherwise candidates within the radius are ordered by
+        (distance, id), or matched by city when the viewer has no coordinates.
+        ``after`` is the decoded browse cursor. The last element of the result
+        reports whether results were ordered by distance.
+        """
+        size = self._size
+        ids = self.ids[:size]
+        mask = self.complete[:size] & ~np.isin(ids, exclude_ids)
+
+        if min_age is not None:
+            mask &= self.age[:size] >= min_age
+        if max_age is not None:
+            mask &= (self.age[:size] >= 0) & (self.age[:size] <= max_age)
+        if looking_for:
+            mask &= self.looking_for[:size] == looking_for.strip().lower()
+
+        coordinates = (viewer.get("geo") or {}).get("coordinates")
+        distances = self._distances_km(coordinates[1], coordinates[0]) if coordinates else np.full(size, np.nan)
+        sort_by_distance = False
+
+        if radius_km is None:
+            # VIP users can connect with all Malawians worldwide
+            if not self._is_malawian(viewer.get("location"), viewer.get("phone_country", "")):
+                return [], [], False
+            mask &= self.malawian[:size]
+        elif coordinates:
+            mask &= distances <= radius_km
+            sort_by_distance = True
+        elif viewer.get("location"):
+            # Fallback to simple text matching for same city/region
+            mask &= self.city[:size] == _city_key(viewer.get("location"))
+        else:
+            return [], [], False
+
+        if after and "id" in after:
+            # Compared against a fixed-width string array, so anything else cannot be a valid cursor
+            if not isinstance(after["id"], str):
+                raise ValueError("cursor id must be a string")
+            if sort_by_distance and "d" in after:
+                last_distance = float(after["d"])
+                mask &= (distances > last_distance) | ((distances == last_distance) & (ids > after["id"]))
+            else:
+                mask &= ids > after["id"]
+
+        rows = np.flatnonzero(mask)
+        if sort_by_distance:
+            order = np.lexsort((ids[rows], distances[rows]))
+        else:
+            order = np.argsort(ids[rows], kind="stable")
+        rows = rows[order[:limit]]
+
+        result_distances = [None if np.isnan(d) else float(d) for d in distances[rows]]
+        return ids[rows].tolist(), result_distances, sort_by_distance
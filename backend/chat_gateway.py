@@ -0,0 +1,72 @@
+"""Real-time chat delivery over WebSockets.
+
+The gateway tracks the open sockets of every connected user in this process
+and pushes chat events (new messages, read receipts, new matches) to them.
+Messages are always persisted before they are pushed, so a participant who is
+offline simply picks them up from the message history endpoint later.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, Iterable, Set
+
+from fastapi import WebSocket
+from fastapi.encoders import jsonable_encoder
+
+# Close code used when a socket fails authentication or its token expires or is revoked
+WS_CLOSE_UNAUTHORIZED = 4401
+
+
+class ChatConnectionManager:
+    """Registry of open chat sockets keyed by user id"""
+
+    def __init__(self):
+        self._connections: Dict[str, Set[WebSocket]] = defaultdict(set)
+
+    async def connect(self, user_id: str, websocket: WebSocket):
+        await websocket.accept()
+        self._connections[user_id].add(websocket)
+
+    def disconnect(self, user_id: str, websocket: WebSocket):
+        sockets = self._connections.get(user_id)
+        if sockets is None:
+            return
+        sockets.discard(websocket)
+        if not sockets:
+            del self._connections[user_id]
+
+    def is_connected(self, user_id: str) -> bool:
+        return bool(self._connections.get(user_id))
+
+    @property
+    def connection_count(self) -> int:
+        return sum(len(sockets) for sockets in self._connections.values())
+
+    async def send_to_user(self, user_id: str, event: dict) -> bool:
+        """Push an event to every socket of a user; returns False if none received it"""
+        sockets = list(self._connections.get(user_id, ()))
+        if not sockets:
+            return False
+
+        payload = jsonable_encoder(event)
+        results = await asyncio.gather(
+            *(websocket.send_json(payload) for websocket in sockets),
+            return_exceptions=True
+        )
+
+        delivered = False
+        for websocket, result in zip(sockets, results):
+            if isinstance(result, Exception):
+                # Socket died without a clean disconnect
+                self.disconnect(user_id, websocket)
+            else:
+                delivered = True
+        return delivered
+
+    async def send_to_users(self, user_ids: Iterable[str], event: dict) -> Dict[str, bool]:
+        """Push an event to several users; returns delivery status per user"""
+        user_ids = list(dict.fromkeys(user_ids))
+        results = await asyncio.gather(*(self.send_to_user(user_id, event) for user_id in user_ids))
+        return dict(zip(user_ids, results))
+
+
+chat_manager = ChatConnectionManager()
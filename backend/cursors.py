@@ -0,0 +1,97 @@
+"""Signed, opaque pagination cursors.
+
+A cursor is URL-safe base64 JSON followed by a truncated HMAC-SHA256 of that
+payload. Cursors carry state the server relies on (such as how many profiles
+of a limited deck were already served), so any cursor that was not issued by
+this server, or was modified, is rejected with 400.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import math
+from datetime import datetime
+
+from fastapi import HTTPException
+
+SIGNATURE_BYTES = 16
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text: str) -> bytes:
+    padded = text + '=' * (-len(text) % 4)
+    return base64.urlsafe_b64decode(padded.encode('ascii'))
+
+
+def invalid_cursor() -> HTTPException:
+    return HTTPException(status_code=400, detail="Invalid cursor")
+
+
+class CursorCodec:
+    """Encodes pagination state into signed cursors and verifies them"""
+
+    def __init__(self, secret: str):
+        # Derived key, so a cursor signature can never double as a token signature
+        self._key = hashlib.sha256(b"pagination-cursor:" + secret.encode('utf-8')).digest()
+
+    def _sign(self, payload: str) -> str:
+        digest = hmac.new(self._key, payload.encode('ascii'), hashlib.sha256).digest()
+        return _b64encode(digest[:SIGNATURE_BYTES])
+
+    def encode(self, state: dict) -> str:
+        """Encode pagination state as an opaque URL-safe cursor"""
+        payload = _b64encode(json.dumps(state, separators=(',', ':')).encode('utf-8'))
+        return f"{payload}.{self._sign(payload)}"
+
+    def decode(self, cursor: str) -> dict:
+        """Verify and decode a cursor produced by encode"""
+        payload, _, signature = cursor.partition('.')
+        try:
+            if not signature or not hmac.compare_digest(signature, self._sign(payload)):
+                raise invalid_cursor()
+            state = json.loads(_b64decode(payload))
+        except (TypeError, ValueError, binascii.Error):
+            raise invalid_cursor()
+
+        if not isinstance(state, dict):
+            raise invalid_cursor()
+        return state
+
+    def encode_time(self, timestamp: datetime, item_id: str) -> str:
+        """Cursor for lists ordered by (timestamp, id)"""
+        return self.encode({"t": timestamp.isoformat(), "id": item_id})
+
+    def decode_time(self, cursor: str):
+        """Decode a cursor produced by encode_time into (timestamp, id)"""
+        state = self.decode(cursor)
+        try:
+            if not isinstance(state["id"], str):
+                raise TypeError("cursor id must be a string")
+            return datetime.fromisoformat(state["t"]), state["id"]
+        except (KeyError, TypeError, ValueError):
+            raise invalid_cursor()
+
+
+def validate_profile_cursor(state: dict) -> dict:
+    """Check the types of a /api/profiles cursor: served count, last id and distance"""
+    try:
+        served = state.get("n", 0)
+        if not isinstance(served, int) or isinstance(served, bool) or served < 0:
+            raise ValueError("served count must be a non-negative integer")
+        parsed = {"n": served}
+        if "id" in state:
+            if not isinstance(state["id"], str):
+                raise TypeError("cursor id must be a string")
+            parsed["id"] = state["id"]
+        if "d" in state:
+            distance = float(state["d"])
+            if not math.isfinite(distance) or distance < 0:
+                raise ValueError("cursor distance must be a non-negative number")
+            parsed["d"] = distance
+    except (TypeError, ValueError):
+        raise invalid_cursor()
+    return parsed
@@ -0,0 +1,65 @@
+"""MongoDB access layer for the NextChapter API.
+
+Every collection is exposed as a Motor (asyncio) collection so route handlers
+await their queries instead of blocking the event loop. Connection pool size,
+timeouts and server selection are configured through environment variables.
+"""
+import os
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Connection settings
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
+MONGO_DB_NAME = os.environ.get('MONGO_DB_NAME', 'nextchapter')
+
+# Pool and timeout settings (milliseconds unless noted)
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', 300000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 10000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', 10000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', 20000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000))
+MONGO_RETRY_WRITES = os.environ.get('MONGO_RETRY_WRITES', 'true').lower() == 'true'
+MONGO_APP_NAME = os.environ.get('MONGO_APP_NAME', 'nextchapter-api')
+
+
+def get_client_options() -> dict:
+    """Build Motor client keyword arguments from the environment settings"""
+    return {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "retryWrites": MONGO_RETRY_WRITES,
+        "appname": MONGO_APP_NAME,
+        "tz_aware": False,
+    }
+
+
+# Motor binds to the running event loop lazily, so the client can be created at import time
+client = AsyncIOMotorClient(MONGO_URL, **get_client_options())
+db = client[MONGO_DB_NAME]
+
+users_collection = db.users
+likes_collection = db.likes
+matches_collection = db.matches
+messages_collection = db.messages
+transactions_collection = db.transactions
+revoked_tokens_collection = db.revoked_tokens
+otp_codes_collection = db.otp_codes
+email_outbox_collection = db.email_outbox
+webhook_inbox_collection = db.webhook_inbox
+
+
+async def ping_database():
+    """Check that the MongoDB server is reachable"""
+    await client.admin.command('ping')
+
+
+def close_database():
+    """Close all pooled connections"""
+    client.close()
@@ -0,0 +1,163 @@
+"""Outbound email queue.
+
+Handlers enqueue messages into the ``email_outbox`` collection and return
+immediately. Background workers claim due messages, send them over a
+long-lived authenticated SMTP connection (one per worker, re-established
+when the server drops it) and retry failures with exponential backoff.
+Messages claimed by a worker that died mid-send are picked up again once
+their lease expires.
+
+``EMAIL_BACKEND=memory`` swaps SMTP for ``MemoryTransport``, a local sink
+that records messages instead of sending them (tests and development).
+"""
+import asyncio
+import smtplib
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Callable, List, Optional
+
+from leased_queue import PENDING, LeasedQueue
+
+SENDING = "sending"
+SENT = "sent"
+
+
+def build_mime_message(message: dict) -> MIMEMultipart:
+    msg = MIMEMultipart('alternative')
+    msg['Subject'] = message["subject"]
+    msg['From'] = message["from_address"]
+    msg['To'] = message["to"]
+    msg.attach(MIMEText(message["html"], 'html'))
+    return msg
+
+
+class EmailTransport(ABC):
+    """Interface for blocking mail transports; called from a worker thread"""
+
+    @abstractmethod
+    def send(self, msg: MIMEMultipart):
+        ...
+
+    def close(self):
+        pass
+
+
+class SmtpTransport(EmailTransport):
+    """Keeps one authenticated SMTP connection open across messages"""
+
+    def __init__(self, host: str, port: int, username: str, password: str, timeout: float = 30):
+        self._host = host
+        self._port = port
+        self._username = username
+        self._password = password
+        self._timeout = timeout
+        self._smtp: Optional[smtplib.SMTP] = None
+
+    def _connect(self) -> smtplib.SMTP:
+        smtp = smtplib.SMTP(self._host, self._port, timeout=self._timeout)
+        smtp.starttls()
+        smtp.login(self._username, self._password)
+        return smtp
+
+    def send(self, msg: MIMEMultipart):
+        if self._smtp is None:
+            self._smtp = self._connect()
+        try:
+            self._smtp.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError):
+            # Idle connections get dropped by the server; reconnect once and resend
+            self.close()
+            self._smtp = self._connect()
+            self._smtp.send_message(msg)
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except Exception:
+                pass
+            self._smtp = None
+
+
+class MemoryTransport(EmailTransport):
+    """Records messages instead of sending them"""
+
+    def __init__(self):
+        self.sent: List[MIMEMultipart] = []
+
+    def send(self, msg: MIMEMultipart):
+        self.sent.append(msg)
+
+
+class EmailOutbox(LeasedQueue):
+    """Persistent email queue drained by background workers"""
+
+    name = "Email outbox"
+    claimed_status = SENDING
+    claim_order = "next_attempt_at"
+
+    def __init__(
+        self,
+        collection,
+        transport_factory: Callable[[], EmailTransport],
+        workers: int,
+        max_attempts: int,
+        retry_base_seconds: float,
+        poll_interval_seconds: float,
+        lease_seconds: float = 300
+    ):
+        super().__init__(collection, workers, max_attempts, retry_base_seconds, poll_interval_seconds, lease_seconds)
+        self._transport_factory = transport_factory
+        self.sent = 0
+
+    def _describe(self, message: dict) -> str:
+        return f"{message['kind']} email to {message['to']}"
+
+    async def enqueue(self, to: str, subject: str, html: str, from_address: str, kind: str = "generic") -> str:
+        """Persist a message for delivery and wake a worker"""
+        now = datetime.utcnow()
+        message_id = str(uuid.uuid4())
+        await self._collection.insert_one({
+            "id": message_id,
+            "kind": kind,
+            "to": to,
+            "from_address": from_address,
+            "subject": subject,
+            "html": html,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now
+        })
+        self._notify()
+        return message_id
+
+    async def _deliver(self, transport: EmailTransport, message: dict):
+        try:
+            await asyncio.to_thread(transport.send, build_mime_message(message))
+        except Exception as e:
+            await self._record_failure(message, e)
+            return
+
+        self.sent += 1
+        await self._complete(message, {"status": SENT, "sent_at": datetime.utcnow()}, unset={"html": ""})
+        print(f"✅ {message['kind']} email sent to {message['to']}")
+
+    async def run_worker(self):
+        """Send due messages until cancelled, reusing one transport"""
+        transport = self._transport_factory()
+        try:
+            await self._drain(lambda message: self._deliver(transport, message))
+        finally:
+            await asyncio.to_thread(transport.close)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self._workers,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed
+        }
@@ -0,0 +1,34 @@
+"""Location helpers shared by the API and schema migrations.
+
+Profiles store a display location formatted as "City, Country:lat,lon". The
+coordinates are also persisted as a GeoJSON point in the ``geo`` field so
+MongoDB can answer radius searches from the users 2dsphere index.
+"""
+from typing import Optional, Tuple
+
+
+def parse_location_coordinates(location: Optional[str]) -> Optional[Tuple[float, float]]:
+    """Extract (lat, lon) from a "City, Country:lat,lon" location string"""
+    if not location or ':' not in location:
+        return None
+
+    try:
+        coords = location.split(':')[1].split(',')
+        lat, lon = float(coords[0]), float(coords[1])
+    except (ValueError, IndexError):
+        return None
+
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+
+    return lat, lon
+
+
+def location_to_geo_point(location: Optional[str]) -> Optional[dict]:
+    """Build a GeoJSON point (longitude first) from a display location"""
+    coords = parse_location_coordinates(location)
+    if coords is None:
+        return None
+
+    lat, lon = coords
+    return {"type": "Point", "coordinates": [lon, lat]}
@@ -0,0 +1,170 @@
+"""Resized derivatives of profile photos.
+
+After a profile photo is stored, ``ImagePipeline`` renders thumb, card and
+full-size variants in a process pool: each variant is orientation-corrected,
+stripped of EXIF metadata, bounded to a maximum edge and recompressed as
+WebP. The variant URLs are recorded on the user document as
+``photo_variants`` (only if the photo was not replaced in the meantime) so
+list endpoints can hand out an image sized for where it is shown. Until the
+variants exist, clients keep getting the original ``main_photo``.
+
+Worker processes are started with forkserver (spawn where forkserver is not
+available) rather than fork: the API process runs threads (thread pools,
+database drivers) and forking it could copy a lock that is held forever.
+"""
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Set
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    print("⚠️ Pillow not installed - photo variants disabled")
+    Image = None
+
+PILLOW_AVAILABLE = Image is not None
+
+# Longest edge in pixels for each variant
+PHOTO_VARIANT_SIZES = {
+    "full": 1280,
+    "card": 640,
+    "thumb": 160,
+}
+
+
+def render_variants(source_path: str, output_dir: str, stem: str, sizes: Dict[str, int], quality: int) -> Dict[str, str]:
+    """Write one WebP file per variant and return their filenames; runs in a worker process"""
+    filenames = {}
+    with Image.open(source_path) as original:
+        # Apply the EXIF orientation, since the metadata itself is dropped
+        image = ImageOps.exif_transpose(original)
+        has_alpha = image.mode in ("RGBA", "LA") or "transparency" in image.info
+        image = image.convert("RGBA" if has_alpha else "RGB")
+
+        # Largest first, so each smaller variant is resized from the previous one
+        for name, edge in sorted(sizes.items(), key=lambda item: item[1], reverse=True):
+            image.thumbnail((edge, edge), Image.LANCZOS)
+            filename = f"{stem}_{name}.webp"
+            final_path = os.path.join(output_dir, filename)
+            temp_path = final_path + ".part"
+            image.save(temp_path, "WEBP", quality=quality, method=4, exif=b"", icc_profile=None)
+            os.replace(temp_path, final_path)
+            filenames[name] = filename
+    return filenames
+
+
+class ImagePipeline:
+    """Generates photo variants in a process pool and records them on the user"""
+
+    def __init__(
+        self,
+        upload_dir: Path,
+        users_collection,
+        workers: int,
+        quality: int,
+        on_updated: Optional[Callable[[str], None]] = None
+    ):
+        self.variants_dir = upload_dir / "variants"
+        self._upload_dir = upload_dir
+        self._users = users_collection
+        self._workers = max(1, workers)
+        self._quality = quality
+        self._on_updated = on_updated
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.completed = 0
+        self.failed = 0
+        self.total_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return PILLOW_AVAILABLE
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Started on first use so worker processes are not forked at import time
+        if self._pool is None:
+            self.variants_dir.mkdir(parents=True, exist_ok=True)
+            start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._pool = ProcessPoolExecutor(max_workers=self._workers, mp_context=multiprocessing.get_context(start_method))
+        return self._pool
+
+    def submit(self, user_id: str, photo_url: str):
+        """Schedule variant generation for a newly stored photo"""
+        if not self.enabled:
+            return
+        task = asyncio.create_task(self._process(user_id, photo_url))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, user_id: str, photo_url: str):
+        source = self._upload_dir / Path(photo_url).name
+        started = time.perf_counter()
+        try:
+            filenames = await asyncio.get_running_loop().run_in_executor(
+                self._executor(),
+                render_variants,
+                str(source),
+                str(self.variants_dir),
+                source.stem,
+                PHOTO_VARIANT_SIZES,
+                self._quality
+            )
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ Failed to generate photo variants for {photo_url}: {e}")
+            return
+        self.completed += 1
+        self.total_seconds += time.perf_counter() - started
+
+        variants = {name: f"/uploads/variants/{filename}" for name, filename in filenames.items()}
+        result = await self._users.update_one(
+            {"id": user_id, "main_photo": photo_url},
+            {"$set": {"photo_variants": variants}}
+        )
+        if result.modified_count:
+            if self._on_updated:
+                self._on_updated(user_id)
+        else:
+            # The photo was replaced while its variants were rendered
+            self._unlink(filenames.values())
+
+    def _unlink(self, filenames: Iterable[str]):
+        for filename in filenames:
+            (self.variants_dir / filename).unlink(missing_ok=True)
+
+    async def discard(self, variants: Optional[dict]):
+        """Delete the variant files of a photo that has been replaced"""
+        if variants:
+            # Only the file names are used, so a stored URL can never point outside variants_dir
+            filenames = [Path(url).name for url in variants.values() if url]
+            await asyncio.to_thread(self._unlink, filenames)
+
+    async def aclose(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "workers": self._workers,
+            "pending": len(self._tasks),
+            "completed": self.completed,
+            "failed": self.failed,
+            "avg_ms": round(self.total_seconds / self.completed * 1000, 2) if self.completed else 0.0
+        }
+
+
+def select_photo_size(profile: dict, photo_size: str) -> dict:
+    """Point ``main_photo`` at the requested variant when it has been generated"""
+    variants = profile.get("photo_variants") or {}
+    if photo_size != "original" and variants.get(photo_size):
+        profile["main_photo"] = variants[photo_size]
+    return profile
@@ -0,0 +1,376 @@
+"""Index registry and schema migrations for the NextChapter database.
+
+INDEXES declares every index the API servers rely on. MIGRATIONS is an ordered
+list of versioned steps; the applied version is recorded in the
+``schema_migrations`` collection. Servers call ``bootstrap_schema`` on startup,
+which applies pending migrations (unless AUTO_MIGRATE is disabled) and then
+refuses to serve if any registered index is missing.
+
+CLI usage (from the backend directory):
+    python indexes.py migrate   # apply pending migrations and ensure indexes
+    python indexes.py status    # show schema version and missing indexes
+    python indexes.py verify    # exit non-zero if a required index is missing
+"""
+import os
+import sys
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, NamedTuple
+
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, IndexModel, UpdateOne
+from pymongo.errors import OperationFailure
+
+from geo import location_to_geo_point
+
+AUTO_MIGRATE = os.environ.get('AUTO_MIGRATE', 'true').lower() == 'true'
+
+SCHEMA_COLLECTION = "schema_migrations"
+SCHEMA_DOCUMENT_ID = "nextchapter"
+
+# Declarative index registry: collection name -> required indexes
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="users_id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="users_email_unique", unique=True),
+        IndexModel(
+            [("phone_number", ASCENDING)],
+            name="users_phone_number",
+            partialFilterExpression={"phone_number": {"$type": "string"}},
+        ),
+        IndexModel([("last_activity", DESCENDING)], name="users_last_activity"),
+        IndexModel([("geo", GEOSPHERE), ("profile_complete", ASCENDING)], name="users_geo_2dsphere"),
+        # Only active subscriptions are scanned by the expiry sweeper
+        IndexModel(
+            [("subscription_expires", ASCENDING)],
+            name="users_subscription_expires",
+            partialFilterExpression={"subscription_status": "active"},
+        ),
+    ],
+    "likes": [
+        IndexModel(
+            [("user_id", ASCENDING), ("liked_user_id", ASCENDING)],
+            name="likes_user_liked_unique",
+            unique=True,
+        ),
+    ],
+    "matches": [
+        IndexModel([("id", ASCENDING)], name="matches_id_unique", unique=True),
+        IndexModel(
+            [("match_key", ASCENDING)],
+            name="matches_match_key_unique",
+            unique=True,
+            partialFilterExpression={"match_key": {"$type": "string"}},
+        ),
+        IndexModel([("user1_id", ASCENDING), ("last_activity_at", DESCENDING), ("id", DESCENDING)], name="matches_user1_activity"),
+        IndexModel([("user2_id", ASCENDING), ("last_activity_at", DESCENDING), ("id", DESCENDING)], name="matches_user2_activity"),
+    ],
+    "messages": [
+        IndexModel(
+            [("match_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="messages_match_created_id",
+        ),
+    ],
+    "transactions": [
+        IndexModel(
+            [("paychangu_transaction_id", ASCENDING)],
+            name="transactions_paychangu_id_unique",
+            unique=True,
+            partialFilterExpression={"paychangu_transaction_id": {"$type": "string"}},
+        ),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)], name="transactions_user_created"),
+    ],
+    "revoked_tokens": [
+        IndexModel([("jti", ASCENDING)], name="revoked_tokens_jti_unique", unique=True),
+        # Entries are only needed until the revoked token would have expired anyway
+        IndexModel([("expires_at", ASCENDING)], name="revoked_tokens_expires_ttl", expireAfterSeconds=0),
+    ],
+    "otp_codes": [
+        # Pending registration and password reset codes expire on their own
+        IndexModel([("expires_at", ASCENDING)], name="otp_codes_expires_ttl", expireAfterSeconds=0),
+    ],
+    "email_outbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="email_outbox_status_due"),
+        IndexModel([("status", ASCENDING), ("locked_at", ASCENDING)], name="email_outbox_status_locked"),
+    ],
+    "webhook_inbox": [
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)], name="webhook_inbox_status_due"),
+        IndexModel([("status", ASCENDING), ("received_at", ASCENDING)], name="webhook_inbox_status_received"),
+        IndexModel([("tx_ref", ASCENDING), ("received_at", ASCENDING)], name="webhook_inbox_tx_received"),
+        # Processed deliveries are kept for 30 days for auditing
+        IndexModel([("processed_at", ASCENDING)], name="webhook_inbox_processed_ttl", expireAfterSeconds=30 * 24 * 3600),
+    ],
+    "payment_transactions": [
+        IndexModel(
+            [("session_id", ASCENDING)],
+            name="payment_transactions_session",
+            partialFilterExpression={"session_id": {"$type": "string"}},
+        ),
+    ],
+}
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[..., Awaitable[None]]
+
+
+async def ensure_indexes(db):
+    """Create every registered index that does not exist yet"""
+    for collection_name, models in INDEXES.items():
+        try:
+            await db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            # Usually an existing index with the same keys but different options;
+            # missing_indexes will report it and block startup
+            print(f"❌ Failed to create indexes on {collection_name}: {e}")
+
+
+async def find_duplicates(collection, field: str, limit: int = 10) -> List[dict]:
+    """Return up to ``limit`` values of ``field`` shared by several documents, with their counts"""
+    cursor = collection.aggregate([
+        {"$match": {field: {"$exists": True}}},
+        {"$group": {"_id": f"${field}", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$sort": {"count": -1}},
+        {"$limit": limit},
+    ], allowDiskUse=True)
+    return [{"value": group["_id"], "count": group["count"]} async for group in cursor]
+
+
+async def _check_unique_user_fields(db):
+    """Refuse to continue while users share an id or email the unique indexes would reject"""
+    problems = []
+    for field in ("id", "email"):
+        duplicates = await find_duplicates(db.users, field)
+        if duplicates:
+            listed = ", ".join(f"{d['value']!r} x{d['count']}" for d in duplicates)
+            problems.append(f"users.{field}: {listed}")
+    if problems:
+        # Accounts are not merged automatically: which one to keep needs a human decision
+        raise RuntimeError(
+            "Cannot create unique user indexes, duplicate values found (showing up to 10 per field) - "
+            + "; ".join(problems)
+            + ". Merge or remove the duplicate accounts, then run `python indexes.py migrate`"
+        )
+
+
+async def _baseline_indexes(db):
+    await _check_unique_user_fields(db)
+    await ensure_indexes(db)
+
+
+async def _backfill_geo_points(db):
+    """Store a GeoJSON point for every profile whose location carries coordinates"""
+    updates = []
+    cursor = db.users.find(
+        {"geo": {"$exists": False}, "location": {"$regex": ":"}},
+        {"_id": 1, "location": 1},
+    )
+    async for user in cursor:
+        point = location_to_geo_point(user.get("location"))
+        if point:
+            updates.append(UpdateOne({"_id": user["_id"]}, {"$set": {"geo": point}}))
+        if len(updates) >= 1000:
+            await db.users.bulk_write(updates, ordered=False)
+            updates = []
+
+    if updates:
+        await db.users.bulk_write(updates, ordered=False)
+
+
+def match_key_for(user_a: str, user_b: str) -> str:
+    """Deterministic key for the match between two users, independent of who liked first"""
+    return ":".join(sorted([user_a, user_b]))
+
+
+async def _dedupe_likes_and_matches(db):
+    """Remove duplicate likes/matches so the pair indexes can be unique"""
+    # Keep the earliest like for every (user_id, liked_user_id) pair
+    duplicate_likes = db.likes.aggregate([
+        {"$sort": {"created_at": 1}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "liked_user_id": "$liked_user_id"},
+            "ids": {"$push": "$_id"},
+            "count": {"$sum": 1},
+        }},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    async for group in duplicate_likes:
+        await db.likes.delete_many({"_id": {"$in": group["ids"][1:]}})
+
+    # Give every match its deterministic pair key
+    updates = []
+    async for match in db.matches.find({"match_key": {"$exists": False}}, {"_id": 1, "user1_id": 1, "user2_id": 1}):
+        key = match_key_for(match["user1_id"], match["user2_id"])
+        updates.append(UpdateOne({"_id": match["_id"]}, {"$set": {"match_key": key}}))
+    if updates:
+        await db.matches.bulk_write(updates, ordered=False)
+
+    # Keep the earliest match per pair and move messages from the duplicates onto it
+    duplicate_matches = db.matches.aggregate([
+        {"$sort": {"created_at": 1}},
+        {"$group": {"_id": "$match_key", "ids": {"$push": "$id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    async for group in duplicate_matches:
+        keep_id, duplicate_ids = group["ids"][0], group["ids"][1:]
+        await db.messages.update_many({"match_id": {"$in": duplicate_ids}}, {"$set": {"match_id": keep_id}})
+        await db.matches.delete_many({"id": {"$in": duplicate_ids}})
+
+    # Replace the non-unique pair index created by migration 1
+    if "likes_user_liked" in await db.likes.index_information():
+        await db.likes.drop_index("likes_user_liked")
+
+
+async def _backfill_match_activity(db):
+    """Record when each match last saw activity so match lists can be ordered by it"""
+    latest_messages = {}
+    async for group in db.messages.aggregate([
+        {"$group": {"_id": "$match_id", "last_message_at": {"$max": "$created_at"}}}
+    ], allowDiskUse=True):
+        latest_messages[group["_id"]] = group["last_message_at"]
+
+    updates = []
+    async for match in db.matches.find({"last_activity_at": {"$exists": False}}, {"_id": 1, "id": 1, "created_at": 1}):
+        last_activity_at = latest_messages.get(match.get("id")) or match.get("created_at")
+        updates.append(UpdateOne({"_id": match["_id"]}, {"$set": {"last_activity_at": last_activity_at}}))
+        if len(updates) >= 1000:
+            await db.matches.bulk_write(updates, ordered=False)
+            updates = []
+    if updates:
+        await db.matches.bulk_write(updates, ordered=False)
+
+    # Superseded by the (user, last_activity_at) indexes
+    existing = await db.matches.index_information()
+    for name in ("matches_user1", "matches_user2"):
+        if name in existing:
+            await db.matches.drop_index(name)
+
+
+async def _drop_superseded_message_index(db):
+    """The (match_id, created_at, id) index replaces (match_id, created_at)"""
+    if "messages_match_created" in await db.messages.index_information():
+        await db.messages.drop_index("messages_match_created")
+
+
+# Ordered schema migrations; append new steps with the next version number
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Create baseline indexes from the registry", _baseline_indexes),
+    Migration(2, "Backfill GeoJSON points from profile locations", _backfill_geo_points),
+    Migration(3, "Deduplicate likes and matches, add match keys", _dedupe_likes_and_matches),
+    Migration(4, "Backfill match activity timestamps", _backfill_match_activity),
+    Migration(5, "Extend message history index with id tie-breaker", _drop_superseded_message_index),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1].version
+
+
+def _index_signature(keys, unique=False) -> tuple:
+    return (tuple((field, direction) for field, direction in keys), bool(unique))
+
+
+async def missing_indexes(db) -> List[str]:
+    """Return the names of registered indexes that are absent from the database"""
+    missing = []
+    for collection_name, models in INDEXES.items():
+        existing = await db[collection_name].index_information()
+        existing_signatures = {
+            _index_signature(info["key"], info.get("unique", False)) for info in existing.values()
+        }
+        for model in models:
+            spec = model.document
+            signature = _index_signature(spec["key"].items(), spec.get("unique", False))
+            if signature not in existing_signatures:
+                missing.append(f"{collection_name}.{spec['name']}")
+    return missing
+
+
+async def get_schema_version(db) -> int:
+    """Return the last applied migration version (0 for a fresh database)"""
+    doc = await db[SCHEMA_COLLECTION].find_one({"_id": SCHEMA_DOCUMENT_ID})
+    return doc.get("version", 0) if doc else 0
+
+
+async def run_migrations(db) -> int:
+    """Apply pending migrations in order, then ensure registered indexes"""
+    current_version = await get_schema_version(db)
+
+    for migration in MIGRATIONS:
+        if migration.version <= current_version:
+            continue
+
+        print(f"🔄 Applying schema migration {migration.version}: {migration.description}")
+        await migration.apply(db)
+        await db[SCHEMA_COLLECTION].update_one(
+            {"_id": SCHEMA_DOCUMENT_ID},
+            {
+                "$max": {"version": migration.version},
+                "$push": {"applied": {
+                    "version": migration.version,
+                    "description": migration.description,
+                    "applied_at": datetime.utcnow(),
+                }},
+            },
+            upsert=True,
+        )
+        current_version = migration.version
+
+    await ensure_indexes(db)
+    return current_version
+
+
+async def bootstrap_schema(db, auto_migrate: bool = AUTO_MIGRATE):
+    """Startup hook: migrate if allowed, then refuse to serve on a missing index"""
+    if auto_migrate:
+        version = await run_migrations(db)
+    else:
+        version = await get_schema_version(db)
+
+    if version < SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is behind {SCHEMA_VERSION} - run `python indexes.py migrate`"
+        )
+
+    missing = await missing_indexes(db)
+    if missing:
+        raise RuntimeError(f"Required MongoDB indexes are missing: {', '.join(missing)}")
+
+    print(f"✅ Database schema at version {version} with all required indexes")
+
+
+async def _main(command: str) -> int:
+    from database import db, close_database
+
+    try:
+        if command == "migrate":
+            try:
+                version = await run_migrations(db)
+            except RuntimeError as e:
+                print(f"❌ {e}")
+                return 1
+            print(f"✅ Schema migrated to version {version}")
+            command = "verify"
+
+        if command == "status":
+            print(f"Schema version: {await get_schema_version(db)} (latest {SCHEMA_VERSION})")
+
+        if command in ("status", "verify"):
+            missing = await missing_indexes(db)
+            if missing:
+                print(f"❌ Missing indexes: {', '.join(missing)}")
+                return 1
+            print("✅ All required indexes present")
+            return 0
+
+        print(__doc__)
+        return 2
+    finally:
+        close_database()
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    sys.exit(asyncio.run(_main(sys.argv[1] if len(sys.argv) > 1 else "")))
@@ -0,0 +1,135 @@
+"""MongoDB collections used as work queues, drained by leased workers.
+
+``LeasedQueue`` holds the queue mechanics shared by the email outbox and
+the webhook inbox. A worker claims a due entry by switching it to the
+claimed status and stamping ``locked_at``, so each entry is handled by one
+worker at a time; an entry whose worker died is claimed again once its
+lease expires. Failures are retried with exponential backoff until
+``max_attempts`` is reached. ``_notify`` wakes idle workers as soon as
+something is enqueued; otherwise they poll. Errors in the worker loop itself
+(e.g. MongoDB unavailable) are logged and the worker backs off and keeps
+going instead of exiting.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+
+from pymongo import ReturnDocument
+
+PENDING = "pending"
+FAILED = "failed"
+
+# Longest pause after repeated worker loop errors
+MAX_ERROR_BACKOFF_SECONDS = 60
+
+
+class LeasedQueue(ABC):
+    """Claim, lease, retry and wakeup logic for a queue collection"""
+
+    name = "Queue"
+    claimed_status = "processing"
+    claim_order = "next_attempt_at"
+
+    def __init__(
+        self,
+        collection,
+        workers: int,
+        max_attempts: int,
+        retry_base_seconds: float,
+        poll_interval_seconds: float,
+        lease_seconds: float = 300
+    ):
+        self._collection = collection
+        self._workers = max(1, workers)
+        self._max_attempts = max_attempts
+        self._retry_base = retry_base_seconds
+        self._poll_interval = poll_interval_seconds
+        self._lease = timedelta(seconds=lease_seconds)
+        self._wakeup: Optional[asyncio.Event] = None
+        self.retried = 0
+        self.failed = 0
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _describe(self, entry: dict) -> str:
+        """How an entry is referred to in log lines"""
+        return f"{self.name} entry {entry['_id']}"
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.utcnow()
+        return await self._collection.find_one_and_update(
+            {"$or": [
+                {"status": PENDING, "next_attempt_at": {"$lte": now}},
+                # Lease expired: the worker that claimed it is gone
+                {"status": self.claimed_status, "locked_at": {"$lt": now - self._lease}}
+            ]},
+            {"$set": {"status": self.claimed_status, "locked_at": now}},
+            sort=[(self.claim_order, 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _release(self, entry: dict, delay_seconds: float):
+        """Hand an entry back without counting an attempt"""
+        await self._collection.update_one(
+            {"_id": entry["_id"]},
+            {
+                "$set": {"status": PENDING, "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay_seconds)},
+                "$unset": {"locked_at": ""}
+            }
+        )
+
+    async def _record_failure(self, entry: dict, error: Exception):
+        """Schedule a retry with exponential backoff, or give up after the last attempt"""
+        attempts = entry.get("attempts", 0) + 1
+        update = {"attempts": attempts, "last_error": str(error)}
+        if attempts >= self._max_attempts:
+            self.failed += 1
+            update.update({"status": FAILED, "failed_at": datetime.utcnow()})
+            print(f"❌ Giving up on {self._describe(entry)} after {attempts} attempts: {error}")
+        else:
+            self.retried += 1
+            delay = self._retry_base * (2 ** (attempts - 1))
+            update.update({"status": PENDING, "next_attempt_at": datetime.utcnow() + timedelta(seconds=delay)})
+            print(f"⚠️ Failed to process {self._describe(entry)}, retrying in {delay:.0f}s: {error}")
+        await self._collection.update_one({"_id": entry["_id"]}, {"$set": update, "$unset": {"locked_at": ""}})
+
+    async def _complete(self, entry: dict, fields: dict, unset: Optional[dict] = None):
+        await self._collection.update_one(
+            {"_id": entry["_id"]},
+            {"$set": fields, "$unset": {"locked_at": "", **(unset or {})}}
+        )
+
+    async def _drain(self, handle: Callable[[dict], Awaitable[None]]):
+        """Claim and handle due entries until cancelled"""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        errors = 0
+        while True:
+            try:
+                # Clear before claiming so an enqueue during the claim is not missed
+                self._wakeup.clear()
+                entry = await self._claim()
+                if entry is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self._poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await handle(entry)
+                errors = 0
+            except Exception as e:
+                # A claimed entry stays leased and is picked up again once the lease expires
+                errors += 1
+                delay = min(self._poll_interval * 2 ** (errors - 1), MAX_ERROR_BACKOFF_SECONDS)
+                print(f"❌ {self.name} worker error, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+
+    @abstractmethod
+    async def run_worker(self):
+        """Worker task body; subclasses call ``_drain`` with their entry handler"""
+
+    def start(self) -> List[asyncio.Task]:
+        return [asyncio.create_task(self.run_worker()) for _ in range(self._workers)]
@@ -0,0 +1,111 @@
+"""Storage for pending one-time codes (registration and password reset).
+
+``OtpStore`` is the interface used by the API. ``MongoOtpStore`` keeps codes
+in the ``otp_codes`` collection, where a TTL index removes expired entries,
+so pending codes survive restarts and are visible to every worker.
+``InMemoryOtpStore`` is a process-local alternative for single-worker and
+development setups; a background sweeper drops expired entries and the store
+never holds more than ``max_entries`` codes.
+
+Entries carry their own ``expires_at``; callers still check it because the
+sweeper and the TTL monitor run periodically rather than at the exact moment
+a code expires.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, Tuple
+
+REGISTRATION = "registration"
+PASSWORD_RESET = "password_reset"
+
+
+class OtpStore(ABC):
+    """Interface for OTP backends"""
+
+    @abstractmethod
+    async def put(self, namespace: str, key: str, entry: dict):
+        """Store an entry (which must include ``expires_at``), replacing any previous one"""
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Optional[dict]:
+        ...
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str):
+        ...
+
+
+class InMemoryOtpStore(OtpStore):
+    """Process-local OTP store with a size bound and periodic expiry sweep"""
+
+    def __init__(self, max_entries: int, sweep_interval_seconds: int):
+        self.max_entries = max_entries
+        self._sweep_interval = sweep_interval_seconds
+        self._entries: "OrderedDict[Tuple[str, str], dict]" = OrderedDict()
+        self.evictions = 0
+
+    async def put(self, namespace: str, key: str, entry: dict):
+        self._entries[(namespace, key)] = entry
+        self._entries.move_to_end((namespace, key))
+        while len(self._entries) > self.max_entries:
+            # Drop the oldest pending code rather than grow without bound
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get(self, namespace: str, key: str) -> Optional[dict]:
+        return self._entries.get((namespace, key))
+
+    async def delete(self, namespace: str, key: str):
+        self._entries.pop((namespace, key), None)
+
+    def sweep(self) -> int:
+        now = datetime.utcnow()
+        expired = [entry_key for entry_key, entry in self._entries.items() if entry["expires_at"] <= now]
+        for entry_key in expired:
+            del self._entries[entry_key]
+        return len(expired)
+
+    async def run_sweeper(self):
+        """Background loop removing expired codes until cancelled"""
+        while True:
+            await asyncio.sleep(self._sweep_interval)
+            self.sweep()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class MongoOtpStore(OtpStore):
+    """OTP store shared by all workers, expired by a MongoDB TTL index"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    @staticmethod
+    def _id(namespace: str, key: str) -> str:
+        return f"{namespace}:{key}"
+
+    async def put(self, namespace: str, key: str, entry: dict):
+        await self._collection.replace_one(
+            {"_id": self._id(namespace, key)},
+            {"namespace": namespace, "key": key, "expires_at": entry["expires_at"], "entry": entry},
+            upsert=True
+        )
+
+    async def get(self, namespace: str, key: str) -> Optional[dict]:
+        doc = await self._collection.find_one({"_id": self._id(namespace, key)}, {"entry": 1})
+        return doc["entry"] if doc else None
+
+    async def delete(self, namespace: str, key: str):
+        await self._collection.delete_one({"_id": self._id(namespace, key)})
+
+
+def create_otp_store(backend: str, collection, max_entries: int, sweep_interval_seconds: int) -> OtpStore:
+    """Build the OTP store selected by the OTP_STORE setting"""
+    if backend == "mongo":
+        return MongoOtpStore(collection)
+    if backend == "memory":
+        return InMemoryOtpStore(max_entries, sweep_interval_seconds)
+    raise ValueError(f"Unknown OTP_STORE backend: {backend}")
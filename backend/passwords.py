@@ -0,0 +1,107 @@
+"""Password hashing off the event loop.
+
+bcrypt is deliberately slow, so hashing and verification run on a dedicated
+thread pool. A semaphore caps how many hashes run at once; callers beyond the
+cap wait their turn (and show up in the queue metrics) instead of piling
+work onto the executor. Hashes created with a different cost factor than
+BCRYPT_ROUNDS are reported by ``needs_rehash`` so login can upgrade them.
+"""
+import os
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get('PASSWORD_HASH_CONCURRENCY', min(4, os.cpu_count() or 1)))
+
+
+class PasswordHasher:
+    """Bounded bcrypt worker pool with queue-depth metrics"""
+
+    def __init__(self, rounds: int, concurrency: int):
+        self.rounds = rounds
+        self.concurrency = max(1, concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="bcrypt")
+        self._semaphore = None
+        self.waiting = 0
+        self.in_flight = 0
+        self.peak_waiting = 0
+        self.completed = 0
+        self.total_wait_seconds = 0.0
+        self.total_run_seconds = 0.0
+
+    async def _run(self, func, *args):
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        queued_at = time.perf_counter()
+        self.waiting += 1
+        self.peak_waiting = max(self.peak_waiting, self.waiting)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        started_at = time.perf_counter()
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+            finished_at = time.perf_counter()
+            self.completed += 1
+            self.total_wait_seconds += started_at - queued_at
+            self.total_run_seconds += finished_at - started_at
+
+    def _hash(self, password: str) -> str:
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=self.rounds)).decode('utf-8')
+
+    @staticmethod
+    def _verify(password: str, hashed: str) -> bool:
+        return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self._hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(self._verify, password, hashed)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """Whether a stored hash uses a different cost factor than configured"""
+        # bcrypt hashes look like $2b$12$<salt+hash>
+        parts = hashed.split('$')
+        try:
+            return int(parts[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self) -> dict:
+        return {
+            "rounds": self.rounds,
+            "concurrency": self.concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "peak_waiting": self.peak_waiting,
+            "completed": self.completed,
+            "avg_wait_ms": round(self.total_wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_run_ms": round(self.total_run_seconds / self.completed * 1000, 2) if self.completed else 0.0
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher(BCRYPT_ROUNDS, PASSWORD_HASH_CONCURRENCY)
+
+
+async def hash_password(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await password_hasher.verify(password, hashed)
@@ -0,0 +1,181 @@
+"""Async client for the Paychangu payment gateway.
+
+One ``httpx.AsyncClient`` is shared by all requests so connections to the
+gateway are kept alive and pooled. Idempotent calls (GET and friends) are
+retried with backoff on transport errors and 5xx responses; payment creation
+is only retried when the connection could not be established, so a charge is
+never submitted twice. A circuit breaker fails fast while the gateway keeps
+failing, and per-operation latency histograms are kept for /api/metrics.
+"""
+import asyncio
+import time
+from typing import Dict, Optional
+
+import httpx
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class PaymentGatewayUnavailable(Exception):
+    """Raised without calling the gateway while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures and lets one trial call through after a cooldown"""
+
+    def __init__(self, failure_threshold: int, reset_timeout_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self._trial_in_flight):
+            raise PaymentGatewayUnavailable("Payment gateway circuit is open")
+        if state == "half_open":
+            self._trial_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                print(f"❌ Paychangu circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+
+class LatencyHistogram:
+    """Per-bucket counts of call durations"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.total_seconds = 0.0
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                return
+        self.buckets[-1] += 1
+
+    def to_dict(self) -> dict:
+        labels = [f"le_{bound}" for bound in LATENCY_BUCKETS] + ["inf"]
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 2) if self.count else 0.0,
+            "buckets": dict(zip(labels, self.buckets))
+        }
+
+
+class PaychanguClient:
+    """Pooled, retrying, circuit-broken HTTP client for the Paychangu API"""
+
+    def __init__(
+        self,
+        base_url: str,
+        secret_key: str,
+        timeout_seconds: float,
+        max_retries: int,
+        retry_backoff_seconds: float,
+        breaker: CircuitBreaker,
+        max_connections: int = 20,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.base_url = base_url.rstrip("/")
+        self._secret_key = secret_key
+        self._timeout = timeout_seconds
+        self._max_retries = max_retries
+        self._retry_backoff = retry_backoff_seconds
+        self._limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self._transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self.breaker = breaker
+        self.latency: Dict[str, LatencyHistogram] = {}
+
+    def _http(self) -> httpx.AsyncClient:
+        # Created on first use so it binds to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "Accept": "application/json",
+                    "Authorization": f"Bearer {self._secret_key}"
+                },
+                timeout=self._timeout,
+                limits=self._limits,
+                transport=self._transport
+            )
+        return self._client
+
+    def _observe(self, operation: str, seconds: float):
+        self.latency.setdefault(operation, LatencyHistogram()).observe(seconds)
+
+    async def request(self, method: str, path: str, operation: str, **kwargs) -> httpx.Response:
+        """Send a request through the breaker, retrying where it is safe to"""
+        idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            started = time.perf_counter()
+            succeeded = False
+            try:
+                response = await self._http().request(method, path, **kwargs)
+                succeeded = response.status_code < 500
+            except httpx.TransportError as e:
+                # A failed connect never reached the gateway, so even a payment can be resent
+                retryable = idempotent or isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout))
+                if not retryable or attempt >= self._max_retries:
+                    raise
+            else:
+                if succeeded or not idempotent or attempt >= self._max_retries:
+                    return response
+            finally:
+                # Every way out records an outcome (cancellation and unexpected errors count
+                # as failures), so a half-open trial call can never stay in flight forever
+                self._observe(operation, time.perf_counter() - started)
+                if succeeded:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+
+            attempt += 1
+            await asyncio.sleep(self._retry_backoff * (2 ** (attempt - 1)))
+
+    async def initiate_payment(self, payment_data: dict) -> httpx.Response:
+        return await self.request("POST", "/payment", "initiate_payment", json=payment_data)
+
+    async def verify_payment(self, tx_ref: str) -> httpx.Response:
+        return await self.request("GET", f"/verify-payment/{tx_ref}", "verify_payment")
+
+    def stats(self) -> dict:
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "latency": {operation: histogram.to_dict() for operation, histogram in self.latency.items()}
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
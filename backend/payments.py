@@ -0,0 +1,203 @@
+"""Applying Paychangu payment results to transactions and subscriptions.
+
+A transaction moves pending -> success | failed exactly once. Crediting the
+subscription for a successful payment is a separate step that can safely be
+repeated: the user document remembers which transactions it was credited
+for (``applied_payment_refs``) and a credit for a transaction already listed
+there is a no-op. The transaction records ``subscription_applied_at`` once
+the credit is in place, so a redelivered webhook for a successful
+transaction without it resumes the credit instead of reporting a duplicate.
+A crash or error between the two steps therefore delays the credit until
+the next delivery or inbox retry, but never loses or doubles it.
+"""
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional, Tuple
+
+from pymongo import ReturnDocument
+
+# Transaction state machine: pending -> success | failed
+TRANSACTION_PENDING = "pending"
+TRANSACTION_SUCCESS = "success"
+TRANSACTION_FAILED = "failed"
+GATEWAY_SUCCESS_STATUSES = {"success", "successful", "completed", "paid"}
+GATEWAY_FAILURE_STATUSES = {"failed", "failure", "cancelled", "canceled", "declined", "error", "expired"}
+
+SUBSCRIPTION_DURATION_HOURS = {
+    "daily": 24,
+    "weekly": 24 * 7,  # 168 hours
+    "monthly": 24 * 30  # 720 hours
+}
+
+# Credited transactions kept on the user document
+APPLIED_PAYMENT_REFS_KEPT = 100
+
+# Retries of the optimistic subscription update when the user changes concurrently
+CREDIT_UPDATE_ATTEMPTS = 10
+
+
+def payment_state_for(gateway_status: str) -> Optional[str]:
+    """Map a gateway status onto a final transaction state (None if not final yet)"""
+    gateway_status = gateway_status.lower()
+    if gateway_status in GATEWAY_SUCCESS_STATUSES:
+        return TRANSACTION_SUCCESS
+    if gateway_status in GATEWAY_FAILURE_STATUSES:
+        return TRANSACTION_FAILED
+    return None
+
+
+def webhook_transaction_ref(webhook_data: dict) -> Optional[str]:
+    # Paychangu webhook may use different field names, try multiple options
+    return webhook_data.get("tx_ref") or webhook_data.get("transaction_id") or webhook_data.get("data", {}).get("tx_ref")
+
+
+class PaymentProcessor:
+    """Applies webhook deliveries to transactions and credits subscriptions once"""
+
+    def __init__(
+        self,
+        transactions_collection,
+        users_collection,
+        on_user_updated: Callable[[str], None],
+        on_subscription_applied: Callable[[dict, dict], Awaitable[bool]]
+    ):
+        self._transactions = transactions_collection
+        self._users = users_collection
+        self._on_user_updated = on_user_updated
+        self._on_subscription_applied = on_subscription_applied
+
+    async def apply_subscription_payment(
+        self,
+        user_id: str,
+        tx_ref: str,
+        subscription_type: str,
+        now: datetime
+    ) -> Tuple[Optional[dict], bool]:
+        """Activate or extend a premium subscription for one payment.
+
+        Returns the user (email, name and new expiry) and whether this call
+        credited it; a payment that was credited before is not credited again.
+        """
+        duration = timedelta(hours=SUBSCRIPTION_DURATION_HOURS.get(subscription_type, 24))
+        payments_field = f"subscription_payments_{subscription_type}"
+
+        for _ in range(CREDIT_UPDATE_ATTEMPTS):
+            user = await self._users.find_one(
+                {"id": user_id},
+                {"_id": 0, "email": 1, "name": 1, "subscription_expires": 1, "applied_payment_refs": 1}
+            )
+            if user is None:
+                return None, False
+            if tx_ref in (user.pop("applied_payment_refs", None) or []):
+                return user, False
+
+            # Active subscriptions are extended from their current expiry, lapsed ones start now
+            current_expiry = user.get("subscription_expires")
+            expires_at = max(current_expiry, now) if current_expiry else now
+            expires_at += duration
+
+            # Conditional on the expiry read above, so a concurrent credit makes this one re-read
+            result = await self._users.update_one(
+                {"id": user_id, "subscription_expires": current_expiry, "applied_payment_refs": {"$ne": tx_ref}},
+                {
+                    "$set": {
+                        "subscription_expires": expires_at,
+                        "subscription_tier": "premium",
+                        "subscription_status": "active",
+                        "subscription_started_at": now,
+                        "subscription_updated_at": now,
+                        "subscription_type": subscription_type,
+                        "daily_likes_used": 0,  # Reset likes count
+                        "can_message": True,    # Enable messaging
+                        "last_activity": now    # Track user activity
+                    },
+                    "$inc": {payments_field: 1},  # Track payment count
+                    "$push": {"applied_payment_refs": {"$each": [tx_ref], "$slice": -APPLIED_PAYMENT_REFS_KEPT}}
+                }
+            )
+            if result.modified_count:
+                user["subscription_expires"] = expires_at
+                return user, True
+
+        raise RuntimeError(f"User {user_id} kept changing while crediting transaction {tx_ref}")
+
+    async def process_webhook(self, webhook_data: dict) -> dict:
+        """Apply one stored webhook delivery to its transaction (run by the inbox workers)"""
+        transaction_id = webhook_transaction_ref(webhook_data)
+        status = webhook_data.get("status") or webhook_data.get("data", {}).get("status")
+
+        # If no status provided in webhook, assume success (Paychangu sends webhook only on success)
+        if not status:
+            print(f"⚠️ No status in webhook for transaction {transaction_id}, assuming success")
+            status = "success"
+
+        now = datetime.utcnow()
+        next_state = payment_state_for(status)
+        if next_state is None:
+            print(f"⚠️ Non-final status '{status}' for transaction {transaction_id} - waiting for a final one")
+            return {"status": "ignored"}
+
+        # pending -> success/failed happens exactly once, even for concurrent duplicate deliveries
+        projection = {"_id": 0, "user_id": 1, "subscription_type": 1, "amount": 1, "status": 1, "subscription_applied_at": 1}
+        transaction = await self._transactions.find_one_and_update(
+            {"paychangu_transaction_id": transaction_id, "status": TRANSACTION_PENDING},
+            {"$set": {
+                "status": next_state,
+                "gateway_status": status,
+                "webhook_received_at": now,
+                "webhook_data": webhook_data
+            }},
+            projection=projection,
+            return_document=ReturnDocument.BEFORE
+        )
+
+        if transaction is None:
+            transaction = await self._transactions.find_one({"paychangu_transaction_id": transaction_id}, projection)
+            if transaction is None:
+                print(f"⚠️ Webhook received for unknown transaction: {transaction_id}")
+                return {"status": "ignored"}
+            if (
+                next_state != TRANSACTION_SUCCESS
+                or transaction.get("status") != TRANSACTION_SUCCESS
+                or transaction.get("subscription_applied_at") is not None
+            ):
+                print(f"⚠️ Transaction {transaction_id} already processed - skipping duplicate webhook")
+                return {"status": "already_processed"}
+            print(f"🔄 Resuming subscription credit for transaction {transaction_id}")
+        elif next_state == TRANSACTION_FAILED:
+            print(f"⚠️ Payment {status} for transaction {transaction_id}")
+            return {"status": "processed"}
+
+        return await self._credit(transaction_id, transaction, now)
+
+    async def _credit(self, transaction_id: str, transaction: dict, now: datetime) -> dict:
+        user_id = transaction["user_id"]
+        subscription_type = transaction["subscription_type"]
+        user, credited = await self.apply_subscription_payment(user_id, transaction_id, subscription_type, now)
+        self._on_user_updated(user_id)
+
+        if user is None:
+            print(f"⚠️ User not found for transaction {transaction_id}")
+            return {"status": "processed"}
+
+        expires_at = user["subscription_expires"]
+        if credited:
+            print(f"✅ Subscription activated for user {user_id} - {subscription_type} until {expires_at}")
+
+        # Only the delivery that marks the transaction applied sends the confirmation
+        marked = await self._transactions.find_one_and_update(
+            {"paychangu_transaction_id": transaction_id, "subscription_applied_at": None},
+            {"$set": {"subscription_applied_at": now, "subscription_expires": expires_at}},
+            projection={"_id": 1}
+        )
+        if marked is None:
+            return {"status": "already_processed"}
+
+        email_queued = await self._on_subscription_applied(user, transaction)
+        await self._transactions.update_one(
+            {"paychangu_transaction_id": transaction_id},
+            {"$set": {
+                "confirmation_email_sent": email_queued,
+                "confirmation_email_sent_at": datetime.utcnow() if email_queued else None
+            }}
+        )
+        return {"status": "processed"}
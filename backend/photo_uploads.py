@@ -0,0 +1,205 @@
+"""Validated, streamed storage of uploaded profile photos.
+
+``PhotoStore.save`` copies an upload to the uploads directory in a worker
+thread, chunk by chunk, so large photos never block the event loop. The
+real image type is taken from the file's magic bytes (the client-supplied
+extension is ignored) and the pixel dimensions are read from the image
+header as soon as it has arrived; uploads that are too large in bytes or
+pixels are rejected at that point without reading the rest. Data goes to a
+temporary file that is renamed into place only once it is complete, so a
+failed or rejected upload never leaves a partial photo behind.
+
+``UploadSizeLimitMiddleware`` caps the request body of the upload routes:
+a declared Content-Length over the cap is refused before anything is read,
+and otherwise (including chunked uploads) the received bytes are counted
+and the request is cut off with 413 as soon as the cap is passed.
+"""
+import asyncio
+import os
+import uuid
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import JSONResponse
+
+# Extension stored for each accepted image type
+IMAGE_EXTENSIONS = {
+    "jpeg": "jpg",
+    "png": "png",
+    "webp": "webp",
+    "gif": "gif",
+}
+
+# JPEG start-of-frame markers carrying the image size (not DHT, JPG or DAC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# How much of the file may be scanned for the dimensions (JPEG EXIF blocks come first)
+HEADER_SCAN_BYTES = 512 * 1024
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """Image type from the leading magic bytes"""
+    if header.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if header.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+        return "webp"
+    if header[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return None
+
+
+def _jpeg_dimensions(data: bytes) -> Optional[Tuple[int, int]]:
+    i = 2
+    while i + 9 <= len(data):
+        if data[i] != 0xFF:
+            raise ValueError("Corrupt JPEG segment")
+        marker = data[i + 1]
+        if marker == 0xFF:
+            # Fill byte before a marker
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length field
+            i += 2
+            continue
+        if marker in JPEG_SOF_MARKERS:
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def read_dimensions(image_type: str, data: bytes) -> Optional[Tuple[int, int]]:
+    """(width, height) from the image header, or None if more data is needed"""
+    if image_type == "jpeg":
+        return _jpeg_dimensions(data)
+    if image_type == "png" and len(data) >= 24:
+        return int.from_bytes(data[16:20], "big"), int.from_bytes(data[20:24], "big")
+    if image_type == "gif" and len(data) >= 10:
+        return int.from_bytes(data[6:8], "little"), int.from_bytes(data[8:10], "little")
+    if image_type == "webp" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            return int.from_bytes(data[26:28], "little") & 0x3FFF, int.from_bytes(data[28:30], "little") & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+        raise ValueError("Unknown WebP chunk")
+    return None
+
+
+class PhotoStore:
+    """Writes validated photo uploads into one directory"""
+
+    def __init__(self, upload_dir: Path, max_bytes: int, max_pixels: int, chunk_size: int = 1024 * 1024):
+        self.upload_dir = upload_dir
+        self.max_bytes = max_bytes
+        self.max_pixels = max_pixels
+        self.chunk_size = chunk_size
+
+    def _too_large(self) -> HTTPException:
+        return HTTPException(status_code=413, detail=f"Photo must be at most {self.max_bytes / (1024 * 1024):.3g} MB")
+
+    def _check_dimensions(self, dimensions: Tuple[int, int]):
+        width, height = dimensions
+        if width <= 0 or height <= 0:
+            raise HTTPException(status_code=400, detail="Invalid image file")
+        if width * height > self.max_pixels:
+            raise HTTPException(status_code=413, detail=f"Photo must be at most {self.max_pixels / 1_000_000:.3g} megapixels")
+
+    def _store(self, source: BinaryIO, stem: str) -> str:
+        """Blocking copy with validation; runs in a worker thread"""
+        temp_path = self.upload_dir / f".{stem}.part"
+        header = b""
+        image_type = None
+        dimensions = None
+        written = 0
+        try:
+            with open(temp_path, "wb") as out:
+                while True:
+                    chunk = source.read(self.chunk_size)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > self.max_bytes:
+                        raise self._too_large()
+
+                    if dimensions is None:
+                        header += chunk[:HEADER_SCAN_BYTES - len(header)]
+                        if image_type is None and len(header) >= 12:
+                            image_type = sniff_image_type(header)
+                            if image_type is None:
+                                raise HTTPException(status_code=415, detail="Photo must be a JPEG, PNG, WebP or GIF image")
+                        if image_type is not None:
+                            try:
+                                dimensions = read_dimensions(image_type, header)
+                            except ValueError:
+                                raise HTTPException(status_code=400, detail="Invalid image file")
+                            if dimensions is not None:
+                                self._check_dimensions(dimensions)
+                            elif len(header) >= HEADER_SCAN_BYTES:
+                                raise HTTPException(status_code=400, detail="Invalid image file")
+
+                    out.write(chunk)
+                out.flush()
+                os.fsync(out.fileno())
+
+            if image_type is None or dimensions is None:
+                raise HTTPException(status_code=400, detail="Invalid image file")
+
+            filename = f"{stem}.{IMAGE_EXTENSIONS[image_type]}"
+            os.replace(temp_path, self.upload_dir / filename)
+            return filename
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    async def save(self, upload_file: UploadFile, user_id: str) -> str:
+        """Validate and store an upload; returns its public /uploads path"""
+        # The declared size is known up front when the upload was spooled
+        if getattr(upload_file, "size", None) is not None and upload_file.size > self.max_bytes:
+            raise self._too_large()
+
+        filename = await asyncio.to_thread(self._store, upload_file.file, f"{user_id}_{uuid.uuid4().hex}")
+        return f"/uploads/{filename}"
+
+
+class UploadSizeLimitMiddleware:
+    """ASGI middleware limiting the request body size on the given paths"""
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int, detail: str):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.max_bytes = max_bytes
+        self.detail = detail
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                response = JSONResponse(status_code=413, content={"detail": self.detail})
+                await response(scope, receive, send)
+                return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while the route reads its form, so it is answered like any HTTPException
+                    raise HTTPException(status_code=413, detail=self.detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
@@ -0,0 +1,129 @@
+"""User presence tracking.
+
+Heartbeats are recorded in a presence store instead of being written to the
+users collection one by one. The store answers "who is online" directly, and a
+background task flushes the latest ``last_activity`` per user to MongoDB in
+periodic bulk writes. ``PresenceStore`` is the extension point for a shared
+backend (e.g. Redis) when several API workers need one presence view.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+
+class PresenceStore(ABC):
+    """Interface for presence backends"""
+
+    @abstractmethod
+    async def touch(self, user_id: str, seen_at: datetime):
+        ...
+
+    @abstractmethod
+    async def last_seen(self, user_id: str) -> Optional[datetime]:
+        ...
+
+    @abstractmethod
+    async def seen_since(self, since: datetime, limit: int, exclude: Optional[str] = None) -> List[Tuple[str, datetime]]:
+        """Most recently seen users first, stopping at ``since``"""
+
+    @abstractmethod
+    async def drain_pending(self) -> Dict[str, datetime]:
+        """Return and clear heartbeats not yet persisted to MongoDB"""
+
+    @abstractmethod
+    async def requeue_pending(self, pending: Dict[str, datetime]):
+        """Put back heartbeats whose flush failed"""
+
+
+class InMemoryPresenceStore(PresenceStore):
+    """Process-local presence store ordered by recency with a TTL"""
+
+    def __init__(self, ttl_seconds: int):
+        self._ttl = timedelta(seconds=ttl_seconds)
+        self._last_seen: "OrderedDict[str, datetime]" = OrderedDict()
+        self._pending: Dict[str, datetime] = {}
+
+    def _expire(self, now: datetime):
+        cutoff = now - self._ttl
+        while self._last_seen:
+            user_id, seen_at = next(iter(self._last_seen.items()))
+            if seen_at >= cutoff:
+                break
+            del self._last_seen[user_id]
+
+    async def touch(self, user_id: str, seen_at: datetime):
+        self._last_seen[user_id] = seen_at
+        self._last_seen.move_to_end(user_id)
+        self._pending[user_id] = seen_at
+        self._expire(seen_at)
+
+    async def last_seen(self, user_id: str) -> Optional[datetime]:
+        return self._last_seen.get(user_id)
+
+    async def seen_since(self, since: datetime, limit: int, exclude: Optional[str] = None) -> List[Tuple[str, datetime]]:
+        self._expire(datetime.utcnow())
+        results = []
+        for user_id in reversed(self._last_seen):
+            seen_at = self._last_seen[user_id]
+            if seen_at < since or len(results) >= limit:
+                break
+            if user_id != exclude:
+                results.append((user_id, seen_at))
+        return results
+
+    async def drain_pending(self) -> Dict[str, datetime]:
+        pending, self._pending = self._pending, {}
+        return pending
+
+    async def requeue_pending(self, pending: Dict[str, datetime]):
+        for user_id, seen_at in pending.items():
+            if self._pending.get(user_id, seen_at) <= seen_at:
+                self._pending[user_id] = seen_at
+
+    def __len__(self):
+        return len(self._last_seen)
+
+
+class PresenceService:
+    """Records heartbeats and write-coalesces them into the users collection"""
+
+    def __init__(self, store: PresenceStore, users_collection, flush_interval_seconds: int):
+        self.store = store
+        self._users = users_collection
+        self._flush_interval = flush_interval_seconds
+
+    async def heartbeat(self, user_id: str):
+        await self.store.touch(user_id, datetime.utcnow())
+
+    async def flush(self) -> int:
+        """Persist pending heartbeats in one unordered bulk write"""
+        pending = await self.store.drain_pending()
+        if not pending:
+            return 0
+
+        updates = [
+            UpdateOne({"id": user_id}, {"$max": {"last_activity": seen_at}})
+            for user_id, seen_at in pending.items()
+        ]
+        try:
+            await self._users.bulk_write(updates, ordered=False)
+        except Exception as e:
+            # Put the heartbeats back so the next flush retries them
+            await self.store.requeue_pending(pending)
+            print(f"❌ Failed to flush presence heartbeats: {e}")
+            return 0
+        return len(updates)
+
+    async def run_flusher(self):
+        """Background loop flushing heartbeats until cancelled"""
+        try:
+            while True:
+                await asyncio.sleep(self._flush_interval)
+                await self.flush()
+        except asyncio.CancelledError:
+            await self.flush()
+            raise
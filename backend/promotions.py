@@ -0,0 +1,171 @@
+"""Weekly promotion calendar (Wednesday discount, Saturday happy hour, ...).
+
+Promotions are weekly windows in local (CAT) time. ``PromotionCalendar``
+works out which windows are active and when each one next starts, and keeps
+that result until the next window boundary, so a request only pays for
+reading the clock. Handlers take one ``PromotionSnapshot`` per request and
+read everything from it, which keeps pricing and entitlement answers
+consistent within the request.
+
+The built-in promotions can be replaced with a JSON list in the
+``PROMOTIONS`` setting, e.g.::
+
+    [{"key": "wednesday_discount", "name": "Wednesday 50% Off Special!",
+      "weekday": 2, "start": "00:00", "duration_minutes": 1440,
+      "discount_percentage": 50,
+      "description": "50% off all subscriptions every Wednesday!"}]
+"""
+import json
+from datetime import datetime, time, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import pytz
+
+
+class Promotion(NamedTuple):
+    key: str
+    name: str
+    weekday: int  # Monday = 0
+    start: time
+    duration: timedelta
+    description: str = ""
+    discount_percentage: int = 0
+    free_interactions: bool = False
+
+
+DEFAULT_PROMOTIONS = [
+    Promotion(
+        key="wednesday_discount",
+        name="Wednesday 50% Off Special!",
+        weekday=2,
+        start=time(0, 0),
+        duration=timedelta(days=1),
+        description="50% off all subscriptions every Wednesday!",
+        discount_percentage=50
+    ),
+    Promotion(
+        key="saturday_happy_hour",
+        name="Saturday Happy Hour (7-8 PM CAT)",
+        weekday=5,
+        start=time(19, 0),
+        duration=timedelta(hours=1),
+        description="Free premium interactions for ALL users every Saturday 7-8 PM CAT!",
+        free_interactions=True
+    ),
+]
+
+
+def load_promotions(raw: str) -> List[Promotion]:
+    """Parse the PROMOTIONS setting; an empty value keeps the built-in promotions"""
+    if not raw.strip():
+        return list(DEFAULT_PROMOTIONS)
+
+    promotions = []
+    for entry in json.loads(raw):
+        hour, minute = (int(part) for part in entry.get("start", "00:00").split(":"))
+        weekday = int(entry["weekday"])
+        if not 0 <= weekday <= 6:
+            raise ValueError(f"Invalid weekday for promotion {entry['key']}: {weekday}")
+        promotions.append(Promotion(
+            key=entry["key"],
+            name=entry.get("name", entry["key"]),
+            weekday=weekday,
+            start=time(hour, minute),
+            duration=timedelta(minutes=int(entry["duration_minutes"])),
+            description=entry.get("description", ""),
+            discount_percentage=int(entry.get("discount_percentage", 0)),
+            free_interactions=bool(entry.get("free_interactions", False))
+        ))
+    return promotions
+
+
+class PromotionSnapshot:
+    """Promotion state at one moment, read by a single request"""
+
+    def __init__(
+        self,
+        now: datetime,
+        promotions: List[Promotion],
+        active: Dict[str, datetime],
+        next_starts: Dict[str, datetime],
+        valid_until: Optional[datetime]
+    ):
+        self.now = now
+        self.valid_until = valid_until  # Next window boundary; identifies the current window
+        self.promotions = promotions
+        self._active = active
+        self._next_starts = next_starts
+
+    def is_active(self, key: str) -> bool:
+        return key in self._active
+
+    @property
+    def active_promotions(self) -> List[Promotion]:
+        return [promotion for promotion in self.promotions if promotion.key in self._active]
+
+    def active_until(self, key: str) -> Optional[datetime]:
+        return self._active.get(key)
+
+    def next_start(self, key: str) -> Optional[datetime]:
+        """Start of the next window that has not begun yet"""
+        return self._next_starts.get(key)
+
+    @property
+    def discount(self) -> Tuple[int, str]:
+        """Largest active discount percentage and its reason"""
+        best = max(
+            (promotion for promotion in self.active_promotions if promotion.discount_percentage > 0),
+            key=lambda promotion: promotion.discount_percentage,
+            default=None
+        )
+        return (best.discount_percentage, best.name) if best else (0, "")
+
+    @property
+    def free_interaction_promotion(self) -> Optional[Promotion]:
+        for promotion in self.active_promotions:
+            if promotion.free_interactions:
+                return promotion
+        return None
+
+
+class PromotionCalendar:
+    """Computes promotion windows once per window boundary"""
+
+    def __init__(self, promotions: List[Promotion], timezone_name: str):
+        self.promotions = promotions
+        self.timezone = pytz.timezone(timezone_name)
+        self._computed_at: Optional[datetime] = None
+        self._valid_until: Optional[datetime] = None
+        self._active: Dict[str, datetime] = {}
+        self._next_starts: Dict[str, datetime] = {}
+
+    def _latest_start(self, promotion: Promotion, now: datetime) -> datetime:
+        days_back = (now.weekday() - promotion.weekday) % 7
+        start = self.timezone.localize(datetime.combine(now.date() - timedelta(days=days_back), promotion.start))
+        if start > now:
+            start -= timedelta(days=7)
+        return start
+
+    def _compute(self, now: datetime):
+        active = {}
+        next_starts = {}
+        boundaries = []
+        for promotion in self.promotions:
+            start = self._latest_start(promotion, now)
+            end = start + promotion.duration
+            next_starts[promotion.key] = start + timedelta(days=7)
+            boundaries.append(next_starts[promotion.key])
+            if now < end:
+                active[promotion.key] = end
+                boundaries.append(end)
+        self._active = active
+        self._next_starts = next_starts
+        self._valid_until = min(boundaries) if boundaries else None
+
+    def snapshot(self, now: Optional[datetime] = None) -> PromotionSnapshot:
+        """Current promotion state; windows are recomputed only after a boundary passes"""
+        now = now.astimezone(self.timezone) if now else datetime.now(self.timezone)
+        if self._valid_until is None or not (self._computed_at <= now < self._valid_until):
+            self._compute(now)
+            self._computed_at = now
+        return PromotionSnapshot(now, self.promotions, self._active, self._next_starts, self._valid_until)
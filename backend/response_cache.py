@@ -0,0 +1,92 @@
+"""Pre-rendered responses for static reference endpoints.
+
+Payloads such as the country code list or the subscription tiers only change
+when a promotion window starts or ends. ``ResponseCache`` serialises each
+payload to JSON bytes once per cache key, derives a strong ETag from the
+bytes, and answers a matching ``If-None-Match`` with 304 and no body. Keys
+should include everything the payload depends on (e.g. the promotion window
+and the pricing tier); old keys fall out of the bounded LRU.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, NamedTuple, Optional
+
+from fastapi import Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response
+
+
+class RenderedResponse(NamedTuple):
+    body: bytes
+    etag: str
+
+
+def render_json(payload: Any) -> RenderedResponse:
+    """Serialise a payload the way FastAPI's JSONResponse does"""
+    body = json.dumps(
+        jsonable_encoder(payload),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":")
+    ).encode("utf-8")
+    return RenderedResponse(body, f'"{hashlib.sha256(body).hexdigest()[:32]}"')
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison, so a W/ prefix still matches
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any((candidate[2:] if candidate.startswith("W/") else candidate) == etag for candidate in candidates)
+
+
+class ResponseCache:
+    """LRU of rendered JSON payloads served with ETag validation"""
+
+    def __init__(self, max_entries: int = 64):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, RenderedResponse]" = OrderedDict()
+        self.hits = 0
+        self.renders = 0
+        self.not_modified = 0
+
+    def get_or_render(self, key: Hashable, build: Callable[[], Any]) -> RenderedResponse:
+        rendered = self._entries.get(key)
+        if rendered is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return rendered
+
+        rendered = render_json(build())
+        self.renders += 1
+        self._entries[key] = rendered
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return rendered
+
+    def respond(self, request: Request, key: Hashable, build: Callable[[], Any], max_age_seconds: int) -> Response:
+        """Serve the cached payload for ``key``, or 304 if the client already has it"""
+        rendered = self.get_or_render(key, build)
+        headers = {
+            "ETag": rendered.etag,
+            "Cache-Control": f"public, max-age={max(0, int(max_age_seconds))}"
+        }
+        if etag_matches(request.headers.get("if-none-match"), rendered.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=rendered.body, media_type="application/json", headers=headers)
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "renders": self.renders,
+            "not_modified": self.not_modified
+        }
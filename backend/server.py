@@ -3,36 +3,25 @@ import uuid
 import random
 import string
 import json
+import asyncio
+import hmac
 from datetime import datetime, timedelta
 from typing import Optional, List
-import pytz
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import smtplib
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Add OTP storage (in production, use Redis)
-otp_storage = {}
-password_reset_storage = {}  # Storage for password reset OTPs
-
 def generate_otp():
     """Generate a 6-digit OTP"""
     return ''.join(random.choices(string.digits, k=6))
 
-def send_email_otp(email, otp):
-    """Send OTP via email"""
+async def send_email_otp(email, otp):
+    """Queue the registration OTP email"""
     try:
-        if not EMAIL_USER or not EMAIL_PASSWORD:
+        if not EMAIL_ENABLED:
             print("⚠️ Email credentials not configured - using demo mode")
             return True
-            
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_USER
-        msg['To'] = email
-        msg['Subject'] = "NextChapter - Your Verification Code"
         
         html_body = f"""
         <html>
@@ -79,37 +68,25 @@ def send_email_otp(email, otp):
         </html>
         """
         
-        msg.attach(MIMEText(html_body, 'html'))
-        
-        # Connect to Gmail SMTP
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        
-        # Send email
-        server.send_message(msg)
-        server.quit()
-        
-        print(f"✅ OTP email sent to {email}")
+        await email_outbox.enqueue(
+            email, "NextChapter - Your Verification Code", html_body, EMAIL_USER, kind="registration_otp"
+        )
+        print(f"✅ OTP email queued for {email}")
         return True
         
     except Exception as e:
-        print(f"❌ Failed to send email: {str(e)}")
+        print(f"❌ Failed to queue email: {str(e)}")
         return False
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, status, Header, Request
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Query, status, Header, Request, WebSocket, WebSocketDisconnect
+from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr
-from pymongo import MongoClient
-import bcrypt
-import jwt
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from pathlib import Path
-import shutil
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 
 # Payment integration
 try:
@@ -127,8 +104,17 @@ except ImportError:
     paychangu = None
 
 # Environment variables
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
 JWT_SECRET = os.environ.get('JWT_SECRET', 'nextchapter-secret-key-2025')
+ACCESS_TOKEN_TTL_MINUTES = int(os.environ.get('ACCESS_TOKEN_TTL_MINUTES', 15))
+REFRESH_TOKEN_TTL_DAYS = int(os.environ.get('REFRESH_TOKEN_TTL_DAYS', 30))
+TOKEN_REVOCATION_SYNC_SECONDS = int(os.environ.get('TOKEN_REVOCATION_SYNC_SECONDS', 30))
+# How often an idle chat socket re-checks that its token was not revoked
+WS_SESSION_CHECK_SECONDS = float(os.environ.get('WS_SESSION_CHECK_SECONDS', 30))
+
+# Pending OTP storage: "mongo" is shared by all workers, "memory" is per process
+OTP_STORE = os.environ.get('OTP_STORE', 'mongo').lower()
+OTP_MEMORY_MAX_ENTRIES = int(os.environ.get('OTP_MEMORY_MAX_ENTRIES', 100000))
+OTP_SWEEP_INTERVAL_SECONDS = int(os.environ.get('OTP_SWEEP_INTERVAL_SECONDS', 60))
 STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY', '')
 STRIPE_PREMIUM_PRICE_ID = os.environ.get('STRIPE_PREMIUM_PRICE_ID', '')
 STRIPE_VIP_PRICE_ID = os.environ.get('STRIPE_VIP_PRICE_ID', '')
@@ -139,14 +125,75 @@ EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 587))
 EMAIL_USER = os.environ.get('EMAIL_USER', '')
 EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD', '')
 
+# Outbound email: "smtp" sends through EMAIL_HOST, "memory" records messages locally
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'smtp').lower()
+EMAIL_WORKERS = int(os.environ.get('EMAIL_WORKERS', 2))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 5))
+EMAIL_RETRY_BASE_SECONDS = float(os.environ.get('EMAIL_RETRY_BASE_SECONDS', 30))
+EMAIL_POLL_SECONDS = float(os.environ.get('EMAIL_POLL_SECONDS', 5))
+EMAIL_ENABLED = EMAIL_BACKEND == 'memory' or bool(EMAIL_USER and EMAIL_PASSWORD)
+
 # Paychangu configuration
 PAYCHANGU_PUBLIC_KEY = os.environ.get('PAYCHANGU_PUBLIC_KEY', '')
 PAYCHANGU_SECRET_KEY = os.environ.get('PAYCHANGU_SECRET_KEY', '')
 PAYCHANGU_BASE_URL = os.environ.get('PAYCHANGU_BASE_URL', 'https://api.paychangu.com')
+PAYCHANGU_TIMEOUT_SECONDS = float(os.environ.get('PAYCHANGU_TIMEOUT_SECONDS', 15))
+PAYCHANGU_MAX_RETRIES = int(os.environ.get('PAYCHANGU_MAX_RETRIES', 2))
+PAYCHANGU_RETRY_BACKOFF_SECONDS = float(os.environ.get('PAYCHANGU_RETRY_BACKOFF_SECONDS', 0.5))
+PAYCHANGU_MAX_CONNECTIONS = int(os.environ.get('PAYCHANGU_MAX_CONNECTIONS', 20))
+PAYCHANGU_BREAKER_THRESHOLD = int(os.environ.get('PAYCHANGU_BREAKER_THRESHOLD', 5))
+PAYCHANGU_BREAKER_RESET_SECONDS = float(os.environ.get('PAYCHANGU_BREAKER_RESET_SECONDS', 30))
+
+# Webhook inbox workers
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('WEBHOOK_MAX_ATTEMPTS', 8))
+WEBHOOK_RETRY_BASE_SECONDS = float(os.environ.get('WEBHOOK_RETRY_BASE_SECONDS', 5))
+WEBHOOK_POLL_SECONDS = float(os.environ.get('WEBHOOK_POLL_SECONDS', 2))
+
+# In-memory candidate index for profile browsing
+CANDIDATE_INDEX_ENABLED = os.environ.get('CANDIDATE_INDEX_ENABLED', 'false').lower() == 'true'
+CANDIDATE_INDEX_REFRESH_SECONDS = int(os.environ.get('CANDIDATE_INDEX_REFRESH_SECONDS', 300))
+
+# Presence tracking (heartbeats are kept in memory and flushed to Mongo in bulk)
+PRESENCE_TTL_SECONDS = int(os.environ.get('PRESENCE_TTL_SECONDS', 600))
+PRESENCE_FLUSH_SECONDS = int(os.environ.get('PRESENCE_FLUSH_SECONDS', 60))
+
+# Authenticated user cache (per process)
+USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 10000))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', 30))
+
+# Scheduled downgrade of lapsed subscriptions
+SUBSCRIPTION_SWEEP_SECONDS = float(os.environ.get('SUBSCRIPTION_SWEEP_SECONDS', 60))
+SUBSCRIPTION_SWEEP_BATCH_SIZE = int(os.environ.get('SUBSCRIPTION_SWEEP_BATCH_SIZE', 500))
+
+# Token required to read /api/metrics (the endpoint is disabled when unset)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Weekly promotions (JSON list, see promotions.py; empty keeps Wednesday discount and Saturday happy hour)
+PROMOTIONS = os.environ.get('PROMOTIONS', '')
+PROMOTION_TIMEZONE = os.environ.get('PROMOTION_TIMEZONE', 'Africa/Maputo')  # CAT
+
+# Browser cache lifetime for reference data that does not depend on promotions
+REFERENCE_CACHE_MAX_AGE_SECONDS = int(os.environ.get('REFERENCE_CACHE_MAX_AGE_SECONDS', 86400))
 
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Photo upload limits
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+UPLOAD_MAX_PIXELS = int(os.environ.get('UPLOAD_MAX_PIXELS', 40_000_000))
+UPLOAD_CHUNK_BYTES = int(os.environ.get('UPLOAD_CHUNK_BYTES', 1024 * 1024))
+# Multipart bodies may exceed the photo size by this much for the other form fields
+UPLOAD_FORM_OVERHEAD_BYTES = 1024 * 1024
+# Routes accepting photo uploads; their bodies are capped by UploadSizeLimitMiddleware
+UPLOAD_PATHS = ["/api/profile/setup"]
+
+from photo_uploads import PhotoStore, UploadSizeLimitMiddleware
+
+# Resized WebP variants of profile photos (requires Pillow)
+IMAGE_PIPELINE_WORKERS = int(os.environ.get('IMAGE_PIPELINE_WORKERS', 2))
+PHOTO_VARIANT_QUALITY = int(os.environ.get('PHOTO_VARIANT_QUALITY', 80))
+
 # Country codes for international support
 COUNTRY_CODES = {
     "US": {"flag": "🇺🇸", "code": "+1", "name": "United States"},
@@ -227,29 +274,14 @@ SUBSCRIPTION_FEATURES = [
     "Special offers and discounts"
 ]
 
-def get_current_cat_time():
-    """Get current time in CAT (Central Africa Time)"""
-    cat_tz = pytz.timezone('Africa/Maputo')  # CAT timezone
-    return datetime.now(cat_tz)
-
-def is_wednesday_discount():
-    """Check if it's Wednesday (50% discount day)"""
-    cat_time = get_current_cat_time()
-    return cat_time.weekday() == 2  # Wednesday = 2
+from promotions import PromotionCalendar, PromotionSnapshot, load_promotions
 
-def is_saturday_happy_hour():
-    """Check if it's Saturday 7-8 PM CAT (free interaction hour)"""
-    cat_time = get_current_cat_time()
-    return cat_time.weekday() == 5 and 19 <= cat_time.hour < 20  # Saturday = 5, 7-8 PM
+# Promotion windows are recomputed only when one starts or ends
+promotion_calendar = PromotionCalendar(load_promotions(PROMOTIONS), PROMOTION_TIMEZONE)
 
-def calculate_discounted_price(price, country_code="default"):
-    """Calculate price with applicable discounts (Wednesday only)"""
-    discount = 0
-    discount_reason = ""
-    
-    if is_wednesday_discount():
-        discount = 50
-        discount_reason = "Wednesday 50% Off Special!"
+def calculate_discounted_price(price, promotions: PromotionSnapshot):
+    """Calculate price with the largest active promotion discount"""
+    discount, discount_reason = promotions.discount
     
     if discount > 0:
         discounted_amount = price * (1 - discount / 100)
@@ -269,11 +301,9 @@ def calculate_discounted_price(price, country_code="default"):
         "has_discount": False
     }
 
-def is_free_interaction_time():
-    """Check if it's free interaction time (Saturday 7-8 PM CAT)"""
-    return is_saturday_happy_hour()
-
 import math
+import re
+from geo import location_to_geo_point, parse_location_coordinates
 
 def calculate_distance(lat1, lon1, lat2, lon2):
     """Calculate distance between two coordinates in kilometers using Haversine formula"""
@@ -294,11 +324,20 @@ def calculate_distance(lat1, lon1, lat2, lon2):
     
     return c * r
 
+# Location keywords that identify a Malawian user
+MALAWIAN_LOCATION_KEYWORDS = ("malawi", "lilongwe", "blantyre")
+
+# Matching radius per subscription tier (VIP users match Malawians worldwide)
+LOCAL_MATCH_RADIUS_KM = {
+    "free": 300,
+    "premium": 500
+}
+
 def is_malawian_user(user_location, phone_country):
     """Check if user is Malawian based on location or phone country"""
     if phone_country == "MW":
         return True
-    if user_location and ("malawi" in user_location.lower() or "lilongwe" in user_location.lower() or "blantyre" in user_location.lower()):
+    if user_location and any(keyword in user_location.lower() for keyword in MALAWIAN_LOCATION_KEYWORDS):
         return True
     return False
 
@@ -326,10 +365,7 @@ def is_within_local_area(user_location, target_location, subscription_tier, user
             distance = calculate_distance(user_lat, user_lon, target_lat, target_lon)
             
             # Updated distances for Malawian users: Free 300km, Premium 500km
-            if subscription_tier == "premium":
-                max_distance = 500
-            else:  # free tier
-                max_distance = 300
+            max_distance = LOCAL_MATCH_RADIUS_KM.get(subscription_tier, LOCAL_MATCH_RADIUS_KM["free"])
                 
             return distance <= max_distance
         else:
@@ -344,6 +380,71 @@ def is_within_local_area(user_location, target_location, subscription_tier, user
         target_city = target_location.split(',')[0].strip().lower()
         return user_city == target_city
 
+def malawian_user_query():
+    """Mongo filter equivalent to is_malawian_user for candidate profiles"""
+    return {
+        "$or": [
+            {"phone_country": "MW"},
+            {"location": {"$regex": "|".join(MALAWIAN_LOCATION_KEYWORDS), "$options": "i"}}
+        ]
+    }
+
+def same_city_query(user_location):
+    """Mongo filter for profiles in the same city when coordinates are unavailable"""
+    user_city = user_location.split(',')[0].strip()
+    return {"location": {"$regex": f"^\\s*{re.escape(user_city)}\\s*(,|$)", "$options": "i"}}
+
+# Total profiles per browse deck (VIP users get unlimited profiles)
+PROFILE_LIMITS = {
+    "free": 10,
+    "premium": 50
+}
+
+# Fields shown on a match card
+MATCH_CARD_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "name": 1,
+    "age": 1,
+    "location": 1,
+    "bio": 1,
+    "looking_for": 1,
+    "interests": 1,
+    "main_photo": 1,
+    "photo_variants": 1,
+    "additional_photos": 1,
+    "subscription_tier": 1,
+    "last_activity": 1
+}
+
+# Matches returned per page
+MATCH_PAGE_SIZE = 50
+MATCH_PAGE_SIZE_MAX = 100
+
+# Messages returned per history page
+MESSAGE_PAGE_SIZE = 50
+MESSAGE_PAGE_SIZE_MAX = 200
+
+# Profiles returned per browse page
+PROFILE_PAGE_SIZE = 10
+PROFILE_PAGE_SIZE_MAX = 50
+
+# Fields never exposed on another user's profile card
+PROFILE_CARD_PROJECTION = {
+    "_id": 0,
+    "password": 0,
+    "email": 0,
+    "geo": 0,
+    "applied_payment_refs": 0
+}
+
+# The authenticated user's own record, as cached for request handlers
+AUTH_USER_PROJECTION = {
+    "_id": 0,
+    "password": 0,
+    "applied_payment_refs": 0
+}
+
 def get_matching_scope_description(subscription_tier):
     """Get human-readable description of user's matching scope"""
     
@@ -352,7 +453,7 @@ def get_matching_scope_description(subscription_tier):
     else:
         return "Basic matching capabilities - upgrade for unlimited access"
 
-def can_user_interact_freely(user):
+def can_user_interact_freely(user, promotions: Optional[PromotionSnapshot] = None):
     """Check if user can interact freely (premium subscription or free interaction time)"""
     subscription_tier = user.get("subscription_tier", "free")
     
@@ -360,15 +461,24 @@ def can_user_interact_freely(user):
     if subscription_tier == "premium":
         return True, "Premium subscriber - unlimited access"
     
-    # Check if it's Saturday happy hour (7-8 PM CAT)
-    if is_saturday_happy_hour():
-        return True, "Saturday Happy Hour (7-8 PM CAT) - Free interactions for everyone!"
+    # Free-interaction promotions such as Saturday happy hour (7-8 PM CAT)
+    free_promotion = (promotions or promotion_calendar.snapshot()).free_interaction_promotion
+    if free_promotion:
+        return True, f"{free_promotion.name} - Free interactions for everyone!"
     
     return False, "Free tier user outside of happy hour"
 
 # FastAPI app
 app = FastAPI(title="NextChapter Dating API", version="1.0.0")
 
+# Cap photo upload bodies while they are received, not only by their declared length
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=UPLOAD_PATHS,
+    max_bytes=UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES,
+    detail=f"Photo must be at most {UPLOAD_MAX_BYTES / (1024 * 1024):.3g} MB"
+)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -376,22 +486,176 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Before-Cursor", "X-After-Cursor"],
 )
 
 # Static files for uploaded images
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
-# MongoDB connection
-try:
-    client = MongoClient(MONGO_URL)
-    db = client.nextchapter
-    users_collection = db.users
-    likes_collection = db.likes
-    matches_collection = db.matches
-    messages_collection = db.messages
-    print("✅ Connected to MongoDB successfully")
-except Exception as e:
-    print(f"❌ Failed to connect to MongoDB: {e}")
+# MongoDB connection (async Motor collections shared by every route)
+from database import (
+    db,
+    users_collection,
+    likes_collection,
+    matches_collection,
+    messages_collection,
+    transactions_collection,
+    revoked_tokens_collection,
+    otp_codes_collection,
+    email_outbox_collection,
+    webhook_inbox_collection,
+    ping_database,
+    close_database,
+)
+from indexes import bootstrap_schema, match_key_for
+from candidate_index import CandidateIndex, NUMPY_AVAILABLE
+from chat_gateway import chat_manager, WS_CLOSE_UNAUTHORIZED
+from presence import InMemoryPresenceStore, PresenceService
+from user_cache import UserCache
+from passwords import hash_password, verify_password, password_hasher
+from auth_tokens import TokenRevocationList, TokenService, has_entitlement_claims, entitlements_from_claims
+from otp_store import InMemoryOtpStore, create_otp_store, REGISTRATION, PASSWORD_RESET
+from email_outbox import EmailOutbox, MemoryTransport, SmtpTransport
+from paychangu_client import CircuitBreaker, PaychanguClient, PaymentGatewayUnavailable
+from webhook_inbox import WebhookInbox
+from payments import PaymentProcessor, webhook_transaction_ref
+from subscriptions import SubscriptionExpirySweeper
+from response_cache import ResponseCache
+from cursors import CursorCodec, validate_profile_cursor
+from image_pipeline import ImagePipeline, select_photo_size
+import httpx
+
+# Optional vectorized candidate index (falls back to Mongo queries when disabled)
+candidate_index = CandidateIndex(is_malawian_user) if CANDIDATE_INDEX_ENABLED and NUMPY_AVAILABLE else None
+
+# Online presence answered from memory; last_activity is persisted in periodic bulk writes
+presence_service = PresenceService(
+    InMemoryPresenceStore(PRESENCE_TTL_SECONDS),
+    users_collection,
+    PRESENCE_FLUSH_SECONDS
+)
+
+# Authenticated user records, invalidated wherever a user document is updated
+user_cache = UserCache(USER_CACHE_SIZE, USER_CACHE_TTL_SECONDS)
+
+# Short-lived access tokens with entitlement claims plus rotating refresh tokens
+token_service = TokenService(
+    JWT_SECRET,
+    timedelta(minutes=ACCESS_TOKEN_TTL_MINUTES),
+    timedelta(days=REFRESH_TOKEN_TTL_DAYS),
+    TokenRevocationList(revoked_tokens_collection, TOKEN_REVOCATION_SYNC_SECONDS)
+)
+
+# Pagination cursors are signed so clients cannot rewrite their continuation state
+cursor_codec = CursorCodec(JWT_SECRET)
+
+# Pending registration and password reset codes
+otp_store = create_otp_store(OTP_STORE, otp_codes_collection, OTP_MEMORY_MAX_ENTRIES, OTP_SWEEP_INTERVAL_SECONDS)
+
+# Emails are queued by handlers and sent by background workers
+memory_email_transport = MemoryTransport()
+email_outbox = EmailOutbox(
+    email_outbox_collection,
+    (lambda: memory_email_transport) if EMAIL_BACKEND == 'memory'
+    else (lambda: SmtpTransport(EMAIL_HOST, EMAIL_PORT, EMAIL_USER, EMAIL_PASSWORD)),
+    EMAIL_WORKERS,
+    EMAIL_MAX_ATTEMPTS,
+    EMAIL_RETRY_BASE_SECONDS,
+    EMAIL_POLL_SECONDS
+)
+
+# Shared keep-alive client for the payment gateway
+paychangu_client = PaychanguClient(
+    PAYCHANGU_BASE_URL,
+    PAYCHANGU_SECRET_KEY,
+    PAYCHANGU_TIMEOUT_SECONDS,
+    PAYCHANGU_MAX_RETRIES,
+    PAYCHANGU_RETRY_BACKOFF_SECONDS,
+    CircuitBreaker(PAYCHANGU_BREAKER_THRESHOLD, PAYCHANGU_BREAKER_RESET_SECONDS),
+    max_connections=PAYCHANGU_MAX_CONNECTIONS
+)
+
+# Webhooks are acknowledged on receipt and applied by inbox workers
+payment_processor = PaymentProcessor(
+    transactions_collection,
+    users_collection,
+    user_cache.invalidate,
+    lambda user, transaction: confirm_subscription_payment(user, transaction)
+)
+
+webhook_inbox = WebhookInbox(
+    webhook_inbox_collection,
+    payment_processor.process_webhook,
+    WEBHOOK_WORKERS,
+    WEBHOOK_MAX_ATTEMPTS,
+    WEBHOOK_RETRY_BASE_SECONDS,
+    WEBHOOK_POLL_SECONDS
+)
+
+# Lapsed subscriptions are downgraded in the background; cached records are dropped
+subscription_sweeper = SubscriptionExpirySweeper(users_collection, SUBSCRIPTION_SWEEP_SECONDS, SUBSCRIPTION_SWEEP_BATCH_SIZE)
+subscription_sweeper.on_expired(user_cache.invalidate)
+
+# Pre-rendered reference payloads, keyed by promotion window where pricing depends on it
+reference_cache = ResponseCache()
+
+# Photo uploads are validated and streamed to disk in a worker thread
+photo_store = PhotoStore(UPLOAD_DIR, UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS, UPLOAD_CHUNK_BYTES)
+
+# Photo variants are rendered in worker processes; the cached user is dropped once they are recorded
+image_pipeline = ImagePipeline(UPLOAD_DIR, users_collection, IMAGE_PIPELINE_WORKERS, PHOTO_VARIANT_QUALITY, user_cache.invalidate)
+
+# Long-running tasks started with the app and cancelled on shutdown
+background_tasks = []
+
+async def refresh_candidate_index():
+    """Periodically reload the candidate index so profile changes on other workers are picked up"""
+    while True:
+        await asyncio.sleep(CANDIDATE_INDEX_REFRESH_SECONDS)
+        try:
+            await candidate_index.load(users_collection)
+        except Exception as e:
+            print(f"❌ Candidate index refresh failed: {e}")
+
+@app.on_event("startup")
+async def connect_database():
+    try:
+        await ping_database()
+        print("✅ Connected to MongoDB successfully")
+    except Exception as e:
+        print(f"❌ Failed to connect to MongoDB: {e}")
+    
+    # Apply pending migrations and refuse to serve without the required indexes
+    await bootstrap_schema(db)
+    
+    if candidate_index is not None:
+        await candidate_index.load(users_collection)
+        background_tasks.append(asyncio.create_task(refresh_candidate_index()))
+    
+    background_tasks.append(asyncio.create_task(presence_service.run_flusher()))
+    
+    await token_service.revocations.load()
+    background_tasks.append(asyncio.create_task(token_service.revocations.run_sync()))
+    
+    if isinstance(otp_store, InMemoryOtpStore):
+        background_tasks.append(asyncio.create_task(otp_store.run_sweeper()))
+    
+    if EMAIL_ENABLED:
+        background_tasks.extend(email_outbox.start())
+    
+    background_tasks.extend(webhook_inbox.start())
+    background_tasks.append(asyncio.create_task(subscription_sweeper.run()))
+
+@app.on_event("shutdown")
+async def disconnect_database():
+    # Let background tasks finish their final flush before the pool closes
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    password_hasher.shutdown()
+    await image_pipeline.aclose()
+    await paychangu_client.aclose()
+    close_database()
 
 # Security
 security = HTTPBearer()
@@ -409,6 +673,12 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class ProfileSetup(BaseModel):
     location: str
     bio: str
@@ -457,7 +727,7 @@ class PaychanguPaymentResponse(BaseModel):
 @app.post("/api/verify-registration")
 async def verify_registration(verification: EmailVerification):
     # Check if OTP exists for this email
-    stored_otp_data = otp_storage.get(verification.email)
+    stored_otp_data = await otp_store.get(REGISTRATION, verification.email)
     
     if not stored_otp_data:
         raise HTTPException(status_code=404, detail="No pending registration found for this email")
@@ -465,7 +735,7 @@ async def verify_registration(verification: EmailVerification):
     # Check if OTP has expired
     if datetime.utcnow() > stored_otp_data["expires_at"]:
         # Clean up expired OTP
-        del otp_storage[verification.email]
+        await otp_store.delete(REGISTRATION, verification.email)
         raise HTTPException(status_code=400, detail="Verification code has expired. Please register again.")
     
     # Verify OTP
@@ -486,14 +756,18 @@ async def verify_registration(verification: EmailVerification):
     user_data["id"] = user_id
     user_data["email_verified"] = True
     
-    # Insert user into database
-    users_collection.insert_one(user_data)
+    # Insert user into database; a double submit or concurrent verify hits the unique email index
+    try:
+        await users_collection.insert_one(user_data)
+    except DuplicateKeyError:
+        await otp_store.delete(REGISTRATION, verification.email)
+        raise HTTPException(status_code=400, detail="Email already registered")
     
     # Clean up OTP storage
-    del otp_storage[verification.email]
+    await otp_store.delete(REGISTRATION, verification.email)
     
-    # Generate JWT token
-    token = create_jwt_token(user_id)
+    # Generate access and refresh tokens
+    tokens = token_service.issue_tokens(user_data)
     
     # Return user data (without password)
     user_data.pop('password', None)
@@ -501,7 +775,7 @@ async def verify_registration(verification: EmailVerification):
     
     return {
         "message": "Email verified successfully! Welcome to NextChapter!",
-        "token": token,
+        **tokens,
         "user": UserResponse(**user_data)
     }
 
@@ -516,12 +790,12 @@ async def request_password_reset(request: PasswordResetRequest):
     identifier = None
     
     if request.email:
-        user = users_collection.find_one({"email": request.email})
+        user = await users_collection.find_one({"email": request.email})
         identifier = request.email
     elif request.phone_number and request.phone_country:
         # Normalize phone number for consistency
         phone_key = f"{request.phone_country}:{request.phone_number}"
-        user = users_collection.find_one({"phone_number": phone_key})
+        user = await users_collection.find_one({"phone_number": phone_key})
         identifier = phone_key
     
     if not user:
@@ -535,19 +809,19 @@ async def request_password_reset(request: PasswordResetRequest):
     # Generate and store OTP for password reset
     otp = generate_otp()
     reset_key = identifier
-    password_reset_storage[reset_key] = {
+    await otp_store.put(PASSWORD_RESET, reset_key, {
         "otp": otp,
         "created_at": datetime.utcnow(),
         "expires_at": datetime.utcnow() + timedelta(seconds=150),  # 2 minutes 30 seconds OTP timer
         "user_id": user["id"],
         "identifier": identifier,
         "identifier_type": "email" if request.email else "phone"
-    }
+    })
     
     # Send OTP via email (for now, we'll focus on email recovery)
     email_sent = False
     if request.email:
-        email_sent = send_password_reset_email(request.email, otp)
+        email_sent = await send_password_reset_email(request.email, otp)
     
     # For phone recovery, we would need SMS service integration
     # This would be implemented based on specific SMS provider
@@ -585,14 +859,14 @@ async def reset_password(reset_request: PasswordReset):
         raise HTTPException(status_code=400, detail="Invalid identifier")
     
     # Check if reset request exists
-    reset_data = password_reset_storage.get(identifier)
+    reset_data = await otp_store.get(PASSWORD_RESET, identifier)
     if not reset_data:
         raise HTTPException(status_code=404, detail="No password reset request found")
     
     # Check if OTP has expired
     if datetime.utcnow() > reset_data["expires_at"]:
         # Clean up expired OTP
-        del password_reset_storage[identifier]
+        await otp_store.delete(PASSWORD_RESET, identifier)
         raise HTTPException(status_code=400, detail="Password reset code has expired. Please request a new one.")
     
     # Verify OTP
@@ -612,35 +886,31 @@ async def reset_password(reset_request: PasswordReset):
         raise HTTPException(status_code=400, detail="Password must be at least 6 characters long")
     
     # Update user password
-    hashed_password = hash_password(reset_request.new_password)
-    result = users_collection.update_one(
+    hashed_password = await hash_password(reset_request.new_password)
+    result = await users_collection.update_one(
         {"id": reset_data["user_id"]},
         {"$set": {"password": hashed_password}}
     )
+    user_cache.invalidate(reset_data["user_id"])
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="User not found")
     
     # Clean up password reset storage
-    del password_reset_storage[identifier]
+    await otp_store.delete(PASSWORD_RESET, identifier)
     
     return {
         "message": "Password reset successful! You can now log in with your new password.",
         "success": True
     }
 
-def send_password_reset_email(email: str, otp: str) -> bool:
-    """Send password reset OTP via email"""
+async def send_password_reset_email(email: str, otp: str) -> bool:
+    """Queue the password reset OTP email"""
     try:
-        if not EMAIL_USER or not EMAIL_PASSWORD:
+        if not EMAIL_ENABLED:
             print(f"⚠️ Email not configured. Demo OTP for password reset: {otp}")
             return False
         
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = 'NextChapter - Password Reset Code'
-        msg['From'] = f"NextChapter <{EMAIL_USER}>"
-        msg['To'] = email
-        
         # Create HTML email body
         html_body = f"""
         <!DOCTYPE html>
@@ -688,22 +958,14 @@ def send_password_reset_email(email: str, otp: str) -> bool:
         </html>
         """
         
-        msg.attach(MIMEText(html_body, 'html'))
-        
-        # Connect to Gmail SMTP
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        
-        # Send email
-        server.send_message(msg)
-        server.quit()
-        
-        print(f"✅ Password reset email sent to {email}")
+        await email_outbox.enqueue(
+            email, 'NextChapter - Password Reset Code', html_body, f"NextChapter <{EMAIL_USER}>", kind="password_reset"
+        )
+        print(f"✅ Password reset email queued for {email}")
         return True
         
     except Exception as e:
-        print(f"❌ Failed to send password reset email: {str(e)}")
+        print(f"❌ Failed to queue password reset email: {str(e)}")
         return False
 
 class UserResponse(BaseModel):
@@ -716,57 +978,143 @@ class UserResponse(BaseModel):
     looking_for: Optional[str] = None
     interests: Optional[List[str]] = []
     main_photo: Optional[str] = None
+    photo_variants: Optional[dict] = None
     additional_photos: Optional[List[str]] = []
     created_at: datetime
 
 # Helper functions
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+def parse_profile_cursor(cursor: Optional[str]) -> dict:
+    """Verify a /api/profiles cursor and validate the fields it carries"""
+    return validate_profile_cursor(cursor_codec.decode(cursor)) if cursor else {}
 
-def create_jwt_token(user_id: str) -> str:
-    payload = {
-        'user_id': user_id,
-        'exp': datetime.utcnow() + timedelta(days=30)
-    }
-    return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
+async def authenticate_token(token: str):
+    """Resolve the user for a JWT; raises 401 if the token or user is invalid"""
+    return await authenticate_claims(token_service.decode(token))
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def authenticate_claims(claims: dict):
+    """Resolve the user for verified token claims; raises 401 if the user is gone"""
     try:
-        payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=['HS256'])
-        user_id = payload.get('user_id')
-        if user_id is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
+        user_id = claims['user_id']
         
-        user = users_collection.find_one({"id": user_id})
+        user = user_cache.get(user_id)
         if user is None:
-            raise HTTPException(status_code=401, detail="User not found")
+            user = await users_collection.find_one({"id": user_id}, AUTH_USER_PROJECTION)
+            if user is None:
+                raise HTTPException(status_code=401, detail="User not found")
+            user_cache.set(user_id, user)
         
         return user
-    except jwt.exceptions.ExpiredSignatureError:
-        raise HTTPException(status_code=401, detail="Token expired")
-    except jwt.exceptions.InvalidTokenError:
-        raise HTTPException(status_code=401, detail="Invalid token")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Authentication error: {str(e)}")
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    return await authenticate_token(credentials.credentials)
+
+async def get_token_claims(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Lightweight auth for endpoints that only need the caller's id (no user lookup)"""
+    return token_service.decode(credentials.credentials)
+
+async def get_entitlements(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Subscription entitlements from the access token, falling back to the user record for legacy tokens"""
+    claims = token_service.decode(credentials.credentials)
+    if has_entitlement_claims(claims):
+        return entitlements_from_claims(claims)
+    return await authenticate_token(credentials.credentials)
+
+def has_active_messaging(user: dict) -> bool:
+    """Whether a user's premium subscription currently allows messaging"""
+    subscription_expires = user.get("subscription_expires")
+    return bool(
+        user.get("subscription_tier", "free") == "premium" and
+        user.get("subscription_status", "inactive") == "active" and
+        subscription_expires and
+        subscription_expires > datetime.utcnow() and
+        user.get("can_message", False)
+    )
+
+def other_participant(match: dict, user_id: str) -> str:
+    """Return the id of the other user in a match"""
+    return match['user2_id'] if match['user1_id'] == user_id else match['user1_id']
+
+async def deliver_chat_message(sender_id: str, match_id: str, content: str):
+    """Persist a chat message and push it to both participants in real time"""
+    sent_at = datetime.utcnow()
+    
+    # Verify match exists and user is part of it, bumping its activity time in the same round trip
+    match = await matches_collection.find_one_and_update({
+        "id": match_id,
+        "$or": [
+            {"user1_id": sender_id},
+            {"user2_id": sender_id}
+        ]
+    }, {"$set": {"last_activity_at": sent_at}}, projection={"_id": 0, "user1_id": 1, "user2_id": 1})
+    
+    if not match:
+        raise HTTPException(status_code=404, detail="Match not found")
+    
+    # Create message
+    message_doc = {
+        "id": str(uuid.uuid4()),
+        "match_id": match_id,
+        "sender_id": sender_id,
+        "content": content,
+        "created_at": sent_at,
+        "read": False
+    }
+    
+    await messages_collection.insert_one(message_doc)
+    message_doc.pop('_id', None)
+    
+    # Offline recipients pick the message up from the history endpoint
+    recipient_id = other_participant(match, sender_id)
+    delivery = await chat_manager.send_to_users([sender_id, recipient_id], {"type": "message", "message": message_doc})
+    
+    return message_doc, delivery.get(recipient_id, False)
+
+async def mark_match_messages_read(
+    match: dict,
+    reader_id: str,
+    up_to: Optional[datetime] = None,
+    up_to_id: Optional[str] = None
+):
+    """Mark the other participant's messages as read and send them a read receipt.
+    
+    With ``up_to`` (and ``up_to_id`` to break timestamp ties) only messages up to
+    that point in the conversation are marked, older unread ones included.
+    """
+    read_query = {
+        "match_id": match['id'],
+        "sender_id": {"$ne": reader_id},
+        "read": False
+    }
+    if up_to is not None and up_to_id is not None:
+        read_query["$or"] = [
+            {"created_at": {"$lt": up_to}},
+            {"created_at": up_to, "id": {"$lte": up_to_id}}
+        ]
+    elif up_to is not None:
+        read_query["created_at"] = {"$lte": up_to}
+    
+    result = await messages_collection.update_many(read_query, {"$set": {"read": True}})
+    
+    if result.modified_count:
+        await chat_manager.send_to_user(other_participant(match, reader_id), {
+            "type": "read",
+            "match_id": match['id'],
+            "reader_id": reader_id,
+            "up_to": up_to or datetime.utcnow()
+        })
+    
+    return result.modified_count
+
 async def save_upload_file(upload_file: UploadFile, user_id: str) -> str:
     """Save uploaded file and return the file path"""
     if not upload_file:
         return None
     
-    # Generate unique filename
-    file_extension = upload_file.filename.split('.')[-1] if '.' in upload_file.filename else 'jpg'
-    filename = f"{user_id}_{uuid.uuid4().hex}.{file_extension}"
-    file_path = UPLOAD_DIR / filename
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(upload_file.file, buffer)
-    
-    return f"/uploads/{filename}"
+    return await photo_store.save(upload_file, user_id)
 
 # API Routes
 
@@ -774,10 +1122,30 @@ async def save_upload_file(upload_file: UploadFile, user_id: str) -> str:
 async def root():
     return {"message": "NextChapter Dating API is running! 💕"}
 
+@app.get("/api/metrics")
+async def get_metrics(x_metrics_token: Optional[str] = Header(None)):
+    """Process-local cache and connection metrics"""
+    if not METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_metrics_token or not hmac.compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid metrics token")
+
+    return {
+        "user_cache": user_cache.stats(),
+        "password_hashing": password_hasher.stats(),
+        "email_outbox": email_outbox.stats(),
+        "paychangu": paychangu_client.stats(),
+        "webhook_inbox": await webhook_inbox.stats(),
+        "subscription_expiry": subscription_sweeper.stats(),
+        "reference_cache": reference_cache.stats(),
+        "image_pipeline": image_pipeline.stats(),
+        "chat_connections": chat_manager.connection_count
+    }
+
 @app.post("/api/register")
 async def register(user: UserCreate):
     # Check if user already exists
-    if users_collection.find_one({"email": user.email}):
+    if await users_collection.find_one({"email": user.email}):
         raise HTTPException(status_code=400, detail="Email already registered")
     
     # Validate age requirement - updated to 25+ for mature adults
@@ -790,14 +1158,14 @@ async def register(user: UserCreate):
     
     # Generate and store OTP
     otp = generate_otp()
-    otp_storage[user.email] = {
+    await otp_store.put(REGISTRATION, user.email, {
         "otp": otp,
         "created_at": datetime.utcnow(),
         "expires_at": datetime.utcnow() + timedelta(seconds=150),  # 2 minutes 30 seconds OTP timer
         "user_data": {
             "name": user.name,
             "email": user.email,
-            "password": hash_password(user.password),
+            "password": await hash_password(user.password),
             "age": user.age,
             "phone_country": user.phone_country,
             "phone_number": user.phone_number,
@@ -813,10 +1181,10 @@ async def register(user: UserCreate):
             "subscription_tier": "free",
             "daily_likes_used": 0
         }
-    }
+    })
     
     # Send OTP email
-    email_sent = send_email_otp(user.email, otp)
+    email_sent = await send_email_otp(user.email, otp)
     
     if email_sent:
         return {
@@ -836,12 +1204,19 @@ async def register(user: UserCreate):
 @app.post("/api/login")
 async def login(user: UserLogin):
     # Find user
-    db_user = users_collection.find_one({"email": user.email})
-    if not db_user or not verify_password(user.password, db_user['password']):
+    db_user = await users_collection.find_one({"email": user.email})
+    if not db_user or not await verify_password(user.password, db_user['password']):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    # Generate JWT token
-    token = create_jwt_token(db_user['id'])
+    # Upgrade hashes created with a different BCRYPT_ROUNDS setting
+    if password_hasher.needs_rehash(db_user['password']):
+        await users_collection.update_one(
+            {"id": db_user['id'], "password": db_user['password']},
+            {"$set": {"password": await hash_password(user.password)}}
+        )
+    
+    # Generate access and refresh tokens
+    tokens = token_service.issue_tokens(db_user)
     
     # Return user data (without password)
     db_user.pop('password')
@@ -849,10 +1224,43 @@ async def login(user: UserLogin):
     
     return {
         "message": "Login successful",
-        "token": token,
+        **tokens,
         "user": UserResponse(**db_user)
     }
 
+@app.post("/api/auth/refresh")
+async def refresh_tokens(refresh: TokenRefresh):
+    """Exchange a refresh token for a new token pair with current entitlement claims"""
+    claims = token_service.decode(refresh.refresh_token, token_type="refresh")
+    
+    # Refresh tokens are single-use: only the request that claims the token id gets new tokens
+    if not await token_service.consume(claims):
+        raise HTTPException(status_code=401, detail="Token revoked")
+    
+    # Entitlements are read fresh so upgrades and expiries reach the new access token
+    db_user = await users_collection.find_one({"id": claims["user_id"]}, AUTH_USER_PROJECTION)
+    if db_user is None:
+        raise HTTPException(status_code=401, detail="User not found")
+    
+    user_cache.set(db_user["id"], db_user)
+    
+    return token_service.issue_tokens(db_user)
+
+@app.post("/api/auth/logout")
+async def logout(logout_request: LogoutRequest, claims: dict = Depends(get_token_claims)):
+    """Revoke the current access token and, if given, the caller's refresh token"""
+    await token_service.revoke(claims)
+    
+    if logout_request.refresh_token:
+        try:
+            refresh_claims = token_service.decode(logout_request.refresh_token, token_type="refresh")
+        except HTTPException:
+            refresh_claims = None
+        if refresh_claims and refresh_claims["user_id"] == claims["user_id"]:
+            await token_service.revoke(refresh_claims)
+    
+    return {"message": "Logged out"}
+
 @app.get("/api/profile")
 async def get_profile(current_user = Depends(get_current_user)):
     # Remove sensitive fields
@@ -912,16 +1320,38 @@ async def setup_profile(
         "profile_complete": True
     }
     
+    unset_fields = {}
     if main_photo_path:
         update_data["main_photo"] = main_photo_path
+        # Variants of the previous photo no longer apply; new ones are rendered below
+        unset_fields["photo_variants"] = ""
+    
+    # Persist a GeoJSON point next to the display location for radius searches
+    geo_point = location_to_geo_point(processed_location)
+    if geo_point:
+        update_data["geo"] = geo_point
+    else:
+        unset_fields["geo"] = ""
     
-    users_collection.update_one(
+    profile_update = {"$set": update_data}
+    if unset_fields:
+        profile_update["$unset"] = unset_fields
+    
+    previous = await users_collection.find_one_and_update(
         {"id": current_user['id']},
-        {"$set": update_data}
+        profile_update,
+        projection={"_id": 0, "photo_variants": 1},
+        return_document=ReturnDocument.BEFORE
     )
+    user_cache.invalidate(current_user['id'])
+    if main_photo_path:
+        await image_pipeline.discard((previous or {}).get("photo_variants"))
+        image_pipeline.submit(current_user['id'], main_photo_path)
     
     # Get updated user
-    updated_user = users_collection.find_one({"id": current_user['id']})
+    updated_user = await users_collection.find_one({"id": current_user['id']})
+    if candidate_index is not None:
+        candidate_index.upsert(updated_user)
     updated_user.pop('password')
     updated_user.pop('_id')
     
@@ -937,72 +1367,181 @@ async def setup_profile(
     }
 
 @app.get("/api/profiles")
-async def get_profiles(current_user = Depends(get_current_user)):
-    """Get profiles based on user's subscription tier and Malawian geographical preferences"""
+async def get_profiles(
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    min_age: Optional[int] = Query(None, ge=0),
+    max_age: Optional[int] = Query(None, ge=0),
+    looking_for: Optional[str] = None,
+    photo_size: str = Query("card", pattern="^(thumb|card|full|original)$"),
+    current_user = Depends(get_current_user)
+):
+    """Get a page of profiles based on user's subscription tier and Malawian geographical preferences"""
     user_subscription = current_user.get('subscription_tier', 'free')
     user_location = current_user.get('location')
     user_phone_country = current_user.get('phone_country', '')
+    user_geo = current_user.get('geo') or location_to_geo_point(user_location)
+    
+    # Continuation state: sort key of the last profile served and how many were served so far
+    cursor_data = parse_profile_cursor(cursor)
+    served = cursor_data.get("n", 0)
+    
+    # Page size is capped, and free/premium decks keep their total profile limits
+    page_size = min(limit or PROFILE_PAGE_SIZE, PROFILE_PAGE_SIZE_MAX)
+    profile_limit = PROFILE_LIMITS.get(user_subscription)
+    if profile_limit is not None:
+        page_size = min(page_size, max(profile_limit - served, 0))
     
     # Get users that current user hasn't liked/disliked and aren't matches
-    liked_users = likes_collection.find({"user_id": current_user['id']}).distinct("liked_user_id")
+    liked_users = await likes_collection.distinct("liked_user_id", {"user_id": current_user['id']})
     
     # Find profiles excluding current user and already liked users
     exclude_ids = [current_user['id']] + liked_users
-    
-    # Get all potential profiles first
-    all_profiles = list(users_collection.find({
+    candidate_query = {
         "id": {"$nin": exclude_ids},
         "profile_complete": True
-    }))
-    
-    # Filter profiles based on subscription tier and Malawian location rules
-    filtered_profiles = []
+    }
     
-    for profile in all_profiles:
+    # Optional age and relationship-goal filters
+    if min_age is not None or max_age is not None:
+        candidate_query["age"] = {}
+        if min_age is not None:
+            candidate_query["age"]["$gte"] = min_age
+        if max_age is not None:
+            candidate_query["age"]["$lte"] = max_age
+    if looking_for:
+        candidate_query["looking_for"] = {"$regex": f"^\\s*{re.escape(looking_for.strip())}\\s*$", "$options": "i"}
+    
+    # Fetch one extra profile to know whether another page exists
+    fetch_size = page_size + 1
+    sort_by_distance = False
+    
+    if page_size == 0:
+        profiles = []
+    elif candidate_index is not None:
+        # Evaluate the browse predicates for every candidate in one vectorized pass
+        radius_km = None if user_subscription == 'vip' else LOCAL_MATCH_RADIUS_KM.get(user_subscription, LOCAL_MATCH_RADIUS_KM["free"])
+        candidate_ids, candidate_distances, sort_by_distance = candidate_index.search(
+            {**current_user, "geo": user_geo},
+            exclude_ids,
+            radius_km,
+            fetch_size,
+            after=cursor_data,
+            min_age=min_age,
+            max_age=max_age,
+            looking_for=looking_for
+        )
+        
+        # Load the full cards for this page only, keeping the index order
+        docs = await users_collection.find(
+            {"id": {"$in": candidate_ids}},
+            PROFILE_CARD_PROJECTION
+        ).to_list(length=len(candidate_ids))
+        docs_by_id = {doc["id"]: doc for doc in docs}
+        profiles = []
+        for candidate_id, distance in zip(candidate_ids, candidate_distances):
+            profile = docs_by_id.get(candidate_id)
+            if profile is None:
+                continue
+            if distance is not None:
+                profile["distance_km"] = distance
+            profiles.append(profile)
+    elif user_subscription == 'vip':
+        # VIP users can connect with all Malawians worldwide
+        if is_malawian_user(user_location, user_phone_country):
+            if "id" in cursor_data:
+                candidate_query["id"]["$gt"] = cursor_data["id"]
+            profiles = await users_collection.find(
+                {**candidate_query, **malawian_user_query()},
+                PROFILE_CARD_PROJECTION
+            ).sort("id", 1).limit(fetch_size).to_list(length=fetch_size)
+        else:
+            profiles = []
+    elif user_geo:
+        # Let the 2dsphere index return only in-range candidates, nearest first
+        sort_by_distance = True
+        radius_km = LOCAL_MATCH_RADIUS_KM.get(user_subscription, LOCAL_MATCH_RADIUS_KM["free"])
+        geo_near = {
+            "near": user_geo,
+            "key": "geo",
+            "distanceField": "distance_km",
+            "distanceMultiplier": 0.001,
+            "maxDistance": radius_km * 1000,
+            "spherical": True,
+            "query": candidate_query
+        }
+        pipeline = [{"$geoNear": geo_near}]
+        
+        if "d" in cursor_data and "id" in cursor_data:
+            # Resume after the last (distance, id) pair; 1 m of slack absorbs unit conversion rounding
+            last_distance = cursor_data["d"]
+            geo_near["minDistance"] = max(last_distance * 1000 - 1, 0)
+            pipeline.append({"$match": {"$or": [
+                {"distance_km": {"$gt": last_distance}},
+                {"distance_km": last_distance, "id": {"$gt": cursor_data["id"]}}
+            ]}})
+        
+        pipeline += [
+            {"$sort": {"distance_km": 1, "id": 1}},
+            {"$limit": fetch_size},
+            {"$project": PROFILE_CARD_PROJECTION}
+        ]
+        profiles = await users_collection.aggregate(pipeline).to_list(length=fetch_size)
+    elif user_location:
+        # Fallback to simple text matching for same city/region
+        if "id" in cursor_data:
+            candidate_query["id"]["$gt"] = cursor_data["id"]
+        profiles = await users_collection.find(
+            {**candidate_query, **same_city_query(user_location)},
+            PROFILE_CARD_PROJECTION
+        ).sort("id", 1).limit(fetch_size).to_list(length=fetch_size)
+    else:
+        # Only VIP (Malawian Hearts) can match without location data
+        profiles = []
+    
+    has_more = len(profiles) > page_size
+    profiles = profiles[:page_size]
+    served += len(profiles)
+    if profile_limit is not None and served >= profile_limit:
+        has_more = False
+    
+    next_cursor = None
+    if has_more:
+        last_profile = profiles[-1]
+        next_state = {"id": last_profile["id"], "n": served}
+        if sort_by_distance:
+            next_state["d"] = last_profile["distance_km"]
+        next_cursor = cursor_codec.encode(next_state)
+    
+    user_coords = parse_location_coordinates(user_location)
+    for profile in profiles:
         profile_location = profile.get('location')
-        profile_phone_country = profile.get('phone_country', '')
         
-        # Check if profile is within user's matching scope
-        if is_within_local_area(user_location, profile_location, user_subscription, user_phone_country, profile_phone_country):
-            # Clean up profile (remove sensitive data)
-            profile.pop('password', None)
-            profile.pop('_id', None)
-            profile.pop('email', None)
-            
-            # Add distance information for premium/vip users
-            if user_subscription in ['premium', 'vip'] and user_location and profile_location:
-                try:
-                    if ':' in user_location and ':' in profile_location:
-                        user_coords = user_location.split(':')[1].split(',')
-                        profile_coords = profile_location.split(':')[1].split(',')
-                        
-                        user_lat, user_lon = float(user_coords[0]), float(user_coords[1])
-                        profile_lat, profile_lon = float(profile_coords[0]), float(profile_coords[1])
-                        
-                        distance = calculate_distance(user_lat, user_lon, profile_lat, profile_lon)
-                        profile['distance_km'] = round(distance, 1)
-                except (ValueError, IndexError):
-                    profile['distance_km'] = None
-            
-            # Add Malawian status
-            profile['is_malawian'] = is_malawian_user(profile_location, profile_phone_country)
-            
-            # Add matching scope info
-            profile['matching_scope'] = get_matching_scope_description(user_subscription)
-            profile['user_subscription_tier'] = user_subscription
-            
-            filtered_profiles.append(profile)
-    
-    # Limit results based on subscription tier
-    if user_subscription == 'free':
-        filtered_profiles = filtered_profiles[:10]  # Free users get 10 profiles
-    elif user_subscription == 'premium':
-        filtered_profiles = filtered_profiles[:50]  # Premium users get 50 profiles  
-    # VIP users get unlimited profiles
+        # Add distance information for premium/vip users
+        if user_subscription in ['premium', 'vip']:
+            if profile.get('distance_km') is None and user_coords:
+                profile_coords = parse_location_coordinates(profile_location)
+                if profile_coords:
+                    profile['distance_km'] = calculate_distance(*user_coords, *profile_coords)
+            if profile.get('distance_km') is not None:
+                profile['distance_km'] = round(profile['distance_km'], 1)
+        else:
+            profile.pop('distance_km', None)
+        
+        # Add Malawian status
+        profile['is_malawian'] = is_malawian_user(profile_location, profile.get('phone_country', ''))
+        
+        # Add matching scope info
+        profile['matching_scope'] = get_matching_scope_description(user_subscription)
+        profile['user_subscription_tier'] = user_subscription
+        
+        select_photo_size(profile, photo_size)
     
     return {
-        "profiles": filtered_profiles,
-        "total_available": len(filtered_profiles),
+        "profiles": profiles,
+        "total_available": len(profiles),
+        "next_cursor": next_cursor,
+        "has_more": has_more,
         "matching_scope": get_matching_scope_description(user_subscription),
         "subscription_tier": user_subscription,
         "malawian_focused": True,
@@ -1015,19 +1554,10 @@ async def like_user(like_data: LikeCreate, current_user = Depends(get_current_us
     liked_user_id = like_data.liked_user_id
     
     # Check if user exists
-    liked_user = users_collection.find_one({"id": liked_user_id})
+    liked_user = await users_collection.find_one({"id": liked_user_id}, {"_id": 1})
     if not liked_user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    # Check if already liked
-    existing_like = likes_collection.find_one({
-        "user_id": user_id,
-        "liked_user_id": liked_user_id
-    })
-    
-    if existing_like:
-        raise HTTPException(status_code=400, detail="User already liked")
-    
     # Check if user can interact freely (premium/vip or Saturday happy hour)
     can_interact, interaction_reason = can_user_interact_freely(current_user)
     
@@ -1040,7 +1570,7 @@ async def like_user(like_data: LikeCreate, current_user = Depends(get_current_us
                 detail="Daily like limit reached! Upgrade to Premium for unlimited likes or wait for Saturday Happy Hour (7-8 PM CAT) for free interactions."
             )
     
-    # Create like record
+    # Create like record; the unique (user_id, liked_user_id) index rejects duplicates
     like_doc = {
         "id": str(uuid.uuid4()),
         "user_id": user_id,
@@ -1049,32 +1579,52 @@ async def like_user(like_data: LikeCreate, current_user = Depends(get_current_us
         "interaction_type": interaction_reason if can_interact else "free_tier"
     }
     
-    likes_collection.insert_one(like_doc)
+    try:
+        await likes_collection.insert_one(like_doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="User already liked")
     
     # Update daily likes count only for free tier users outside happy hour
     if not can_interact:
-        users_collection.update_one(
+        await users_collection.update_one(
             {"id": user_id},
             {"$inc": {"daily_likes_used": 1}}
         )
+        user_cache.invalidate(user_id)
     
     # Check for mutual like (match)
-    mutual_like = likes_collection.find_one({
+    mutual_like = await likes_collection.find_one({
         "user_id": liked_user_id,
         "liked_user_id": user_id
-    })
+    }, {"_id": 1})
     
     is_match = False
     if mutual_like:
-        # Create match
-        match_doc = {
-            "id": str(uuid.uuid4()),
-            "user1_id": user_id,
-            "user2_id": liked_user_id,
-            "created_at": datetime.utcnow()
-        }
-        matches_collection.insert_one(match_doc)
+        # Upsert on the pair key so concurrent mutual likes create exactly one match
+        matched_at = datetime.utcnow()
+        match_key = match_key_for(user_id, liked_user_id)
+        try:
+            match = await matches_collection.find_one_and_update(
+                {"match_key": match_key},
+                {"$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "user1_id": user_id,
+                    "user2_id": liked_user_id,
+                    "created_at": matched_at,
+                    "last_activity_at": matched_at
+                }},
+                upsert=True,
+                projection={"_id": 0, "id": 1},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The other user's request inserted the match first
+            match = await matches_collection.find_one({"match_key": match_key}, {"_id": 0, "id": 1})
         is_match = True
+        
+        # Let both users know in real time if they are connected
+        await chat_manager.send_to_user(user_id, {"type": "match", "match_id": match['id'], "user_id": liked_user_id})
+        await chat_manager.send_to_user(liked_user_id, {"type": "match", "match_id": match['id'], "user_id": user_id})
     
     response_message = "Like recorded"
     if can_interact and "Saturday Happy Hour" in interaction_reason:
@@ -1087,127 +1637,265 @@ async def like_user(like_data: LikeCreate, current_user = Depends(get_current_us
     }
 
 @app.get("/api/matches")
-async def get_matches(current_user = Depends(get_current_user)):
+async def get_matches(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(MATCH_PAGE_SIZE, ge=1, le=MATCH_PAGE_SIZE_MAX),
+    photo_size: str = Query("thumb", pattern="^(thumb|card|full|original)$"),
+    current_user = Depends(get_current_user)
+):
+    """Get a page of the user's matches, most recently active first"""
     user_id = current_user['id']
     
     # Find matches where user is involved
-    matches = list(matches_collection.find({
+    match_query = {
         "$or": [
             {"user1_id": user_id},
             {"user2_id": user_id}
         ]
-    }))
+    }
+    
+    if cursor:
+        last_activity_at, last_match_id = cursor_codec.decode_time(cursor)
+        match_query = {"$and": [match_query, {"$or": [
+            {"last_activity_at": {"$lt": last_activity_at}},
+            {"last_activity_at": last_activity_at, "id": {"$lt": last_match_id}}
+        ]}]}
+    
+    # Fetch one extra match to know whether another page exists
+    matches = await matches_collection.find(match_query).sort(
+        [("last_activity_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+    
+    has_more = len(matches) > limit
+    matches = matches[:limit]
+    
+    # Load every other user's card in one batched query
+    other_user_ids = [
+        match['user2_id'] if match['user1_id'] == user_id else match['user1_id']
+        for match in matches
+    ]
+    other_users = await users_collection.find(
+        {"id": {"$in": other_user_ids}},
+        MATCH_CARD_PROJECTION
+    ).to_list(length=len(other_user_ids))
+    users_by_id = {user['id']: user for user in other_users}
     
     # Get match profiles
     match_profiles = []
-    for match in matches:
-        # Get the other user's ID
-        other_user_id = match['user2_id'] if match['user1_id'] == user_id else match['user1_id']
-        
-        # Get other user's profile
-        other_user = users_collection.find_one({"id": other_user_id})
+    for match, other_user_id in zip(matches, other_user_ids):
+        other_user = users_by_id.get(other_user_id)
         if other_user:
-            other_user.pop('password', None)
-            other_user.pop('_id', None)
-            other_user.pop('email', None)
-            other_user['match_id'] = match['id']
-            match_profiles.append(other_user)
+            match_profiles.append({
+                **select_photo_size(other_user, photo_size),
+                "match_id": match['id'],
+                "matched_at": match.get('created_at'),
+                "last_activity_at": match.get('last_activity_at')
+            })
+    
+    # The body stays a plain list; the continuation cursor travels in a header
+    if has_more:
+        # Every match has last_activity_at (set on creation, backfilled by migration 4)
+        last_match = matches[-1]
+        response.headers["X-Next-Cursor"] = cursor_codec.encode_time(last_match['last_activity_at'], last_match['id'])
     
     return match_profiles
 
 @app.post("/api/message")
 async def send_message(message_data: MessageCreate, current_user = Depends(get_current_user)):
-    user_id = current_user['id']
-    match_id = message_data.match_id
-    content = message_data.content
-    
-    # Verify match exists and user is part of it
-    match = matches_collection.find_one({
-        "id": match_id,
-        "$or": [
-            {"user1_id": user_id},
-            {"user2_id": user_id}
-        ]
-    })
-    
-    if not match:
-        raise HTTPException(status_code=404, detail="Match not found")
+    message_doc, delivered = await deliver_chat_message(
+        current_user['id'], message_data.match_id, message_data.content
+    )
     
-    # Create message
-    message_doc = {
-        "id": str(uuid.uuid4()),
-        "match_id": match_id,
-        "sender_id": user_id,
-        "content": content,
-        "created_at": datetime.utcnow(),
-        "read": False
+    return {
+        "message": "Message sent successfully",
+        "message_id": message_doc['id'],
+        "delivered": delivered
     }
-    
-    messages_collection.insert_one(message_doc)
-    
-    return {"message": "Message sent successfully"}
 
 @app.get("/api/messages/{match_id}")
-async def get_messages(match_id: str, current_user = Depends(get_current_user)):
+async def get_messages(
+    match_id: str,
+    response: Response,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MESSAGE_PAGE_SIZE_MAX),
+    current_user = Depends(get_current_user)
+):
+    """Get a page of messages in chronological order.
+    
+    Without cursors the latest page is returned. `before` pages back through
+    older history and `after` fetches only messages newer than a cursor.
+    The X-Before-Cursor / X-After-Cursor headers carry the next cursors.
+    """
     user_id = current_user['id']
     
+    if before and after:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both")
+    
     # Verify match exists and user is part of it
-    match = matches_collection.find_one({
+    match = await matches_collection.find_one({
         "id": match_id,
         "$or": [
             {"user1_id": user_id},
             {"user2_id": user_id}
         ]
-    })
+    }, {"_id": 0, "id": 1, "user1_id": 1, "user2_id": 1})
     
     if not match:
         raise HTTPException(status_code=404, detail="Match not found")
     
-    # Get messages for this match
-    messages = list(messages_collection.find({
-        "match_id": match_id
-    }).sort("created_at", 1))
-    
-    # Clean up messages
-    cleaned_messages = []
-    for message in messages:
-        message.pop('_id', None)
-        cleaned_messages.append(message)
+    # Get messages for this match, served from the (match_id, created_at, id) index
+    message_query = {"match_id": match_id}
+    if after:
+        after_time, after_id = cursor_codec.decode_time(after)
+        message_query["$or"] = [
+            {"created_at": {"$gt": after_time}},
+            {"created_at": after_time, "id": {"$gt": after_id}}
+        ]
+        sort_direction = 1
+    else:
+        if before:
+            before_time, before_id = cursor_codec.decode_time(before)
+            message_query["$or"] = [
+                {"created_at": {"$lt": before_time}},
+                {"created_at": before_time, "id": {"$lt": before_id}}
+            ]
+        sort_direction = -1
+    
+    # Fetch one extra message to know whether more history exists
+    messages = await messages_collection.find(message_query, {"_id": 0}).sort(
+        [("created_at", sort_direction), ("id", sort_direction)]
+    ).limit(limit + 1).to_list(length=limit + 1)
+    
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    if sort_direction == -1:
+        messages.reverse()
+    
+    if messages:
+        # Older history exists unless this page reached the start of the conversation
+        if has_more or after:
+            response.headers["X-Before-Cursor"] = cursor_codec.encode_time(messages[0]['created_at'], messages[0]['id'])
+        response.headers["X-After-Cursor"] = cursor_codec.encode_time(messages[-1]['created_at'], messages[-1]['id'])
+    elif after:
+        response.headers["X-After-Cursor"] = after
+    
+    # Everything up to the newest returned message has been seen, including
+    # unread messages older than this page; nothing newer is marked. An `after`
+    # page only adds messages past what the earlier pages already marked.
+    has_unread = any(message['sender_id'] != user_id and not message.get('read') for message in messages)
+    if messages and (has_unread or not after):
+        await mark_match_messages_read(match, user_id, up_to=messages[-1]['created_at'], up_to_id=messages[-1]['id'])
+    
+    return messages
+
+@app.websocket("/api/ws/chat")
+async def chat_websocket(websocket: WebSocket, token: Optional[str] = None):
+    """Real-time chat: pushes new messages, read receipts and match notifications.
+    
+    Clients authenticate with ?token=<JWT> and may send
+    {"type": "message", "match_id", "content", "client_id"},
+    {"type": "read", "match_id"} or {"type": "ping"}.
+    The socket is closed with 4401 once the token expires or is revoked;
+    clients refresh their token and reconnect.
+    """
+    try:
+        claims = token_service.decode(token or "")
+        current_user = await authenticate_claims(claims)
+    except HTTPException as e:
+        await websocket.close(code=WS_CLOSE_UNAUTHORIZED, reason=e.detail)
+        return
     
-    # Mark messages as read
-    messages_collection.update_many(
-        {
-            "match_id": match_id,
-            "sender_id": {"$ne": user_id},
-            "read": False
-        },
-        {"$set": {"read": True}}
-    )
+    user_id = current_user['id']
+    await chat_manager.connect(user_id, websocket)
+    await presence_service.heartbeat(user_id)
     
-    return cleaned_messages
+    try:
+        await websocket.send_json({"type": "connected", "user_id": user_id})
+        
+        while True:
+            try:
+                token_service.ensure_active(claims)
+                # Wake up at expiry, and periodically to notice a revocation while idle
+                timeout = min(token_service.seconds_left(claims), WS_SESSION_CHECK_SECONDS)
+                text = await asyncio.wait_for(websocket.receive_text(), timeout=max(timeout, 0))
+                # Events that arrive after expiry or revocation are not acted on
+                token_service.ensure_active(claims)
+            except asyncio.TimeoutError:
+                continue
+            except HTTPException as e:
+                await websocket.close(code=WS_CLOSE_UNAUTHORIZED, reason=e.detail)
+                return
+            
+            try:
+                event = json.loads(text)
+                if not isinstance(event, dict):
+                    raise ValueError("event must be an object")
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "Invalid event payload"})
+                continue
+            
+            event_type = event.get("type")
+            client_id = event.get("client_id")
+            
+            try:
+                if event_type == "message":
+                    content = str(event.get("content", "")).strip()
+                    if not content:
+                        raise HTTPException(status_code=400, detail="Message content is required")
+                    
+                    message_doc, delivered = await deliver_chat_message(user_id, str(event.get("match_id")), content)
+                    await websocket.send_json(jsonable_encoder({
+                        "type": "ack",
+                        "client_id": client_id,
+                        "message_id": message_doc['id'],
+                        "created_at": message_doc['created_at'],
+                        "delivered": delivered
+                    }))
+                elif event_type == "read":
+                    match = await matches_collection.find_one({
+                        "id": str(event.get("match_id")),
+                        "$or": [
+                            {"user1_id": user_id},
+                            {"user2_id": user_id}
+                        ]
+                    }, {"_id": 0, "id": 1, "user1_id": 1, "user2_id": 1})
+                    if not match:
+                        raise HTTPException(status_code=404, detail="Match not found")
+                    
+                    await mark_match_messages_read(match, user_id)
+                elif event_type == "ping":
+                    await websocket.send_json({"type": "pong"})
+                else:
+                    raise HTTPException(status_code=400, detail="Unknown event type")
+            except HTTPException as e:
+                await websocket.send_json({"type": "error", "client_id": client_id, "detail": e.detail})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        chat_manager.disconnect(user_id, websocket)
 
 @app.get("/api/country-codes")
-async def get_country_codes():
+async def get_country_codes(request: Request):
     """Get list of supported country codes with flags and phone codes"""
-    return COUNTRY_CODES
+    return reference_cache.respond(request, ("country-codes",), lambda: COUNTRY_CODES, REFERENCE_CACHE_MAX_AGE_SECONDS)
 
-@app.get("/api/subscription/tiers")
-async def get_subscription_tiers(location: str = "local"):
-    """Get subscription pricing for local Malawians or diaspora"""
-    
-    # Choose appropriate pricing tier
-    if location == "diaspora":
-        price_tier = "MW_DIASPORA"
-    else:
-        price_tier = "MW_LOCAL"
+def build_subscription_tiers(price_tier: str, promotions: PromotionSnapshot) -> dict:
+    """Subscription tiers payload for one pricing tier and promotion window.
     
+    The payload is cached for the whole window, so nothing in it may depend
+    on the current time (the user's subscription endpoint reports the clock).
+    """
     # Use appropriate pricing or fallback to default
     pricing_data = SUBSCRIPTION_PRICING.get(price_tier, SUBSCRIPTION_PRICING["default"])
     
+    free_interaction_time = promotions.free_interaction_promotion is not None
+    
     # Apply discounts to pricing
     discounted_pricing = {}
     for duration, price_info in pricing_data.items():
-        price_data = calculate_discounted_price(price_info["amount"])
+        price_data = calculate_discounted_price(price_info["amount"], promotions)
         discounted_pricing[duration] = {
             **price_info,
             **price_data
@@ -1218,28 +1906,45 @@ async def get_subscription_tiers(location: str = "local"):
         "free": {
             "name": "Free",
             "features": ["Basic browsing", "5 likes per day", "Local area matching only", "Basic chat"],
-            "special_status": "Saturday Happy Hour Active - Free interactions for everyone!" if is_free_interaction_time() else "Next Saturday 7-8 PM CAT: Free interactions for all users!",
-            "temporary_features": ["Unlimited likes", "Unlimited messages", "Premium features access"] if is_free_interaction_time() else []
+            "special_status": "Saturday Happy Hour Active - Free interactions for everyone!" if free_interaction_time else "Next Saturday 7-8 PM CAT: Free interactions for all users!",
+            "temporary_features": ["Unlimited likes", "Unlimited messages", "Premium features access"] if free_interaction_time else []
         },
         "premium": {
             "name": "Premium Subscription",
             "features": SUBSCRIPTION_FEATURES,
             "pricing": discounted_pricing,
-            "current_time_cat": get_current_cat_time().strftime("%Y-%m-%d %H:%M:%S CAT"),
-            "is_wednesday_discount": is_wednesday_discount(),
-            "is_saturday_happy_hour": is_saturday_happy_hour(),
+            "is_wednesday_discount": promotions.is_active("wednesday_discount"),
+            "is_saturday_happy_hour": promotions.is_active("saturday_happy_hour"),
             "pricing_type": price_tier,
-            "saturday_status": "Saturday Happy Hour Active - All users get free premium access!" if is_saturday_happy_hour() else "Next Saturday 7-8 PM CAT: Free premium access for all users!"
+            "saturday_status": "Saturday Happy Hour Active - All users get free premium access!" if promotions.is_active("saturday_happy_hour") else "Next Saturday 7-8 PM CAT: Free premium access for all users!"
         }
     }
 
-@app.get("/api/user/subscription")
-async def get_user_subscription(current_user = Depends(get_current_user)):
-    """Get user's current subscription status and benefits"""
-    
+def subscription_price_tier(location: str) -> str:
+    """Choose appropriate pricing tier"""
+    return "MW_DIASPORA" if location == "diaspora" else "MW_LOCAL"
+
+@app.get("/api/subscription/tiers")
+async def get_subscription_tiers(request: Request, location: str = "local"):
+    """Get subscription pricing for local Malawians or diaspora"""
+    price_tier = subscription_price_tier(location)
+    
+    # The payload only changes when a promotion window starts or ends
+    promotions = promotion_calendar.snapshot()
+    max_age = (promotions.valid_until - promotions.now).total_seconds() if promotions.valid_until else 0
+    return reference_cache.respond(
+        request,
+        ("subscription-tiers", price_tier, promotions.valid_until),
+        lambda: build_subscription_tiers(price_tier, promotions),
+        max_age
+    )
+
+def build_user_subscription(current_user: dict, promotions: PromotionSnapshot) -> dict:
+    """User's current subscription status and benefits"""
     subscription_tier = current_user.get("subscription_tier", "free")
     subscription_status = current_user.get("subscription_status", "inactive")
     subscription_expires = current_user.get("subscription_expires")
+    can_interact, interaction_reason = can_user_interact_freely(current_user, promotions)
     
     # Get features based on subscription
     features = []
@@ -1253,19 +1958,21 @@ async def get_user_subscription(current_user = Depends(get_current_user)):
         "subscription_status": current_user.get("subscription_status", "inactive"),
         "subscription_expires": subscription_expires,
         "features_unlocked": features,
-        "can_interact_freely": can_user_interact_freely(current_user)[0],
-        "interaction_status": can_user_interact_freely(current_user)[1],
+        "can_interact_freely": can_interact,
+        "interaction_status": interaction_reason,
         "daily_likes_used": current_user.get('daily_likes_used', 0) if subscription_tier == "free" else None,
-        "is_saturday_happy_hour": is_saturday_happy_hour(),
+        "is_saturday_happy_hour": promotions.is_active("saturday_happy_hour"),
         "next_saturday": "Every Saturday 7-8 PM CAT - Free interactions for all users!"
     }
 
-@app.get("/api/interaction/status")
-async def get_interaction_status(current_user = Depends(get_current_user)):
-    """Get current user's interaction status and special offers"""
-    can_interact, interaction_reason = can_user_interact_freely(current_user)
-    
-    current_time = get_current_cat_time()
+@app.get("/api/user/subscription")
+async def get_user_subscription(current_user = Depends(get_current_user)):
+    """Get user's current subscription status and benefits"""
+    return build_user_subscription(current_user, promotion_calendar.snapshot())
+
+def build_interaction_status(current_user: dict, promotions: PromotionSnapshot) -> dict:
+    """User's interaction status and special offers"""
+    can_interact, interaction_reason = can_user_interact_freely(current_user, promotions)
     
     status = {
         "user_id": current_user["id"],
@@ -1274,37 +1981,30 @@ async def get_interaction_status(current_user = Depends(get_current_user)):
         "interaction_reason": interaction_reason,
         "daily_likes_used": current_user.get("daily_likes_used", 0),
         "daily_likes_limit": 5 if current_user.get("subscription_tier", "free") == "free" else -1,
-        "current_time_cat": current_time.strftime("%Y-%m-%d %H:%M:%S CAT"),
-        "is_wednesday_discount": is_wednesday_discount(),
-        "is_saturday_happy_hour": is_saturday_happy_hour(),
+        "current_time_cat": promotions.now.strftime("%Y-%m-%d %H:%M:%S CAT"),
+        "is_wednesday_discount": promotions.is_active("wednesday_discount"),
+        "is_saturday_happy_hour": promotions.is_active("saturday_happy_hour"),
         "special_offers": {
-            "wednesday_discount": {
-                "active": is_wednesday_discount(),
-                "description": "50% off all subscriptions every Wednesday!"
-            },
-            "saturday_happy_hour": {
-                "active": is_saturday_happy_hour(),
-                "description": "Free premium interactions for ALL users every Saturday 7-8 PM CAT!"
+            promotion.key: {
+                "active": promotions.is_active(promotion.key),
+                "description": promotion.description
             }
+            for promotion in promotions.promotions
         }
     }
     
     # Add next Saturday happy hour info if not currently active
-    if not is_saturday_happy_hour():
-        # Calculate next Saturday 7 PM CAT
-        days_until_saturday = (5 - current_time.weekday()) % 7
-        if days_until_saturday == 0 and current_time.hour >= 20:  # If it's Saturday but after 8 PM
-            days_until_saturday = 7
-        elif days_until_saturday == 0:  # If it's Saturday before 7 PM
-            next_happy_hour = current_time.replace(hour=19, minute=0, second=0, microsecond=0)
-        else:
-            next_happy_hour = current_time + timedelta(days=days_until_saturday)
-            next_happy_hour = next_happy_hour.replace(hour=19, minute=0, second=0, microsecond=0)
-        
+    next_happy_hour = promotions.next_start("saturday_happy_hour")
+    if next_happy_hour and not promotions.is_active("saturday_happy_hour"):
         status["next_saturday_happy_hour"] = next_happy_hour.strftime("%Y-%m-%d %H:%M:%S CAT")
     
     return status
 
+@app.get("/api/interaction/status")
+async def get_interaction_status(current_user = Depends(get_current_user)):
+    """Get current user's interaction status and special offers"""
+    return build_interaction_status(current_user, promotion_calendar.snapshot())
+
 @app.post("/api/payment/request-otp")
 async def request_payment_otp(
     request_data: dict,
@@ -1342,7 +2042,7 @@ async def create_checkout_session(
     # In a real app, you'd integrate with actual payment processor
     
     # Update user's subscription (simulate)
-    users_collection.update_one(
+    await users_collection.update_one(
         {"id": current_user["id"]},
         {"$set": {
             "subscription_tier": "premium",  # or get from request
@@ -1350,6 +2050,7 @@ async def create_checkout_session(
             "subscription_updated_at": datetime.utcnow()
         }}
     )
+    user_cache.invalidate(current_user["id"])
     
     return {
         "message": "Payment authorized successfully! Your subscription has been upgraded.",
@@ -1433,31 +2134,26 @@ async def initiate_paychangu_payment(
         print(f"🔄 Making Paychangu API request to: {PAYCHANGU_BASE_URL}/payment")
         print(f"🔄 Payment data: {payment_data}")
         
-        import requests
-        
         try:
-            response = requests.post(
-                f"{PAYCHANGU_BASE_URL}/payment",
-                headers={
-                    "Accept": "application/json",
-                    "Authorization": f"Bearer {PAYCHANGU_SECRET_KEY}",
-                    "Content-Type": "application/json"
-                },
-                json=payment_data,
-                timeout=30  # Add timeout
-            )
+            response = await paychangu_client.initiate_payment(payment_data)
             
             print(f"📡 Paychangu API response status: {response.status_code}")
             print(f"📡 Paychangu API response headers: {dict(response.headers)}")
             print(f"📡 Paychangu API response body: {response.content.decode('utf-8', errors='ignore')[:500]}")
             
-        except requests.exceptions.Timeout:
+        except PaymentGatewayUnavailable:
+            print(f"❌ Paychangu circuit open - failing fast")
+            return PaychanguPaymentResponse(
+                success=False,
+                message="Payment gateway temporarily unavailable - please try again in a moment"
+            )
+        except httpx.TimeoutException:
             print(f"❌ Paychangu API request timeout")
             return PaychanguPaymentResponse(
                 success=False,
                 message="Payment gateway timeout - please try again"
             )
-        except requests.exceptions.ConnectionError:
+        except httpx.TransportError:
             print(f"❌ Paychangu API connection error")
             return PaychanguPaymentResponse(
                 success=False,
@@ -1504,8 +2200,7 @@ async def initiate_paychangu_payment(
                 
                 # Store in a transactions collection (create if doesn't exist)
                 try:
-                    transactions_collection = db.transactions
-                    transactions_collection.insert_one(transaction_data)
+                    await transactions_collection.insert_one(transaction_data)
                     print(f"✅ Transaction stored: {transaction_data['id']}")
                 except Exception as e:
                     print(f"⚠️ Failed to store transaction: {e}")
@@ -1566,10 +2261,18 @@ async def initiate_paychangu_payment(
             message=f"Payment processing error: {str(e)}"
         )
 
+async def confirm_subscription_payment(user: dict, transaction: dict) -> bool:
+    """Queue the confirmation email once a payment has been credited"""
+    if not user.get("email"):
+        return False
+    return await send_subscription_confirmation_email(
+        user["email"], user["name"], transaction["subscription_type"], user["subscription_expires"], transaction["amount"]
+    )
+
 @app.post("/api/paychangu/webhook")
 @app.get("/api/paychangu/webhook")
 async def paychangu_webhook(request: Request):
-    """Handle Paychangu webhook for payment status updates (supports both GET and POST)"""
+    """Store a Paychangu webhook in the inbox and acknowledge it (supports both GET and POST)"""
     try:
         webhook_data = {}
         
@@ -1596,137 +2299,17 @@ async def paychangu_webhook(request: Request):
         # Verify webhook signature if Paychangu provides one
         # This is important for security - implement based on Paychangu docs
         
-        # Paychangu webhook may use different field names, try multiple options
-        transaction_id = webhook_data.get("tx_ref") or webhook_data.get("transaction_id") or webhook_data.get("data", {}).get("tx_ref")
-        status = webhook_data.get("status") or webhook_data.get("data", {}).get("status")
-        
+        transaction_id = webhook_transaction_ref(webhook_data)
         if not transaction_id:
             print(f"❌ Missing transaction ID in webhook: {webhook_data}")
             raise HTTPException(status_code=400, detail="Missing transaction ID")
         
-        # Find the transaction in our database
-        transactions_collection = db.transactions
-        transaction = transactions_collection.find_one({"paychangu_transaction_id": transaction_id})
-        
-        if not transaction:
-            print(f"⚠️ Webhook received for unknown transaction: {transaction_id}")
-            return {"status": "ignored"}
-        
-        # If no status provided in webhook, assume success (Paychangu sends webhook only on success)
-        if not status:
-            print(f"⚠️ No status in webhook for transaction {transaction_id}, assuming success")
-            status = "success"
-        
-        # Update transaction status
-        transactions_collection.update_one(
-            {"paychangu_transaction_id": transaction_id},
-            {
-                "$set": {
-                    "status": status,
-                    "webhook_received_at": datetime.utcnow(),
-                    "webhook_data": webhook_data
-                }
-            }
-        )
-        
-        # If payment was successful, activate subscription
-        if status and status.lower() in ["success", "completed", "paid"]:
-            user_id = transaction["user_id"]
-            subscription_type = transaction["subscription_type"]
-            
-            # Check if this transaction was already processed successfully
-            current_status = transaction.get("status", "")
-            if current_status and current_status.lower() in ["success", "completed", "paid"]:
-                print(f"⚠️ Transaction {transaction_id} already processed - skipping duplicate webhook")
-                return {"status": "already_processed"}
-            
-            # Enhanced subscription timing - precise 24-hour cycles from verification
-            now = datetime.utcnow()
-            
-            # Get current subscription to check for existing time and handle double payments
-            user_doc = users_collection.find_one({"id": user_id})
-            current_expires = user_doc.get("subscription_expires") if user_doc else None
-            
-            # Calculate subscription duration in hours based on type
-            if subscription_type == "daily":
-                duration_hours = 24
-            elif subscription_type == "weekly": 
-                duration_hours = 24 * 7  # 168 hours
-            elif subscription_type == "monthly":
-                duration_hours = 24 * 30  # 720 hours
-            else:
-                duration_hours = 24  # Default to 24 hours
-            
-            # Handle double payment accumulation - if user already has active subscription, add to existing time
-            if current_expires and current_expires > now:
-                # User has active subscription - add new duration to existing time
-                expires_at = current_expires + timedelta(hours=duration_hours)
-                payment_type = "extension"
-                print(f"✅ Extending existing subscription for user {user_id} - adding {duration_hours} hours")
-            else:
-                # New subscription or expired subscription - start from now
-                expires_at = now + timedelta(hours=duration_hours)
-                payment_type = "new"
-                print(f"✅ New subscription for user {user_id} - {duration_hours} hours from now")
-            
-            # Update user subscription with precise timing
-            users_collection.update_one(
-                {"id": user_id},
-                {
-                    "$set": {
-                        "subscription_tier": "premium",
-                        "subscription_status": "active", 
-                        "subscription_expires": expires_at,
-                        "subscription_started_at": now,
-                        "subscription_updated_at": now,
-                        "subscription_type": subscription_type,
-                        "daily_likes_used": 0,  # Reset likes count
-                        "can_message": True,    # Enable messaging
-                        "last_activity": now    # Track user activity
-                    },
-                    "$inc": {
-                        f"subscription_payments_{subscription_type}": 1  # Track payment count
-                    }
-                }
-            )
-            
-            print(f"✅ Subscription activated for user {user_id} - {subscription_type}")
-            
-            # Send confirmation email to user (only once)
-            user = users_collection.find_one({"id": user_id})
-            if user and user.get("email"):
-                # Check if we already sent confirmation email for this transaction
-                if not transaction.get("confirmation_email_sent", False):
-                    try:
-                        email_sent = send_subscription_confirmation_email(
-                            user["email"], user["name"], subscription_type, expires_at, transaction["amount"]
-                        )
-                        
-                        # Mark email as sent in transaction record
-                        transactions_collection.update_one(
-                            {"paychangu_transaction_id": transaction_id},
-                            {
-                                "$set": {
-                                    "confirmation_email_sent": True,
-                                    "confirmation_email_sent_at": datetime.utcnow()
-                                }
-                            }
-                        )
-                        
-                        if email_sent:
-                            print(f"✅ Confirmation email sent to {user['email']}")
-                        else:
-                            print(f"⚠️ Failed to send confirmation email to {user['email']}")
-                            
-                    except Exception as email_error:
-                        print(f"❌ Error sending confirmation email: {str(email_error)}")
-                else:
-                    print(f"⚠️ Confirmation email already sent for transaction {transaction_id}")
-            else:
-                print(f"⚠️ User not found or no email for user {user_id}")
-        
-        return {"status": "processed"}
+        # Acknowledge right away; inbox workers apply the delivery
+        await webhook_inbox.enqueue(transaction_id, webhook_data, request.method)
+        return {"status": "accepted"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Webhook processing error: {str(e)}")
         raise HTTPException(status_code=500, detail="Webhook processing failed")
@@ -1738,8 +2321,7 @@ async def get_transaction_status(
 ):
     """Get transaction status for user's payment"""
     try:
-        transactions_collection = db.transactions
-        transaction = transactions_collection.find_one({
+        transaction = await transactions_collection.find_one({
             "paychangu_transaction_id": transaction_id,
             "user_id": current_user["id"]  # Ensure user can only see their own transactions
         })
@@ -1760,18 +2342,13 @@ async def get_transaction_status(
         print(f"❌ Transaction status error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get transaction status")
 
-def send_subscription_confirmation_email(email: str, name: str, subscription_type: str, expires_at: datetime, amount: float):
-    """Send subscription confirmation email"""
+async def send_subscription_confirmation_email(email: str, name: str, subscription_type: str, expires_at: datetime, amount: float):
+    """Queue the subscription confirmation email"""
     try:
-        if not EMAIL_USER or not EMAIL_PASSWORD:
+        if not EMAIL_ENABLED:
             print(f"⚠️ Email not configured. Subscription confirmed for {email}")
             return False
         
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = 'NextChapter - Subscription Confirmed! 🎉'
-        msg['From'] = f"NextChapter <{EMAIL_USER}>"
-        msg['To'] = email
-        
         # Create HTML email body
         html_body = f"""
         <!DOCTYPE html>
@@ -1831,46 +2408,25 @@ def send_subscription_confirmation_email(email: str, name: str, subscription_typ
         </html>
         """
         
-        msg.attach(MIMEText(html_body, 'html'))
-        
-        # Connect to Gmail SMTP
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(EMAIL_USER, EMAIL_PASSWORD)
-        
-        # Send email
-        server.send_message(msg)
-        server.quit()
-        
-        print(f"✅ Subscription confirmation email sent to {email}")
+        await email_outbox.enqueue(
+            email, 'NextChapter - Subscription Confirmed! 🎉', html_body, f"NextChapter <{EMAIL_USER}>",
+            kind="subscription_confirmation"
+        )
+        print(f"✅ Subscription confirmation email queued for {email}")
         return True
         
     except Exception as e:
-        print(f"❌ Failed to send subscription confirmation email: {str(e)}")
+        print(f"❌ Failed to queue subscription confirmation email: {str(e)}")
         return False
 
 # Update user activity endpoint (for online status tracking)
 @app.post("/api/user/activity")
-async def update_user_activity(request: Request):
+async def update_user_activity(claims: dict = Depends(get_token_claims)):
     try:
-        token = request.headers.get("authorization", "").replace("Bearer ", "")
-        if not token:
-            raise HTTPException(status_code=401, detail="No token provided")
-        
-        # Verify token and get user ID
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            user_id = payload.get("user_id")
-        except jwt.ExpiredSignatureError:
-            raise HTTPException(status_code=401, detail="Token has expired")
-        except jwt.InvalidTokenError:
-            raise HTTPException(status_code=401, detail="Invalid token")
+        user_id = claims["user_id"]
         
-        # Update user's last activity
-        users_collection.update_one(
-            {"id": user_id},
-            {"$set": {"last_activity": datetime.utcnow()}}
-        )
+        # Record the heartbeat; last_activity is flushed to Mongo in bulk
+        await presence_service.heartbeat(user_id)
         
         return {"status": "activity_updated"}
         
@@ -1879,100 +2435,86 @@ async def update_user_activity(request: Request):
         raise HTTPException(status_code=500, detail="Failed to update activity")
 
 # Get online users endpoint
-@app.get("/api/users/online")
-async def get_online_users(request: Request):
-    try:
-        token = request.headers.get("authorization", "").replace("Bearer ", "")
-        if not token:
-            raise HTTPException(status_code=401, detail="No token provided")
-        
-        # Verify token and get current user
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            current_user_id = payload.get("user_id")
-        except jwt.ExpiredSignatureError:
-            raise HTTPException(status_code=401, detail="Token has expired")
-        except jwt.InvalidTokenError:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        current_user = users_collection.find_one({"id": current_user_id})
-        if not current_user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        # Get users online in the last 10 minutes within area (if location available)
-        online_threshold = datetime.utcnow() - timedelta(minutes=10)
-        
-        # Build query for online users (exclude current user)
-        query = {
-            "id": {"$ne": current_user_id},
-            "last_activity": {"$gte": online_threshold}
+async def load_online_users(current_user_id: str) -> List[dict]:
+    """Users seen in the last 10 minutes, most recent first"""
+    # Get users online in the last 10 minutes from the presence store (excluding current user)
+    online_threshold = datetime.utcnow() - timedelta(minutes=10)
+    recently_seen = dict(await presence_service.store.seen_since(online_threshold, 50, exclude=current_user_id))
+    
+    # Load profile fields for those users only
+    online_users = await users_collection.find(
+        {"id": {"$in": list(recently_seen)}},
+        {
+            "id": 1, "name": 1, "age": 1, "bio": 1, "location": 1, 
+            "interests": 1, "subscription_tier": 1,
+            "subscription_status": 1, "_id": 0
         }
-        
-        # Get online users
-        online_users = list(users_collection.find(
-            query,
-            {
-                "id": 1, "name": 1, "age": 1, "bio": 1, "location": 1, 
-                "interests": 1, "last_activity": 1, "subscription_tier": 1,
-                "subscription_status": 1, "_id": 0
-            }
-        ).limit(50))
-        
-        # Add online status and format response
-        for user in online_users:
-            last_activity = user.get("last_activity")
-            if last_activity:
-                time_diff = datetime.utcnow() - last_activity
-                if time_diff.total_seconds() < 300:  # 5 minutes
-                    user["online_status"] = "online"
-                elif time_diff.total_seconds() < 600:  # 10 minutes
-                    user["online_status"] = "recently_active"
-                else:
-                    user["online_status"] = "offline"
+    ).to_list(length=len(recently_seen))
+    online_users.sort(key=lambda user: recently_seen[user["id"]], reverse=True)
+    
+    # Add online status and format response
+    for user in online_users:
+        last_activity = recently_seen.get(user["id"])
+        user["last_activity"] = last_activity
+        if last_activity:
+            time_diff = datetime.utcnow() - last_activity
+            if time_diff.total_seconds() < 300:  # 5 minutes
+                user["online_status"] = "online"
+            elif time_diff.total_seconds() < 600:  # 10 minutes
+                user["online_status"] = "recently_active"
             else:
                 user["online_status"] = "offline"
-        
-        return {"online_users": online_users}
+        else:
+            user["online_status"] = "offline"
+    
+    return online_users
+
+@app.get("/api/users/online")
+async def get_online_users(current_user: dict = Depends(get_current_user)):
+    try:
+        return {"online_users": await load_online_users(current_user["id"])}
         
     except Exception as e:
         print(f"Error getting online users: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to get online users")
 
+# App launch state in one round trip
+@app.get("/api/bootstrap")
+async def bootstrap(location: str = "local", current_user: dict = Depends(get_current_user)):
+    """Profile, subscription, pricing, reference data and online users for the app's first screen"""
+    # The online users query runs while the in-memory sections are assembled
+    online_users_task = asyncio.create_task(load_online_users(current_user["id"]))
+    
+    promotions = promotion_calendar.snapshot()
+    user_data = dict(current_user)
+    user_data.pop('password', None)
+    user_data.pop('_id', None)
+    response = {
+        "profile": UserResponse(**user_data),
+        "subscription": build_user_subscription(current_user, promotions),
+        "interaction_status": build_interaction_status(current_user, promotions),
+        "subscription_tiers": build_subscription_tiers(subscription_price_tier(location), promotions),
+        "country_codes": COUNTRY_CODES
+    }
+    
+    try:
+        response["online_users"] = await online_users_task
+    except Exception as e:
+        # Launch should not fail because of the online list; the client refreshes it periodically
+        print(f"Error getting online users: {str(e)}")
+        response["online_users"] = []
+    
+    return response
+
 # Check messaging permission endpoint
 @app.get("/api/user/can-message/{user_id}")
-async def check_messaging_permission(user_id: str, request: Request):
+async def check_messaging_permission(user_id: str, current_user: dict = Depends(get_entitlements)):
     try:
-        token = request.headers.get("authorization", "").replace("Bearer ", "")
-        if not token:
-            raise HTTPException(status_code=401, detail="No token provided")
-        
-        # Verify token and get current user
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            current_user_id = payload.get("user_id")
-        except jwt.ExpiredSignatureError:
-            raise HTTPException(status_code=401, detail="Token has expired")
-        except jwt.InvalidTokenError:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        current_user = users_collection.find_one({"id": current_user_id})
-        if not current_user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
         # Check if user has premium subscription and can message
         subscription_tier = current_user.get("subscription_tier", "free")
         subscription_status = current_user.get("subscription_status", "inactive")
         subscription_expires = current_user.get("subscription_expires")
-        can_message = current_user.get("can_message", False)
-        
-        # Check if subscription is active
-        is_premium_active = (
-            subscription_tier == "premium" and 
-            subscription_status == "active" and 
-            subscription_expires and 
-            subscription_expires > datetime.utcnow() and
-            can_message
-        )
+        is_premium_active = has_active_messaging(current_user)
         
         return {
             "can_message": is_premium_active,
@@ -1988,20 +2530,9 @@ async def check_messaging_permission(user_id: str, request: Request):
 
 # Send message endpoint (with premium restriction)
 @app.post("/api/messages/send")
-async def send_message(request: Request):
+async def send_message(request: Request, sender: dict = Depends(get_entitlements)):
     try:
-        token = request.headers.get("authorization", "").replace("Bearer ", "")
-        if not token:
-            raise HTTPException(status_code=401, detail="No token provided")
-        
-        # Verify token and get current user
-        try:
-            payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            sender_id = payload.get("user_id")
-        except jwt.ExpiredSignatureError:
-            raise HTTPException(status_code=401, detail="Token has expired")
-        except jwt.InvalidTokenError:
-            raise HTTPException(status_code=401, detail="Invalid token")
+        sender_id = sender["id"]
         
         # Get request data
         data = await request.json()
@@ -2011,31 +2542,17 @@ async def send_message(request: Request):
         if not recipient_id or not message_content:
             raise HTTPException(status_code=400, detail="Recipient ID and message are required")
         
-        # Check sender's messaging permission
-        sender = users_collection.find_one({"id": sender_id})
-        if not sender:
-            raise HTTPException(status_code=404, detail="Sender not found")
-        
         # Verify sender has premium subscription
-        subscription_tier = sender.get("subscription_tier", "free")
-        subscription_status = sender.get("subscription_status", "inactive")
-        subscription_expires = sender.get("subscription_expires")
-        can_message = sender.get("can_message", False)
-        
-        is_premium_active = (
-            subscription_tier == "premium" and 
-            subscription_status == "active" and 
-            subscription_expires and 
-            subscription_expires > datetime.utcnow() and
-            can_message
-        )
-        
-        if not is_premium_active:
+        if not has_active_messaging(sender):
             raise HTTPException(status_code=403, detail="Premium subscription required to send messages")
         
         # Verify recipient exists
-        recipient = users_collection.find_one({"id": recipient_id})
-        if not recipient:
+        participants = await users_collection.find(
+            {"id": {"$in": [sender_id, recipient_id]}},
+            {"_id": 0, "id": 1, "name": 1}
+        ).to_list(length=2)
+        names = {user["id"]: user.get("name", "Unknown") for user in participants}
+        if recipient_id not in names:
             raise HTTPException(status_code=404, detail="Recipient not found")
         
         # Create message document
@@ -2046,8 +2563,8 @@ async def send_message(request: Request):
             "message": message_content,
             "timestamp": datetime.utcnow(),
             "read": False,
-            "sender_name": sender.get("name", "Unknown"),
-            "recipient_name": recipient.get("name", "Unknown")
+            "sender_name": names.get(sender_id, "Unknown"),
+            "recipient_name": names[recipient_id]
         }
         
         # Store message (you would implement a messages collection)
@@ -14,7 +14,7 @@ from pymongo import MongoClient
 import bcrypt
 import jwt
 from pathlib import Path
-import shutil
+from photo_uploads import PhotoStore, UploadSizeLimitMiddleware
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -38,9 +38,27 @@ EMAIL_PASSWORD = os.environ.get('EMAIL_PASSWORD', '')
 UPLOAD_DIR = Path("uploads")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
+# Photo upload limits
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+UPLOAD_MAX_PIXELS = int(os.environ.get('UPLOAD_MAX_PIXELS', 40_000_000))
+UPLOAD_CHUNK_BYTES = int(os.environ.get('UPLOAD_CHUNK_BYTES', 1024 * 1024))
+# Multipart bodies may exceed the photo size by this much for the other form fields
+UPLOAD_FORM_OVERHEAD_BYTES = 1024 * 1024
+# Routes accepting photo uploads; their bodies are capped by UploadSizeLimitMiddleware
+UPLOAD_PATHS = ["/api/profile/setup"]
+photo_store = PhotoStore(UPLOAD_DIR, UPLOAD_MAX_BYTES, UPLOAD_MAX_PIXELS, UPLOAD_CHUNK_BYTES)
+
 # FastAPI app
 app = FastAPI(title="NextChapter Dating API with Enhanced Security", version="2.0.0")
 
+# Cap photo upload bodies while they are received, not only by their declared length
+app.add_middleware(
+    UploadSizeLimitMiddleware,
+    paths=UPLOAD_PATHS,
+    max_bytes=UPLOAD_MAX_BYTES + UPLOAD_FORM_OVERHEAD_BYTES,
+    detail=f"Photo must be at most {UPLOAD_MAX_BYTES / (1024 * 1024):.3g} MB"
+)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -68,6 +86,13 @@ try:
 except Exception as e:
     print(f"❌ Failed to connect to MongoDB: {e}")
 
+@app.on_event("startup")
+async def ensure_database_schema():
+    # Indexes are shared with server.py; refuse to serve if a required one is missing
+    from database import db as schema_db
+    from indexes import bootstrap_schema
+    await bootstrap_schema(schema_db)
+
 # Initialize Stripe
 stripe_checkout = None
 if STRIPE_SECRET_KEY:
@@ -303,16 +328,7 @@ async def save_upload_file(upload_file: UploadFile, user_id: str) -> str:
     if not upload_file:
         return None
     
-    # Generate unique filename
-    file_extension = upload_file.filename.split('.')[-1] if '.' in upload_file.filename else 'jpg'
-    filename = f"{user_id}_{uuid.uuid4().hex}.{file_extension}"
-    file_path = UPLOAD_DIR / filename
-    
-    # Save file
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(upload_file.file, buffer)
-    
-    return f"/uploads/{filename}"
+    return await photo_store.save(upload_file, user_id)
 
 def check_subscription_feature(user, feature_type: str) -> bool:
     """Check if user has access to premium features"""
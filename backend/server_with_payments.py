@@ -55,6 +55,13 @@ try:
 except Exception as e:
     print(f"❌ Failed to connect to MongoDB: {e}")
 
+@app.on_event("startup")
+async def ensure_database_schema():
+    # Indexes are shared with server.py; refuse to serve if a required one is missing
+    from database import db as schema_db
+    from indexes import bootstrap_schema
+    await bootstrap_schema(schema_db)
+
 # Initialize Stripe
 stripe_checkout = None
 if STRIPE_SECRET_KEY:
@@ -0,0 +1,95 @@
+"""Background downgrade of lapsed subscriptions.
+
+Paid subscriptions only record ``subscription_expires``; nothing changes the
+user's tier when that moment passes. ``SubscriptionExpirySweeper`` runs on a
+schedule, finds active subscriptions whose expiry has passed (served by the
+``users_subscription_expires`` index) and downgrades them to the free tier in
+bulk writes, so the stored ``subscription_tier`` can be trusted everywhere.
+
+Every downgraded user id is passed to the registered listeners (the server
+uses this to drop cached user records). Each write re-checks the expiry, so a
+renewal that lands between the scan and the write is left untouched.
+"""
+import asyncio
+from datetime import datetime
+from typing import Callable, List
+
+from pymongo import UpdateOne
+
+EXPIRED = "expired"
+
+
+class SubscriptionExpirySweeper:
+    """Periodically downgrades subscriptions whose expiry has passed"""
+
+    def __init__(self, users_collection, interval_seconds: float, batch_size: int):
+        self._users = users_collection
+        self._interval = interval_seconds
+        self._batch_size = batch_size
+        self._listeners: List[Callable[[str], None]] = []
+        self.downgraded = 0
+        self.last_run_at = None
+
+    def on_expired(self, listener: Callable[[str], None]):
+        """Register a callback invoked with the id of every downgraded user"""
+        self._listeners.append(listener)
+
+    def _emit(self, user_id: str):
+        for listener in self._listeners:
+            try:
+                listener(user_id)
+            except Exception as e:
+                print(f"⚠️ Subscription expiry listener failed for {user_id}: {e}")
+
+    async def sweep(self) -> int:
+        """Downgrade every subscription expired as of now; returns how many were changed"""
+        now = datetime.utcnow()
+        total = 0
+        while True:
+            expired = await self._users.find(
+                {"subscription_status": "active", "subscription_expires": {"$lte": now}},
+                {"_id": 0, "id": 1}
+            ).sort("subscription_expires", 1).limit(self._batch_size).to_list(length=self._batch_size)
+            if not expired:
+                break
+
+            user_ids = [user["id"] for user in expired]
+            await self._users.bulk_write([
+                UpdateOne(
+                    {"id": user_id, "subscription_status": "active", "subscription_expires": {"$lte": now}},
+                    {"$set": {
+                        "subscription_tier": "free",
+                        "subscription_status": EXPIRED,
+                        "can_message": False,
+                        "subscription_expired_at": now
+                    }}
+                )
+                for user_id in user_ids
+            ], ordered=False)
+
+            for user_id in user_ids:
+                self._emit(user_id)
+            total += len(user_ids)
+            if len(user_ids) < self._batch_size:
+                break
+
+        self.downgraded += total
+        self.last_run_at = now
+        if total:
+            print(f"🔄 Downgraded {total} expired subscriptions")
+        return total
+
+    async def run(self):
+        """Background loop sweeping expired subscriptions until cancelled"""
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"❌ Subscription expiry sweep failed: {e}")
+            await asyncio.sleep(self._interval)
+
+    def stats(self) -> dict:
+        return {
+            "downgraded": self.downgraded,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None
+        }
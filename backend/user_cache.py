@@ -0,0 +1,69 @@
+"""Per-process cache of authenticated user records.
+
+Authenticated requests resolve the caller's user document on every call. The
+cache keeps a projected copy (no password hash) per user id in an LRU with a
+short TTL; code paths that change a user's profile, subscription or password
+invalidate the entry so the next request reloads it.
+"""
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class UserCache:
+    """LRU cache with per-entry TTL and hit/miss counters"""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, user_id: str) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        # Handlers may modify the record they receive; keep the cached one intact
+        return dict(user)
+
+    def set(self, user_id: str, user: dict):
+        if self.max_size <= 0:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, dict(user))
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
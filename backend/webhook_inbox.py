@@ -0,0 +1,113 @@
+"""Inbox for payment gateway webhooks.
+
+The webhook endpoint only stores the payload in the ``webhook_inbox``
+collection and acknowledges it, so the gateway gets an immediate 200 and has
+no reason to retry. Background workers process the inbox oldest-first.
+Deliveries for the same transaction are applied in the order they arrived:
+a worker that claims an entry while an earlier one for the same transaction
+is still unfinished hands it back and picks it up again shortly after.
+Failed entries are retried with exponential backoff.
+"""
+from datetime import datetime
+from typing import Awaitable, Callable
+
+from leased_queue import PENDING, LeasedQueue
+
+PROCESSING = "processing"
+DONE = "done"
+
+
+class WebhookInbox(LeasedQueue):
+    """Persistent webhook queue drained by background workers"""
+
+    name = "Webhook inbox"
+    claimed_status = PROCESSING
+    claim_order = "received_at"
+
+    def __init__(
+        self,
+        collection,
+        processor: Callable[[dict], Awaitable[dict]],
+        workers: int,
+        max_attempts: int,
+        retry_base_seconds: float,
+        poll_interval_seconds: float,
+        lease_seconds: float = 300
+    ):
+        super().__init__(collection, workers, max_attempts, retry_base_seconds, poll_interval_seconds, lease_seconds)
+        self._processor = processor
+        self.processed = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def _describe(self, entry: dict) -> str:
+        return f"webhook for {entry['tx_ref']}"
+
+    async def enqueue(self, tx_ref: str, payload: dict, source: str) -> str:
+        """Persist a delivery and wake a worker"""
+        now = datetime.utcnow()
+        result = await self._collection.insert_one({
+            "tx_ref": tx_ref,
+            "payload": payload,
+            "source": source,
+            "status": PENDING,
+            "attempts": 0,
+            "received_at": now,
+            "next_attempt_at": now
+        })
+        self._notify()
+        return str(result.inserted_id)
+
+    async def _has_earlier_unfinished(self, entry: dict) -> bool:
+        earlier = await self._collection.find_one(
+            {
+                "tx_ref": entry["tx_ref"],
+                "status": {"$in": [PENDING, PROCESSING]},
+                # Same-timestamp deliveries are ordered by insertion id
+                "$or": [
+                    {"received_at": {"$lt": entry["received_at"]}},
+                    {"received_at": entry["received_at"], "_id": {"$lt": entry["_id"]}}
+                ]
+            },
+            {"_id": 1}
+        )
+        return earlier is not None
+
+    async def _process(self, entry: dict):
+        if await self._has_earlier_unfinished(entry):
+            await self._release(entry, self._poll_interval)
+            return
+
+        try:
+            result = await self._processor(entry["payload"])
+        except Exception as e:
+            await self._record_failure(entry, e)
+            return
+
+        processed_at = datetime.utcnow()
+        self.processed += 1
+        self.last_lag_seconds = (processed_at - entry["received_at"]).total_seconds()
+        self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+        await self._complete(entry, {"status": DONE, "processed_at": processed_at, "result": result})
+
+    async def run_worker(self):
+        """Process due deliveries until cancelled"""
+        await self._drain(self._process)
+
+    async def stats(self) -> dict:
+        backlog = await self._collection.count_documents({"status": {"$in": [PENDING, PROCESSING]}})
+        oldest = await self._collection.find_one(
+            {"status": {"$in": [PENDING, PROCESSING]}},
+            {"_id": 0, "received_at": 1},
+            sort=[("received_at", 1)]
+        )
+        return {
+            "workers": self._workers,
+            "backlog": backlog,
+            "oldest_pending_age_seconds": (datetime.utcnow() - oldest["received_at"]).total_seconds() if oldest else 0.0,
+            "processed": self.processed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "last_lag_seconds": round(self.last_lag_seconds, 3),
+            "max_lag_seconds": round(self.max_lag_seconds, 3)
+        }
@@ -1,13 +1,13 @@
 import React, { useState, useEffect } from 'react';
 import './App.css';
-
-const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+import { API_BASE_URL, authFetch, clearTokens, refreshSession, storeTokens } from './api';
 
 function App() {
   const [user, setUser] = useState(null);
   const [currentView, setCurrentView] = useState('landing');
   const [authMode, setAuthMode] = useState('login');
   const [profiles, setProfiles] = useState([]);
+  const [profilesCursor, setProfilesCursor] = useState(null);
   const [matches, setMatches] = useState([
     {
       id: 1,
@@ -44,6 +44,8 @@ function App() {
     }
   ]);
   const [messages, setMessages] = useState([]);
+  const [messagesCursors, setMessagesCursors] = useState({ before: null, after: null });
+  const [matchesCursor, setMatchesCursor] = useState(null);
   const [selectedMatch, setSelectedMatch] = useState(null);
   const [subscriptionTiers, setSubscriptionTiers] = useState({});
   const [userSubscription, setUserSubscription] = useState(null);
@@ -230,12 +232,22 @@ function App() {
   useEffect(() => {
     const token = localStorage.getItem('token');
     if (token) {
-      fetchUserProfile();
+      // Access tokens are short-lived; renew before loading the launch state
+      refreshSession().then(fetchBootstrap);
+    } else {
+      fetchSubscriptionTiers();
+      fetchCountryCodes();
     }
-    fetchSubscriptionTiers();
-    fetchCountryCodes();
   }, []);
 
+  // Renew the access token before it expires (access tokens last 15 minutes)
+  useEffect(() => {
+    if (user) {
+      const refreshInterval = setInterval(refreshSession, 10 * 60 * 1000);
+      return () => clearInterval(refreshInterval);
+    }
+  }, [user]);
+
   const fetchCountryCodes = async () => {
     try {
       const response = await fetch(`${API_BASE_URL}/api/country-codes`);
@@ -248,22 +260,26 @@ function App() {
     }
   };
 
-  const fetchUserProfile = async () => {
+  // Profile, subscription, pricing, country codes and online users in one request
+  const fetchBootstrap = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/profile`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      const response = await authFetch(`${API_BASE_URL}/api/bootstrap`);
       if (response.ok) {
-        const userData = await response.json();
-        setUser(userData);
+        const data = await response.json();
+        setCountryCodes(data.country_codes);
+        setSubscriptionTiers(data.subscription_tiers);
+        setUserSubscription(data.subscription);
+        setOnlineUsers(data.online_users || []);
+        setUser(data.profile);
         setCurrentView('dashboard');
-        fetchUserSubscription();
+        return;
       }
     } catch (error) {
-      console.error('Error fetching profile:', error);
+      console.error('Error loading app state:', error);
     }
+    // Signed out or expired session: the landing page still needs pricing and country codes
+    fetchSubscriptionTiers();
+    fetchCountryCodes();
   };
 
   const fetchSubscriptionTiers = async () => {
@@ -280,16 +296,14 @@ function App() {
 
   const fetchUserSubscription = async () => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/user/subscription`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      const response = await authFetch(`${API_BASE_URL}/api/user/subscription`);
       if (response.ok) {
         const subscription = await response.json();
         
         // Check if subscription status changed from previous state
         if (userSubscription && userSubscription.subscription_tier !== subscription.subscription_tier) {
+          // Pick up the new entitlements in the access token
+          refreshSession();
           if (subscription.subscription_tier === 'premium' && subscription.subscription_status === 'active') {
             // Show subscription activation notification
             showSubscriptionNotification({
@@ -395,7 +409,7 @@ function App() {
 
         const data = await response.json();
         if (response.ok) {
-          localStorage.setItem('token', data.token);
+          storeTokens(data);
           setUser(data.user);
           setCurrentView('dashboard');
           fetchUserSubscription();
@@ -433,7 +447,7 @@ function App() {
 
       const data = await response.json();
       if (response.ok) {
-        localStorage.setItem('token', data.token);
+        storeTokens(data);
         setUser(data.user);
         setCurrentView('dashboard');
         fetchUserSubscription();
@@ -675,11 +689,10 @@ function App() {
         description: `NextChapter ${paymentData.subscriptionType} subscription`
       };
 
-      const response = await fetch(`${API_BASE_URL}/api/paychangu/initiate-payment`, {
+      const response = await authFetch(`${API_BASE_URL}/api/paychangu/initiate-payment`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
         },
         body: JSON.stringify(paymentRequest),
       });
@@ -763,10 +776,9 @@ function App() {
     if (user) {
       const updateActivity = async () => {
         try {
-          await fetch(`${API_BASE_URL}/api/user/activity`, {
+          await authFetch(`${API_BASE_URL}/api/user/activity`, {
             method: 'POST',
             headers: {
-              'Authorization': `Bearer ${localStorage.getItem('token')}`,
               'Content-Type': 'application/json'
             }
           });
@@ -797,11 +809,7 @@ function App() {
     if (!user) return;
     
     try {
-      const response = await fetch(`${API_BASE_URL}/api/users/online`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      const response = await authFetch(`${API_BASE_URL}/api/users/online`);
 
       if (response.ok) {
         const data = await response.json();
@@ -815,11 +823,7 @@ function App() {
   // Check messaging permission for a user
   const checkMessagingPermission = async (userId) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/user/can-message/${userId}`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      const response = await authFetch(`${API_BASE_URL}/api/user/can-message/${userId}`);
 
       if (response.ok) {
         const data = await response.json();
@@ -838,10 +842,9 @@ function App() {
   // Send message function with premium restrictions
   const sendPrivateMessage = async (recipientId, message) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/messages/send`, {
+      const response = await authFetch(`${API_BASE_URL}/api/messages/send`, {
         method: 'POST',
         headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`,
           'Content-Type': 'application/json'
         },
         body: JSON.stringify({
@@ -942,11 +945,7 @@ function App() {
   const verifyPaymentAndRedirect = async (transactionData) => {
     try {
       // Double-check subscription status after successful payment
-      const subscriptionResponse = await fetch(`${API_BASE_URL}/api/user/subscription`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      const subscriptionResponse = await authFetch(`${API_BASE_URL}/api/user/subscription`);
 
       if (subscriptionResponse.ok) {
         const subscriptionData = await subscriptionResponse.json();
@@ -1000,11 +999,7 @@ function App() {
           return;
         }
 
-        const response = await fetch(`${API_BASE_URL}/api/paychangu/transaction/${transactionId}`, {
-          headers: {
-            'Authorization': `Bearer ${localStorage.getItem('token')}`
-          }
-        });
+        const response = await authFetch(`${API_BASE_URL}/api/paychangu/transaction/${transactionId}`);
 
         if (response.ok) {
           const data = await response.json();
@@ -1050,11 +1045,10 @@ function App() {
 
   const requestPaymentOtp = async (tier) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/payment/request-otp`, {
+      const response = await authFetch(`${API_BASE_URL}/api/payment/request-otp`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
         },
         body: JSON.stringify({ 
           subscription_tier: tier 
@@ -1080,11 +1074,10 @@ function App() {
     e.preventDefault();
     
     try {
-      const response = await fetch(`${API_BASE_URL}/api/checkout/session`, {
+      const response = await authFetch(`${API_BASE_URL}/api/checkout/session`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${localStorage.getItem('token')}`,
           'Origin': window.location.origin
         },
         body: JSON.stringify({
@@ -1126,11 +1119,8 @@ function App() {
     }
 
     try {
-      const response = await fetch(`${API_BASE_URL}/api/profile/setup`, {
+      const response = await authFetch(`${API_BASE_URL}/api/profile/setup`, {
         method: 'POST',
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        },
         body: formDataToSend,
       });
 
@@ -1369,11 +1359,10 @@ function App() {
       
       // Send like to backend
       try {
-        await fetch(`${API_BASE_URL}/api/like`, {
+        await authFetch(`${API_BASE_URL}/api/like`, {
           method: 'POST',
           headers: {
             'Content-Type': 'application/json',
-            'Authorization': `Bearer ${localStorage.getItem('token')}`
           },
           body: JSON.stringify({ liked_user_id: profileId })
         });
@@ -1387,9 +1376,9 @@ function App() {
       setCurrentProfileIndex(prev => prev + 1);
       setSwipeDirection(null);
       
-      // Fetch more profiles if running low
+      // Fetch the next page of the deck if running low
       if (currentProfileIndex >= profiles.length - 2) {
-        fetchProfiles();
+        fetchProfiles(true);
       }
     }, 300);
   };
@@ -1400,17 +1389,25 @@ function App() {
       .slice(0, 10);
   };
 
-  const fetchProfiles = async () => {
+  // Loads the first page of the deck, or the next page when appending
+  const fetchProfiles = async (append = false) => {
+    // The deck is exhausted (or at the tier's limit) once there is no cursor
+    if (append && !profilesCursor) return;
+    
     try {
-      const response = await fetch(`${API_BASE_URL}/api/profiles`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      const query = append ? `?cursor=${encodeURIComponent(profilesCursor)}` : '';
+      const response = await authFetch(`${API_BASE_URL}/api/profiles${query}`);
       if (response.ok) {
         const data = await response.json();
-        setProfiles(data);
-        setCurrentView('browse');
+        const page = data.profiles || [];
+        setProfilesCursor(data.next_cursor || null);
+        if (append) {
+          setProfiles(prev => [...prev, ...page.filter(p => !prev.some(existing => existing.id === p.id))]);
+        } else {
+          setProfiles(page);
+          setCurrentProfileIndex(0);
+          setCurrentView('browse');
+        }
       }
     } catch (error) {
       console.error('Error fetching profiles:', error);
@@ -1419,11 +1416,10 @@ function App() {
 
   const handleLike = async (profileId) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/like`, {
+      const response = await authFetch(`${API_BASE_URL}/api/like`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
         },
         body: JSON.stringify({ liked_user_id: profileId }),
       });
@@ -1450,17 +1446,24 @@ function App() {
     }
   };
 
-  const fetchMatches = async () => {
+  const fetchMatches = async (append = false) => {
+    if (append && !matchesCursor) return;
     try {
-      const response = await fetch(`${API_BASE_URL}/api/matches`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      // Older matches are paged with the cursor from the X-Next-Cursor header
+      const query = append ? `?cursor=${encodeURIComponent(matchesCursor)}` : '';
+      const response = await authFetch(`${API_BASE_URL}/api/matches${query}`);
       if (response.ok) {
         const data = await response.json();
-        setMatches(data);
-        setCurrentView('matches');
+        setMatchesCursor(response.headers.get('X-Next-Cursor'));
+        if (append) {
+          setMatches(prev => {
+            const seen = new Set(prev.map(match => match.match_id));
+            return [...prev, ...data.filter(match => !seen.has(match.match_id))];
+          });
+        } else {
+          setMatches(data);
+          setCurrentView('matches');
+        }
       }
     } catch (error) {
       console.error('Error fetching matches:', error);
@@ -1469,41 +1472,75 @@ function App() {
 
   const sendMessage = async (matchId, content) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/api/message`, {
+      const response = await authFetch(`${API_BASE_URL}/api/message`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
         },
         body: JSON.stringify({ match_id: matchId, content }),
       });
 
       if (response.ok) {
-        fetchMessages(matchId);
+        fetchMessages(matchId, 'newer');
       }
     } catch (error) {
       console.error('Error sending message:', error);
     }
   };
 
-  const fetchMessages = async (matchId) => {
+  // page: 'latest' loads the newest page, 'older' pages back with the X-Before-Cursor
+  // header and 'newer' appends only messages past the X-After-Cursor header
+  const fetchMessages = async (matchId, page = 'latest') => {
+    if (page === 'older' && !messagesCursors.before) return;
+    if (page === 'newer' && !messagesCursors.after) page = 'latest';
     try {
-      const response = await fetch(`${API_BASE_URL}/api/messages/${matchId}`, {
-        headers: {
-          'Authorization': `Bearer ${localStorage.getItem('token')}`
-        }
-      });
+      const query = page === 'older'
+        ? `?before=${encodeURIComponent(messagesCursors.before)}`
+        : page === 'newer' ? `?after=${encodeURIComponent(messagesCursors.after)}` : '';
+      const response = await authFetch(`${API_BASE_URL}/api/messages/${matchId}${query}`);
       if (response.ok) {
         const data = await response.json();
-        setMessages(data);
+        const before = response.headers.get('X-Before-Cursor');
+        const after = response.headers.get('X-After-Cursor');
+        setMessagesCursors(prev => ({
+          before: page === 'newer' ? prev.before : before,
+          after: page === 'older' ? prev.after : after
+        }));
+        if (page === 'latest') {
+          setMessages(data);
+        } else {
+          setMessages(prev => {
+            const seen = new Set(prev.map(message => message.id));
+            const fresh = data.filter(message => !seen.has(message.id));
+            return page === 'older' ? [...fresh, ...prev] : [...prev, ...fresh];
+          });
+        }
       }
     } catch (error) {
       console.error('Error fetching messages:', error);
     }
   };
 
+  // Page back through history when the message list is scrolled to the top
+  const handleMessagesScroll = (event, matchId) => {
+    if (event.currentTarget.scrollTop === 0) {
+      fetchMessages(matchId, 'older');
+    }
+  };
+
   const handleLogout = () => {
-    localStorage.removeItem('token');
+    const token = localStorage.getItem('token');
+    if (token) {
+      fetch(`${API_BASE_URL}/api/auth/logout`, {
+        method: 'POST',
+        headers: {
+          'Authorization': `Bearer ${token}`,
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ refresh_token: localStorage.getItem('refreshToken') }),
+      }).catch((error) => console.error('Error logging out:', error));
+    }
+    clearTokens();
     setUser(null);
     setUserSubscription(null);
     setCurrentView('landing');
@@ -2832,11 +2869,7 @@ function App() {
                   Subscription
                 </button>
                 <button
-                  onClick={() => { 
-                    localStorage.removeItem('token'); 
-                    setUser(null); 
-                    setCurrentView('landing'); 
-                  }}
+                  onClick={handleLogout}
                   className="text-gray-600 hover:text-gray-800 font-medium"
                 >
                   Logout
@@ -2943,7 +2976,7 @@ function App() {
                       <h3 className="text-xl font-semibold text-gray-800 mb-2">Finding your matches...</h3>
                       <p className="text-gray-600 mb-6">We're looking for compatible Malawians in your area.</p>
                       <button
-                        onClick={fetchProfiles}
+                        onClick={() => fetchProfiles()}
                         className="bg-gradient-to-r from-purple-600 to-rose-500 text-white px-6 py-3 rounded-lg font-semibold hover:from-purple-700 hover:to-rose-600 transition-all duration-300"
                       >
                         Refresh Profiles
@@ -3631,6 +3664,16 @@ function App() {
                       </div>
                     </div>
                   ))}
+                  {matchesCursor && (
+                    <div className="text-center">
+                      <button
+                        onClick={() => fetchMatches(true)}
+                        className="px-6 py-2 border border-purple-300 text-purple-700 rounded-lg font-medium hover:bg-purple-50 transition-colors"
+                      >
+                        Load older matches
+                      </button>
+                    </div>
+                  )}
                 </div>
               )}
             </div>
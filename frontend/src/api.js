@@ -0,0 +1,70 @@
+export const API_BASE_URL = process.env.REACT_APP_BACKEND_URL || 'http://localhost:8001';
+
+let refreshInFlight = null;
+
+export const storeTokens = (data) => {
+  localStorage.setItem('token', data.token);
+  if (data.refresh_token) {
+    localStorage.setItem('refreshToken', data.refresh_token);
+  }
+};
+
+export const clearTokens = () => {
+  localStorage.removeItem('token');
+  localStorage.removeItem('refreshToken');
+};
+
+const requestTokenRefresh = async () => {
+  const refreshToken = localStorage.getItem('refreshToken');
+  if (!refreshToken) return false;
+
+  try {
+    const response = await fetch(`${API_BASE_URL}/api/auth/refresh`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({ refresh_token: refreshToken }),
+    });
+    if (response.ok) {
+      storeTokens(await response.json());
+      return true;
+    }
+    if (response.status === 401) {
+      clearTokens();
+    }
+  } catch (error) {
+    console.error('Error refreshing session:', error);
+  }
+  return false;
+};
+
+// Refresh tokens are single-use, so concurrent callers share one refresh request
+export const refreshSession = () => {
+  if (!refreshInFlight) {
+    refreshInFlight = requestTokenRefresh().finally(() => {
+      refreshInFlight = null;
+    });
+  }
+  return refreshInFlight;
+};
+
+const withAccessToken = (options) => {
+  const token = localStorage.getItem('token');
+  return {
+    ...options,
+    headers: {
+      ...(options.headers || {}),
+      ...(token ? { 'Authorization': `Bearer ${token}` } : {}),
+    },
+  };
+};
+
+// fetch() with the current access token; a 401 refreshes the session once and replays the request
+export const authFetch = async (url, options = {}) => {
+  const response = await fetch(url, withAccessToken(options));
+  if (response.status !== 401 || !(await refreshSession())) {
+    return response;
+  }
+  return fetch(url, withAccessToken(options));
+};
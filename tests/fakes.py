@@ -0,0 +1,22 @@
+from pymongo.errors import AutoReconnect
+
+
+class FlakyCollection:
+    """Collection wrapper whose next ``failures`` calls to ``method`` fail as if MongoDB dropped the connection"""
+
+    def __init__(self, collection, method, failures=0):
+        self._collection = collection
+        self._method = method
+        self.failures = failures
+
+    def __getattr__(self, name):
+        attribute = getattr(self._collection, name)
+        if name != self._method:
+            return attribute
+
+        async def call(*args, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise AutoReconnect("connection reset")
+            return await attribute(*args, **kwargs)
+        return call
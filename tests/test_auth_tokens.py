@@ -0,0 +1,64 @@
+import asyncio
+import unittest
+from datetime import timedelta
+
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import ASCENDING, IndexModel
+
+from auth_tokens import TokenRevocationList, TokenService
+
+
+class RefreshTokenRotationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.collection = AsyncMongoMockClient()["test"]["revoked_tokens"]
+        await self.collection.create_indexes([IndexModel([("jti", ASCENDING)], unique=True)])
+        self.service = self.make_service()
+        self.claims = self.service.decode(self.service.create_refresh_token("user-1"), token_type="refresh")
+
+    def make_service(self):
+        # One service per API worker, all sharing the revoked_tokens collection
+        revocations = TokenRevocationList(self.collection, sync_interval_seconds=60)
+        return TokenService("test-secret-that-is-at-least-32-bytes", timedelta(minutes=15), timedelta(days=30), revocations)
+
+    async def test_refresh_token_is_single_use(self):
+        self.assertTrue(await self.service.consume(self.claims))
+        self.assertFalse(await self.service.consume(self.claims))
+
+    async def test_concurrent_refreshes_across_workers_claim_once(self):
+        workers = [self.make_service() for _ in range(5)]
+        results = await asyncio.gather(*(worker.consume(self.claims) for worker in workers))
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(await self.collection.count_documents({"jti": self.claims["jti"]}), 1)
+
+    async def test_logged_out_refresh_token_cannot_be_consumed(self):
+        await self.make_service().revoke(self.claims)
+        self.assertFalse(await self.service.consume(self.claims))
+
+
+class ActiveSessionTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        revocations = TokenRevocationList(AsyncMongoMockClient()["test"]["revoked_tokens"], sync_interval_seconds=60)
+        self.service = TokenService("test-secret-that-is-at-least-32-bytes", timedelta(minutes=15), timedelta(days=30), revocations)
+        self.claims = self.service.decode(self.service.create_access_token({"id": "user-1"}))
+
+    async def test_active_token_passes(self):
+        self.service.ensure_active(self.claims)
+        self.assertGreater(self.service.seconds_left(self.claims), 14 * 60)
+
+    async def test_expired_claims_are_rejected(self):
+        # Claims were valid when decoded, the session outlived them
+        expired = {**self.claims, "exp": self.claims["iat"] - 1}
+        with self.assertRaises(HTTPException) as raised:
+            self.service.ensure_active(expired)
+        self.assertEqual(raised.exception.detail, "Token expired")
+
+    async def test_revoked_claims_are_rejected(self):
+        await self.service.revoke(self.claims)
+        with self.assertRaises(HTTPException) as raised:
+            self.service.ensure_active(self.claims)
+        self.assertEqual(raised.exception.detail, "Token revoked")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+
+from mongomock_motor import AsyncMongoMockClient
+
+from candidate_index import NUMPY_AVAILABLE, CandidateIndex
+
+
+def is_malawian(location, phone_country):
+    return phone_country == "MW" or "malawi" in (location or "").lower()
+
+
+def user(user_id, lon=33.78, lat=-13.96, **fields):
+    return {
+        "id": user_id,
+        "age": 30,
+        "location": "Lilongwe, Malawi",
+        "geo": {"type": "Point", "coordinates": [lon, lat]},
+        "phone_country": "MW",
+        "looking_for": "love",
+        "profile_complete": True,
+        **fields
+    }
+
+
+VIEWER = user("viewer")
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "NumPy not installed")
+class CandidateIndexSearchTest(unittest.TestCase):
+    def setUp(self):
+        self.index = CandidateIndex(is_malawian)
+        self.index.replace_all([user("a"), user("b", lon=33.80), user("c", lon=34.5)])
+
+    def test_orders_by_distance_within_radius(self):
+        ids, distances, by_distance = self.index.search(VIEWER, ["viewer"], 50, 10)
+        self.assertTrue(by_distance)
+        self.assertEqual(ids, ["a", "b"])
+        self.assertLess(distances[0], distances[1])
+
+    def test_resumes_after_cursor(self):
+        ids, distances, _ = self.index.search(VIEWER, ["viewer"], 50, 1)
+        ids, _, _ = self.index.search(VIEWER, ["viewer"], 50, 10, after={"id": ids[0], "d": distances[0]})
+        self.assertEqual(ids, ["b"])
+
+    def test_non_string_cursor_id_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.index.search(VIEWER, ["viewer"], 50, 10, after={"id": 5, "d": 0.0})
+        with self.assertRaises(ValueError):
+            self.index.search(VIEWER, ["viewer"], None, 10, after={"id": ["a"]})
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "NumPy not installed")
+class CandidateIndexLoadTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.users = AsyncMongoMockClient()["test"]["users"]
+        await self.users.insert_many([user(f"u{i:04d}") for i in range(1500)])
+        await self.users.insert_one(user("incomplete", profile_complete=False))
+        self.index = CandidateIndex(is_malawian, capacity=4)
+
+    async def test_load_indexes_completed_profiles(self):
+        await self.index.load(self.users)
+        self.assertEqual(len(self.index), 1500)
+        ids, _, _ = self.index.search(VIEWER, ["viewer"], None, 2)
+        self.assertEqual(ids, ["u0000", "u0001"])
+
+    async def test_changes_during_load_survive_the_swap(self):
+        load = asyncio.create_task(self.index.load(self.users))
+        await asyncio.sleep(0)
+        self.index.upsert(user("late"))
+        self.index.remove("u0000")
+        await load
+        ids, _, _ = self.index.search(VIEWER, ["viewer"], None, 2000)
+        self.assertIn("late", ids)
+        self.assertNotIn("u0000", ids)
+        self.assertEqual(len(ids), 1500)
+
+
+if __name__ == "__main__":
+    unittest.main()
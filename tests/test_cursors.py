@@ -0,0 +1,66 @@
+import unittest
+from datetime import datetime
+
+from fastapi import HTTPException
+
+from cursors import CursorCodec, validate_profile_cursor
+
+
+class CursorCodecTest(unittest.TestCase):
+    def setUp(self):
+        self.codec = CursorCodec("test-secret")
+
+    def assertRejected(self, cursor):
+        with self.assertRaises(HTTPException) as ctx:
+            self.codec.decode(cursor)
+        self.assertEqual(ctx.exception.status_code, 400)
+
+    def test_round_trip(self):
+        state = {"id": "user-1", "n": 10, "d": 3.5}
+        self.assertEqual(self.codec.decode(self.codec.encode(state)), state)
+
+    def test_rewritten_payload_is_rejected(self):
+        cursor = self.codec.encode({"id": "user-1", "n": 10})
+        forged_payload = CursorCodec("attacker").encode({"id": "user-1", "n": 0}).split(".")[0]
+        self.assertRejected(f"{forged_payload}.{cursor.split('.')[1]}")
+
+    def test_cursor_from_another_secret_is_rejected(self):
+        self.assertRejected(CursorCodec("other-secret").encode({"n": 0}))
+
+    def test_unsigned_and_garbage_cursors_are_rejected(self):
+        self.assertRejected("eyJuIjowfQ")
+        self.assertRejected("not-base64!.sig")
+        self.assertRejected("abc.éé")
+
+    def test_time_cursor_round_trip(self):
+        timestamp = datetime(2026, 1, 2, 3, 4, 5)
+        self.assertEqual(self.codec.decode_time(self.codec.encode_time(timestamp, "m-1")), (timestamp, "m-1"))
+
+    def test_time_cursor_with_non_string_id_is_rejected(self):
+        with self.assertRaises(HTTPException):
+            self.codec.decode_time(self.codec.encode({"t": "2026-01-02T03:04:05", "id": 5}))
+
+
+class ValidateProfileCursorTest(unittest.TestCase):
+    def assertInvalid(self, state):
+        with self.assertRaises(HTTPException) as ctx:
+            validate_profile_cursor(state)
+        self.assertEqual(ctx.exception.status_code, 400)
+
+    def test_valid_state(self):
+        self.assertEqual(validate_profile_cursor({"id": "u", "n": 3, "d": "1.5"}), {"id": "u", "n": 3, "d": 1.5})
+
+    def test_served_count_must_be_non_negative_integer(self):
+        self.assertInvalid({"n": -5})
+        self.assertInvalid({"n": "10"})
+        self.assertInvalid({"n": True})
+
+    def test_id_and_distance_types(self):
+        self.assertInvalid({"id": {"$gt": ""}})
+        self.assertInvalid({"d": "far"})
+        self.assertInvalid({"d": [1]})
+        self.assertInvalid({"d": float("nan")})
+
+
+if __name__ == "__main__":
+    unittest.main()
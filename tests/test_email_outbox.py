@@ -0,0 +1,56 @@
+import asyncio
+import unittest
+
+from mongomock_motor import AsyncMongoMockClient
+
+from email_outbox import SENT, EmailOutbox, MemoryTransport
+from tests.fakes import FlakyCollection
+
+
+class EmailOutboxTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.collection = AsyncMongoMockClient()["test"]["email_outbox"]
+        self.transport = MemoryTransport()
+
+    def make_outbox(self, collection):
+        return EmailOutbox(
+            collection,
+            lambda: self.transport,
+            workers=1,
+            max_attempts=3,
+            retry_base_seconds=0.01,
+            poll_interval_seconds=0.01
+        )
+
+    async def wait_for_sent(self, outbox, count):
+        for _ in range(200):
+            if outbox.stats()["sent"] >= count:
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f"expected {count} sent messages, got {outbox.stats()['sent']}")
+
+    async def run_outbox(self, outbox, *messages):
+        tasks = outbox.start()
+        try:
+            for to in messages:
+                await outbox.enqueue(to, "Subject", "<p>Hi</p>", "app@example.com")
+            await self.wait_for_sent(outbox, len(messages))
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def test_delivers_queued_messages(self):
+        outbox = self.make_outbox(self.collection)
+        await self.run_outbox(outbox, "a@example.com", "b@example.com")
+        self.assertEqual(sorted(msg["To"] for msg in self.transport.sent), ["a@example.com", "b@example.com"])
+        self.assertEqual(await self.collection.count_documents({"status": SENT}), 2)
+
+    async def test_worker_survives_database_errors(self):
+        outbox = self.make_outbox(FlakyCollection(self.collection, "find_one_and_update", failures=3))
+        await self.run_outbox(outbox, "a@example.com")
+        self.assertEqual(outbox.stats()["sent"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+import io
+import tempfile
+import unittest
+from concurrent.futures import Executor, Future
+from pathlib import Path
+from unittest import mock
+
+from mongomock_motor import AsyncMongoMockClient
+
+from image_pipeline import PHOTO_VARIANT_SIZES, PILLOW_AVAILABLE, ImagePipeline, render_variants
+
+if PILLOW_AVAILABLE:
+    from PIL import Image
+
+RED = (220, 0, 0)
+BLUE = (0, 0, 220)
+
+
+def oriented_jpeg(width=2000, height=1000):
+    """Landscape JPEG tagged "rotate 90° clockwise": red left half, blue right half as stored"""
+    image = Image.new("RGB", (width, height), BLUE)
+    image.paste(RED, (0, 0, width // 2, height))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation
+    exif[0x010F] = "Camera"  # Make
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def close_to(pixel, color, tolerance=40):
+    return all(abs(a - b) <= tolerance for a, b in zip(pixel, color))
+
+
+class InlineExecutor(Executor):
+    """Runs submitted calls immediately in the calling thread"""
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+@unittest.skipUnless(PILLOW_AVAILABLE, "Pillow not installed")
+class RenderVariantsTest(unittest.TestCase):
+    def test_writes_bounded_upright_webp_variants_without_exif(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            source = Path(tmp) / "photo.jpg"
+            source.write_bytes(oriented_jpeg())
+
+            filenames = render_variants(str(source), tmp, "photo", PHOTO_VARIANT_SIZES, 80)
+
+            self.assertEqual(filenames, {name: f"photo_{name}.webp" for name in ("full", "card", "thumb")})
+            for name, edge in PHOTO_VARIANT_SIZES.items():
+                with Image.open(Path(tmp) / filenames[name]) as variant:
+                    self.assertEqual(variant.format, "WEBP")
+                    # Rotated to portrait and bounded by the variant's longest edge
+                    self.assertEqual(variant.size, (edge // 2, edge))
+                    self.assertEqual(dict(variant.getexif()), {})
+                    rgb = variant.convert("RGB")
+                    # The stored left half ends up on top once the orientation is applied
+                    self.assertTrue(close_to(rgb.getpixel((edge // 4, edge // 8)), RED))
+                    self.assertTrue(close_to(rgb.getpixel((edge // 4, edge - edge // 8)), BLUE))
+            self.assertEqual(sorted(p.name for p in Path(tmp).iterdir()), sorted(["photo.jpg", *filenames.values()]))
+
+
+@unittest.skipUnless(PILLOW_AVAILABLE, "Pillow not installed")
+class ProcessTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.upload_dir = Path(self.tmp.name)
+        (self.upload_dir / "user-1_a.jpg").write_bytes(oriented_jpeg())
+        self.users = AsyncMongoMockClient()["test"]["users"]
+        self.updated = []
+        self.pipeline = ImagePipeline(self.upload_dir, self.users, workers=1, quality=80, on_updated=self.updated.append)
+        self.pipeline.variants_dir.mkdir()
+        executor = mock.patch.object(self.pipeline, "_executor", return_value=InlineExecutor())
+        executor.start()
+        self.addCleanup(executor.stop)
+
+    async def asyncTearDown(self):
+        self.tmp.cleanup()
+
+    async def test_records_variants_of_current_photo(self):
+        await self.users.insert_one({"id": "user-1", "main_photo": "/uploads/user-1_a.jpg"})
+
+        await self.pipeline._process("user-1", "/uploads/user-1_a.jpg")
+
+        user = await self.users.find_one({"id": "user-1"})
+        self.assertEqual(user["photo_variants"], {
+            name: f"/uploads/variants/user-1_a_{name}.webp" for name in ("full", "card", "thumb")
+        })
+        for url in user["photo_variants"].values():
+            self.assertTrue((self.pipeline.variants_dir / Path(url).name).exists())
+        self.assertEqual(self.updated, ["user-1"])
+        self.assertEqual(self.pipeline.stats()["completed"], 1)
+
+    async def test_skips_write_when_photo_was_replaced(self):
+        await self.users.insert_one({"id": "user-1", "main_photo": "/uploads/user-1_b.jpg"})
+
+        await self.pipeline._process("user-1", "/uploads/user-1_a.jpg")
+
+        user = await self.users.find_one({"id": "user-1"})
+        self.assertNotIn("photo_variants", user)
+        self.assertEqual(list(self.pipeline.variants_dir.iterdir()), [])
+        self.assertEqual(self.updated, [])
+
+
+class DiscardVariantsTest(unittest.IsolatedAsyncioTestCase):
+    async def test_removes_variant_files_of_replaced_photo(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            upload_dir = Path(tmp)
+            pipeline = ImagePipeline(upload_dir, None, workers=1, quality=80)
+            pipeline.variants_dir.mkdir()
+            old = pipeline.variants_dir / "old_card.webp"
+            kept = pipeline.variants_dir / "new_card.webp"
+            outside = upload_dir / "original.jpg"
+            for path in (old, kept, outside):
+                path.write_bytes(b"x")
+
+            await pipeline.discard({"card": "/uploads/variants/old_card.webp", "thumb": "/uploads/variants/missing.webp"})
+            # Only the file name of a stored URL is used
+            await pipeline.discard({"full": "/uploads/variants/../original.jpg"})
+
+            self.assertFalse(old.exists())
+            self.assertTrue(kept.exists())
+            self.assertTrue(outside.exists())
+
+    async def test_ignores_missing_variants(self):
+        pipeline = ImagePipeline(Path(tempfile.gettempdir()), None, workers=1, quality=80)
+        await pipeline.discard(None)
+        await pipeline.discard({})
+
+
+if __name__ == "__main__":
+    unittest.main()
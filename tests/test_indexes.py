@@ -0,0 +1,35 @@
+import unittest
+
+from mongomock_motor import AsyncMongoMockClient
+
+from indexes import _check_unique_user_fields, find_duplicates
+
+
+class UniqueUserFieldsTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.db = AsyncMongoMockClient()["test"]
+
+    async def test_reports_duplicate_emails(self):
+        await self.db.users.insert_many([
+            {"id": "a", "email": "ann@example.com"},
+            {"id": "b", "email": "ann@example.com"},
+            {"id": "c", "email": "cat@example.com"},
+        ])
+
+        self.assertEqual(await find_duplicates(self.db.users, "email"), [{"value": "ann@example.com", "count": 2}])
+        with self.assertRaises(RuntimeError) as raised:
+            await _check_unique_user_fields(self.db)
+        self.assertIn("users.email: 'ann@example.com' x2", str(raised.exception))
+        self.assertIn("python indexes.py migrate", str(raised.exception))
+
+    async def test_passes_without_duplicates(self):
+        await self.db.users.insert_many([
+            {"id": "a", "email": "ann@example.com"},
+            {"id": "b", "email": "bob@example.com"},
+        ])
+
+        await _check_unique_user_fields(self.db)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import asyncio
+import unittest
+
+import httpx
+
+from paychangu_client import CircuitBreaker, PaychanguClient, PaymentGatewayUnavailable
+
+
+class PaychanguClientTest(unittest.IsolatedAsyncioTestCase):
+    def make_client(self, handler, failure_threshold=5, reset_timeout_seconds=60, max_retries=2):
+        self.calls = []
+
+        async def record(request):
+            self.calls.append(request)
+            return await handler(request)
+
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout_seconds)
+        self.client = PaychanguClient(
+            "https://api.paychangu.test",
+            "sk-test",
+            timeout_seconds=5,
+            max_retries=max_retries,
+            retry_backoff_seconds=0,
+            breaker=self.breaker,
+            transport=httpx.MockTransport(record)
+        )
+        return self.client
+
+    async def asyncTearDown(self):
+        await self.client.aclose()
+
+    async def test_sends_credentials_and_records_latency(self):
+        async def handler(request):
+            return httpx.Response(200, json={"status": "success"})
+
+        client = self.make_client(handler)
+        response = await client.verify_payment("tx-1")
+        self.assertEqual(response.json(), {"status": "success"})
+        self.assertEqual(self.calls[0].url.path, "/verify-payment/tx-1")
+        self.assertEqual(self.calls[0].headers["Authorization"], "Bearer sk-test")
+        self.assertEqual(client.stats()["latency"]["verify_payment"]["count"], 1)
+
+    async def test_idempotent_request_is_retried_on_server_error(self):
+        responses = [httpx.Response(503), httpx.Response(502), httpx.Response(200, json={})]
+
+        async def handler(request):
+            return responses.pop(0)
+
+        response = await self.make_client(handler).verify_payment("tx-1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.calls), 3)
+        self.assertEqual(self.breaker.failures, 0)
+
+    async def test_payment_is_not_resent_after_server_error(self):
+        async def handler(request):
+            return httpx.Response(500)
+
+        response = await self.make_client(handler).initiate_payment({"amount": 100})
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(len(self.calls), 1)
+
+    async def test_payment_is_resent_when_connection_failed(self):
+        async def handler(request):
+            if len(self.calls) == 1:
+                raise httpx.ConnectError("refused", request=request)
+            return httpx.Response(201, json={})
+
+        response = await self.make_client(handler).initiate_payment({"amount": 100})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(self.calls), 2)
+
+    async def test_open_circuit_fails_fast(self):
+        async def handler(request):
+            return httpx.Response(503)
+
+        client = self.make_client(handler, failure_threshold=2, max_retries=0)
+        await client.verify_payment("tx-1")
+        await client.verify_payment("tx-2")
+        self.assertEqual(self.breaker.state, "open")
+        with self.assertRaises(PaymentGatewayUnavailable):
+            await client.verify_payment("tx-3")
+        self.assertEqual(len(self.calls), 2)
+
+    def open_circuit(self):
+        self.breaker.failures = self.breaker.failure_threshold
+        self.breaker.opened_at = 0.0
+
+    async def test_cancelled_trial_call_releases_half_open_circuit(self):
+        started = asyncio.Event()
+
+        async def handler(request):
+            if len(self.calls) == 1:
+                started.set()
+                await asyncio.sleep(60)
+            return httpx.Response(200, json={})
+
+        client = self.make_client(handler, reset_timeout_seconds=0)
+        self.open_circuit()
+        trial = asyncio.create_task(client.verify_payment("tx-1"))
+        await started.wait()
+        with self.assertRaises(PaymentGatewayUnavailable):
+            await client.verify_payment("tx-2")
+
+        trial.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await trial
+        self.assertEqual(self.breaker.state, "half_open")
+
+        response = await client.verify_payment("tx-3")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.breaker.state, "closed")
+
+    async def test_unexpected_error_releases_half_open_circuit(self):
+        async def broken(request):
+            raise RuntimeError("bug in transport")
+
+        client = self.make_client(broken, reset_timeout_seconds=0)
+        self.open_circuit()
+        with self.assertRaises(RuntimeError):
+            await client.verify_payment("tx-1")
+        self.assertFalse(self.breaker._trial_in_flight)
+        self.assertEqual(self.breaker.state, "half_open")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import AutoReconnect
+
+from payments import TRANSACTION_FAILED, TRANSACTION_SUCCESS, PaymentProcessor
+from tests.fakes import FlakyCollection
+
+
+class PaymentProcessorTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        db = AsyncMongoMockClient()["test"]
+        self.users = FlakyCollection(db["users"], "update_one")
+        self.transactions = db["transactions"]
+        self.confirmations = []
+        self.invalidated = []
+        await db["users"].insert_one({"id": "user-1", "email": "a@example.com", "name": "A", "subscription_tier": "free"})
+        await db["transactions"].insert_one({
+            "paychangu_transaction_id": "tx-1",
+            "user_id": "user-1",
+            "subscription_type": "daily",
+            "amount": 2500,
+            "status": "pending"
+        })
+
+        async def confirm(user, transaction):
+            self.confirmations.append((user["email"], transaction["subscription_type"]))
+            return True
+
+        self.processor = PaymentProcessor(self.transactions, self.users, self.invalidated.append, confirm)
+
+    async def user(self):
+        return await self.users.find_one({"id": "user-1"}, {"_id": 0})
+
+    async def transaction(self):
+        return await self.transactions.find_one({"paychangu_transaction_id": "tx-1"}, {"_id": 0})
+
+    async def assertCreditedOnce(self):
+        user = await self.user()
+        self.assertEqual(user["subscription_payments_daily"], 1)
+        self.assertEqual(user["subscription_tier"], "premium")
+        self.assertAlmostEqual(
+            (user["subscription_expires"] - datetime.utcnow()).total_seconds(),
+            timedelta(hours=24).total_seconds(),
+            delta=60
+        )
+        self.assertEqual(self.confirmations, [("a@example.com", "daily")])
+        transaction = await self.transaction()
+        self.assertEqual(transaction["status"], TRANSACTION_SUCCESS)
+        self.assertIsNotNone(transaction["subscription_applied_at"])
+        self.assertTrue(transaction["confirmation_email_sent"])
+
+    async def test_success_credits_subscription(self):
+        result = await self.processor.process_webhook({"tx_ref": "tx-1", "status": "success"})
+        self.assertEqual(result, {"status": "processed"})
+        await self.assertCreditedOnce()
+        self.assertEqual(self.invalidated, ["user-1"])
+
+    async def test_duplicate_deliveries_credit_once(self):
+        await self.processor.process_webhook({"tx_ref": "tx-1", "status": "success"})
+        result = await self.processor.process_webhook({"tx_ref": "tx-1", "status": "paid"})
+        self.assertEqual(result, {"status": "already_processed"})
+        await self.assertCreditedOnce()
+
+    async def test_concurrent_deliveries_credit_once(self):
+        await asyncio.gather(*(
+            self.processor.process_webhook({"tx_ref": "tx-1", "status": "success"}) for _ in range(5)
+        ))
+        await self.assertCreditedOnce()
+
+    async def test_failure_between_transition_and_credit_is_resumed(self):
+        self.users.failures = 1
+        with self.assertRaises(AutoReconnect):
+            await self.processor.process_webhook({"tx_ref": "tx-1", "status": "success"})
+        self.assertEqual((await self.transaction())["status"], TRANSACTION_SUCCESS)
+        self.assertNotIn("subscription_payments_daily", await self.user())
+
+        # The inbox retries the same delivery
+        result = await self.processor.process_webhook({"tx_ref": "tx-1", "status": "success"})
+        self.assertEqual(result, {"status": "processed"})
+        await self.assertCreditedOnce()
+
+    async def test_failure_after_credit_does_not_credit_twice(self):
+        # The second update of the transaction is the one marking the credit as applied
+        original = self.transactions.find_one_and_update
+        calls = []
+
+        async def fail_marking(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 2:
+                raise AutoReconnect("connection reset")
+            return await original(*args, **kwargs)
+
+        self.transactions.find_one_and_update = fail_marking
+        with self.assertRaises(AutoReconnect):
+            await self.processor.process_webhook({"tx_ref": "tx-1", "status": "success"})
+        self.assertEqual((await self.user())["subscription_payments_daily"], 1)
+
+        await self.processor.process_webhook({"tx_ref": "tx-1", "status": "success"})
+        await self.assertCreditedOnce()
+
+    async def test_extends_active_subscription(self):
+        expires = datetime.utcnow().replace(microsecond=0) + timedelta(hours=10)
+        await self.users.update_one({"id": "user-1"}, {"$set": {"subscription_expires": expires}})
+        await self.processor.process_webhook({"tx_ref": "tx-1", "status": "success"})
+        self.assertEqual((await self.user())["subscription_expires"], expires + timedelta(hours=24))
+
+    async def test_failed_payment_is_not_credited(self):
+        result = await self.processor.process_webhook({"tx_ref": "tx-1", "status": "declined"})
+        self.assertEqual(result, {"status": "processed"})
+        self.assertEqual((await self.transaction())["status"], TRANSACTION_FAILED)
+        result = await self.processor.process_webhook({"tx_ref": "tx-1", "status": "success"})
+        self.assertEqual(result, {"status": "already_processed"})
+        self.assertEqual((await self.user())["subscription_tier"], "free")
+        self.assertEqual(self.confirmations, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
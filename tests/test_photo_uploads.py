@@ -0,0 +1,136 @@
+import io
+import os
+import struct
+import tempfile
+import unittest
+import zlib
+from pathlib import Path
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.testclient import TestClient
+
+from photo_uploads import PhotoStore, UploadSizeLimitMiddleware, read_dimensions, sniff_image_type
+
+
+def png(width, height, padding=0):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", b"\0" * padding) + chunk(b"IEND", b"")
+
+
+def jpeg(width, height, exif_bytes=5000):
+    app1 = b"\xff\xe1" + struct.pack(">H", 2 + exif_bytes) + b"E" * exif_bytes
+    sof = b"\xff\xc0" + struct.pack(">HBHHB", 11, 8, height, width, 1) + b"\x01\x11\x00"
+    return b"\xff\xd8" + app1 + b"\xff\xff" + sof + b"\xff\xd9"
+
+
+def gif(width, height):
+    return b"GIF89a" + struct.pack("<HH", width, height) + b"\0" * 10
+
+
+def webp_vp8x(width, height):
+    payload = b"\0" * 4 + (width - 1).to_bytes(3, "little") + (height - 1).to_bytes(3, "little")
+    return b"RIFF" + struct.pack("<I", 4 + 8 + len(payload)) + b"WEBP" + b"VP8X" + struct.pack("<I", len(payload)) + payload
+
+
+def webp_lossless(width, height):
+    bits = (width - 1) | ((height - 1) << 14)
+    payload = b"\x2f" + bits.to_bytes(4, "little") + b"\0" * 16
+    return b"RIFF" + struct.pack("<I", 4 + 8 + len(payload)) + b"WEBP" + b"VP8L" + struct.pack("<I", len(payload)) + payload
+
+
+class ImageHeaderTest(unittest.TestCase):
+    def test_sniffs_type_from_magic_bytes(self):
+        self.assertEqual(sniff_image_type(jpeg(1, 1)), "jpeg")
+        self.assertEqual(sniff_image_type(png(1, 1)), "png")
+        self.assertEqual(sniff_image_type(gif(1, 1)), "gif")
+        self.assertEqual(sniff_image_type(webp_vp8x(1, 1)), "webp")
+        self.assertIsNone(sniff_image_type(b"MZ\x90\x00" + b"\0" * 20))
+        self.assertIsNone(sniff_image_type(b"RIFF\0\0\0\0WAVE"))
+
+    def test_reads_dimensions(self):
+        self.assertEqual(read_dimensions("jpeg", jpeg(640, 480)), (640, 480))
+        self.assertEqual(read_dimensions("png", png(3, 4)), (3, 4))
+        self.assertEqual(read_dimensions("gif", gif(300, 200)), (300, 200))
+        self.assertEqual(read_dimensions("webp", webp_vp8x(4000, 3000)), (4000, 3000))
+        self.assertEqual(read_dimensions("webp", webp_lossless(800, 600)), (800, 600))
+
+    def test_needs_more_data_before_the_frame_header(self):
+        self.assertIsNone(read_dimensions("jpeg", jpeg(640, 480)[:1000]))
+        self.assertIsNone(read_dimensions("png", png(3, 4)[:20]))
+
+    def test_rejects_corrupt_headers(self):
+        with self.assertRaises(ValueError):
+            read_dimensions("jpeg", b"\xff\xd8\x00\x00" + b"\0" * 20)
+        with self.assertRaises(ValueError):
+            read_dimensions("webp", b"RIFF\0\0\0\0WEBPXXXX" + b"\0" * 20)
+
+
+class PhotoStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = Path(self.tmp.name)
+        self.store = PhotoStore(self.dir, max_bytes=100_000, max_pixels=1_000_000, chunk_size=1024)
+
+    def assertRejected(self, data, status_code):
+        with self.assertRaises(HTTPException) as ctx:
+            self.store._store(io.BytesIO(data), "user_1")
+        self.assertEqual(ctx.exception.status_code, status_code)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_stores_with_extension_from_content(self):
+        filename = self.store._store(io.BytesIO(png(10, 10)), "user_1")
+        self.assertEqual(filename, "user_1.png")
+        self.assertEqual((self.dir / filename).read_bytes(), png(10, 10))
+        self.assertEqual(os.listdir(self.dir), ["user_1.png"])
+
+    def test_rejects_bad_uploads_without_leaving_files(self):
+        self.assertRejected(b"not an image at all", 415)
+        self.assertRejected(png(2000, 2000), 413)
+        self.assertRejected(png(10, 10, padding=200_000), 413)
+        self.assertRejected(b"\xff\xd8\xff" + b"\0" * 50, 400)
+
+
+class UploadSizeLimitMiddlewareTest(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+
+        @app.post("/upload")
+        async def upload(request: Request):
+            return {"received": len(await request.body())}
+
+        @app.post("/other")
+        async def other(request: Request):
+            return {"received": len(await request.body())}
+
+        app.add_middleware(UploadSizeLimitMiddleware, paths=["/upload"], max_bytes=1000, detail="Too large")
+        self.client = TestClient(app)
+
+    def test_small_body_passes(self):
+        response = self.client.post("/upload", content=b"x" * 1000)
+        self.assertEqual(response.json(), {"received": 1000})
+
+    def test_declared_length_over_limit_is_rejected(self):
+        response = self.client.post("/upload", content=b"x" * 1001)
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {"detail": "Too large"})
+
+    def test_chunked_body_is_cut_off_once_over_limit(self):
+        def chunks():
+            # No Content-Length: the body arrives with chunked transfer encoding
+            for _ in range(100):
+                yield b"x" * 300
+
+        response = self.client.post("/upload", content=chunks())
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.json(), {"detail": "Too large"})
+
+    def test_other_paths_are_not_limited(self):
+        response = self.client.post("/other", content=b"x" * 5000)
+        self.assertEqual(response.json(), {"received": 5000})
+
+
+if __name__ == "__main__":
+    unittest.main()
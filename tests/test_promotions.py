@@ -0,0 +1,94 @@
+import unittest
+from datetime import datetime, timedelta
+
+import pytz
+
+from promotions import DEFAULT_PROMOTIONS, PromotionCalendar, load_promotions
+
+CAT = pytz.timezone("Africa/Maputo")
+
+
+def cat(year, month, day, hour=0, minute=0, second=0):
+    return CAT.localize(datetime(year, month, day, hour, minute, second))
+
+
+# 2026-10-14 is a Wednesday, 2026-10-17 a Saturday
+TUESDAY = (2026, 10, 13)
+WEDNESDAY = (2026, 10, 14)
+THURSDAY = (2026, 10, 15)
+SATURDAY = (2026, 10, 17)
+
+
+class PromotionCalendarTest(unittest.TestCase):
+    def setUp(self):
+        self.calendar = PromotionCalendar(DEFAULT_PROMOTIONS, "Africa/Maputo")
+
+    def snapshot(self, now):
+        # A fresh calendar per moment, so results never depend on what was cached before
+        return PromotionCalendar(DEFAULT_PROMOTIONS, "Africa/Maputo").snapshot(now)
+
+    def test_wednesday_discount_covers_the_whole_day(self):
+        self.assertFalse(self.snapshot(cat(*TUESDAY, 23, 59, 59)).is_active("wednesday_discount"))
+        self.assertTrue(self.snapshot(cat(*WEDNESDAY, 0, 0)).is_active("wednesday_discount"))
+        self.assertTrue(self.snapshot(cat(*WEDNESDAY, 23, 59, 59)).is_active("wednesday_discount"))
+        self.assertFalse(self.snapshot(cat(*THURSDAY, 0, 0)).is_active("wednesday_discount"))
+
+    def test_discount_is_reported_only_while_active(self):
+        self.assertEqual(self.snapshot(cat(*WEDNESDAY, 12)).discount, (50, "Wednesday 50% Off Special!"))
+        self.assertEqual(self.snapshot(cat(*THURSDAY, 12)).discount, (0, ""))
+
+    def test_happy_hour_boundaries(self):
+        self.assertIsNone(self.snapshot(cat(*SATURDAY, 18, 59, 59)).free_interaction_promotion)
+        self.assertEqual(self.snapshot(cat(*SATURDAY, 19, 0)).free_interaction_promotion.key, "saturday_happy_hour")
+        self.assertEqual(self.snapshot(cat(*SATURDAY, 19, 59, 59)).active_until("saturday_happy_hour"), cat(*SATURDAY, 20, 0))
+        self.assertIsNone(self.snapshot(cat(*SATURDAY, 20, 0)).free_interaction_promotion)
+
+    def test_saturday_after_happy_hour_points_to_next_week(self):
+        snapshot = self.snapshot(cat(*SATURDAY, 20, 30))
+        self.assertEqual(snapshot.active_promotions, [])
+        self.assertEqual(snapshot.next_start("saturday_happy_hour"), cat(*SATURDAY, 19, 0) + timedelta(days=7))
+        self.assertEqual(snapshot.next_start("wednesday_discount"), cat(2026, 10, 21))
+
+    def test_next_start_during_a_window_is_the_following_week(self):
+        snapshot = self.snapshot(cat(*SATURDAY, 19, 30))
+        self.assertEqual(snapshot.next_start("saturday_happy_hour"), cat(2026, 10, 24, 19, 0))
+
+    def test_accepts_utc_now(self):
+        # 17:30 UTC is 19:30 CAT
+        snapshot = self.snapshot(pytz.utc.localize(datetime(*SATURDAY, 17, 30)))
+        self.assertTrue(snapshot.is_active("saturday_happy_hour"))
+
+    def test_cached_windows_are_recomputed_after_a_boundary(self):
+        self.assertTrue(self.calendar.snapshot(cat(*WEDNESDAY, 23, 59)).is_active("wednesday_discount"))
+        self.assertFalse(self.calendar.snapshot(cat(*THURSDAY, 0, 1)).is_active("wednesday_discount"))
+        self.assertTrue(self.calendar.snapshot(cat(*SATURDAY, 19, 15)).is_active("saturday_happy_hour"))
+        self.assertFalse(self.calendar.snapshot(cat(*SATURDAY, 20, 15)).is_active("saturday_happy_hour"))
+        # Clocks going backwards also force a recompute
+        self.assertTrue(self.calendar.snapshot(cat(*WEDNESDAY, 8)).is_active("wednesday_discount"))
+
+
+class LoadPromotionsTest(unittest.TestCase):
+    def test_empty_setting_keeps_defaults(self):
+        self.assertEqual(load_promotions("  "), DEFAULT_PROMOTIONS)
+
+    def test_parses_custom_promotions(self):
+        promotions = load_promotions(
+            '[{"key": "monday_free", "weekday": 0, "start": "18:30", "duration_minutes": 90, "free_interactions": true}]'
+        )
+        self.assertEqual(len(promotions), 1)
+        promotion = promotions[0]
+        self.assertEqual((promotion.key, promotion.name, promotion.weekday), ("monday_free", "monday_free", 0))
+        self.assertEqual(promotion.duration, timedelta(minutes=90))
+        self.assertTrue(promotion.free_interactions)
+
+        # 2026-10-19 is a Monday
+        snapshot = PromotionCalendar(promotions, "Africa/Maputo").snapshot(cat(2026, 10, 19, 19, 59))
+        self.assertTrue(snapshot.is_active("monday_free"))
+
+    def test_rejects_invalid_weekday(self):
+        with self.assertRaises(ValueError):
+            load_promotions('[{"key": "bad", "weekday": 7, "duration_minutes": 60}]')
+
+
+if __name__ == "__main__":
+    unittest.main()
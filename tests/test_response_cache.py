@@ -0,0 +1,69 @@
+import unittest
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from response_cache import ResponseCache, etag_matches, render_json
+
+PAYLOAD = {"tiers": [{"name": "Premium", "price": 2500.0, "label": "Kwacha – MWK"}]}
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = ResponseCache(max_entries=2)
+        self.builds = []
+        app = FastAPI()
+
+        @app.get("/tiers/{key}")
+        def tiers(key: str, request: Request):
+            def build():
+                self.builds.append(key)
+                return {**PAYLOAD, "key": key}
+            return self.cache.respond(request, key, build, max_age_seconds=300)
+
+        self.client = TestClient(app)
+
+    def test_serves_json_with_etag_and_cache_control(self):
+        response = self.client.get("/tiers/a")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {**PAYLOAD, "key": "a"})
+        self.assertEqual(response.headers["content-type"], "application/json")
+        self.assertTrue(response.headers["etag"].startswith('"'))
+        self.assertEqual(response.headers["cache-control"], "public, max-age=300")
+
+    def test_matching_if_none_match_returns_304_without_body(self):
+        etag = self.client.get("/tiers/a").headers["etag"]
+        for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+            response = self.client.get("/tiers/a", headers={"If-None-Match": header})
+            self.assertEqual(response.status_code, 304, header)
+            self.assertEqual(response.content, b"")
+            self.assertEqual(response.headers["etag"], etag)
+        self.assertEqual(self.cache.stats()["not_modified"], 4)
+
+    def test_stale_etag_gets_the_new_payload(self):
+        etag_a = self.client.get("/tiers/a").headers["etag"]
+        response = self.client.get("/tiers/b", headers={"If-None-Match": etag_a})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["etag"], etag_a)
+
+    def test_payload_is_rendered_once_per_key_and_old_keys_are_evicted(self):
+        for key in ("a", "a", "b", "a", "c", "b"):
+            self.client.get(f"/tiers/{key}")
+        # "b" was the least recently used when "c" arrived, so it is rendered again
+        self.assertEqual(self.builds, ["a", "b", "c", "b"])
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+    def test_rendered_body_matches_json_response(self):
+        self.assertEqual(render_json(PAYLOAD).body, JSONResponse(PAYLOAD).body)
+
+
+class EtagMatchesTest(unittest.TestCase):
+    def test_no_header_or_other_tags_do_not_match(self):
+        self.assertFalse(etag_matches(None, '"abc"'))
+        self.assertFalse(etag_matches("", '"abc"'))
+        self.assertFalse(etag_matches('"abd", W/"abx"', '"abc"'))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import asyncio
+import unittest
+
+from mongomock_motor import AsyncMongoMockClient
+
+from leased_queue import FAILED
+from tests.fakes import FlakyCollection
+from webhook_inbox import DONE, WebhookInbox
+
+
+class WebhookInboxTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.collection = AsyncMongoMockClient()["test"]["webhook_inbox"]
+        self.applied = []
+        self.failures = {}
+
+    def make_inbox(self, collection=None, max_attempts=3):
+        async def processor(payload):
+            if self.failures.get(payload["tx_ref"]):
+                self.failures[payload["tx_ref"]] -= 1
+                raise RuntimeError("gateway lookup failed")
+            self.applied.append((payload["tx_ref"], payload["status"]))
+            return {"status": "processed"}
+
+        return WebhookInbox(
+            collection or self.collection,
+            processor,
+            workers=3,
+            max_attempts=max_attempts,
+            retry_base_seconds=0.01,
+            poll_interval_seconds=0.01
+        )
+
+    async def drain(self, inbox, *deliveries):
+        tasks = inbox.start()
+        try:
+            for tx_ref, status in deliveries:
+                await inbox.enqueue(tx_ref, {"tx_ref": tx_ref, "status": status}, "POST")
+            for _ in range(300):
+                if (await inbox.stats())["backlog"] == 0:
+                    return
+                await asyncio.sleep(0.01)
+            self.fail("inbox was not drained")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def test_deliveries_for_one_transaction_apply_in_arrival_order(self):
+        inbox = self.make_inbox()
+        await self.drain(inbox, ("tx-1", "pending"), ("tx-1", "success"), ("tx-2", "failed"), ("tx-1", "paid"))
+        self.assertEqual([status for tx_ref, status in self.applied if tx_ref == "tx-1"], ["pending", "success", "paid"])
+        self.assertEqual(await self.collection.count_documents({"status": DONE}), 4)
+
+    async def test_failed_delivery_is_retried_then_given_up(self):
+        self.failures = {"tx-1": 1, "tx-2": 5}
+        inbox = self.make_inbox(max_attempts=2)
+        await self.drain(inbox, ("tx-1", "success"), ("tx-2", "success"))
+        self.assertEqual(self.applied, [("tx-1", "success")])
+        self.assertEqual(await self.collection.count_documents({"status": FAILED}), 1)
+        stats = await inbox.stats()
+        self.assertEqual((stats["processed"], stats["retried"], stats["failed"]), (1, 2, 1))
+
+    async def test_workers_survive_database_errors(self):
+        collection = FlakyCollection(self.collection, "find_one_and_update", failures=4)
+        inbox = self.make_inbox(collection)
+        await self.drain(inbox, ("tx-1", "success"))
+        self.assertEqual(self.applied, [("tx-1", "success")])
+        self.assertEqual(collection.failures, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()